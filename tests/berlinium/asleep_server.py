@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
+import sys
 import time
+import asyncio
 import logging
 
 from sqlalchemy import text
@@ -12,6 +14,7 @@ import set_path
 from tilde.core.settings import settings
 from tilde.core.api import API
 from tilde.berlinium import Async_Connection
+from tilde.berlinium.async_impl import pool_metrics
 
 
 logging.basicConfig(level=logging.INFO)
@@ -37,7 +40,7 @@ class SleepTester:
             current_engine.execute(text('SELECT pg_sleep(:i)'), **{'i': req})
 
         elif settings['db']['engine'] == 'sqlite':
-            conn = current_engine.raw_connection()
+            conn = db_session.connection().connection # NB the pooled connection of the session
             conn.create_function("sq_sleep", 1, time.sleep)
             c = conn.cursor()
             c.execute('SELECT sq_sleep(%s)' % req)
@@ -45,8 +48,34 @@ class SleepTester:
         result = Tilde.count(db_session)
         return result, error
 
+    @staticmethod
+    def fail(req, client_id, db_session):
+        time.sleep(float(req))
+        raise RuntimeError('Failed on purpose')
+
+    @staticmethod
+    async def nap(req, client_id, db_session):
+        try: req = float(req)
+        except: return '', 'Not a number!'
+
+        await asyncio.sleep(req) # NB no thread is occupied
+        return req, None
+
+    @staticmethod
+    def metrics(req, client_id, db_session):
+        return pool_metrics.report(), None
+
 if __name__ == "__main__":
-    Connection = Async_Connection
+    # arguments: [asyncio [timeout of nap]] [coalesce]
+    if len(sys.argv) > 1 and sys.argv[1] == 'asyncio':
+        from tilde.berlinium.asyncio_impl import Connection, install
+        install()
+        if len(sys.argv) > 2 and sys.argv[2] != 'coalesce':
+            settings['action_timeouts'] = {'nap': float(sys.argv[2])}
+    else:
+        Connection = Async_Connection
+    if sys.argv[-1] == 'coalesce':
+        Connection.Coalesced = set(['sleep', 'fail'])
     Connection.GUIProvider = SleepTester
     DuplexRouter = SockJSRouter(Connection)
     application = web.Application(DuplexRouter.urls, debug=False)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import os, sys
+import time
+import logging
+import threading
+import subprocess
+import unittest
+
+import websocket
+
+import ujson as json
+
+import set_path
+from tilde.core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+basedir = os.path.dirname(os.path.realpath(os.path.abspath(__file__)))
+
+def request(ws, act, req=''):
+    ws.send(json.dumps({'act': act, 'req': req}))
+    return json.loads(ws.recv())
+
+def run_clients(number, delay=0.05, act='sleep'):
+    '''
+    Makes the number of concurrent clients, each requesting a short DB sleep (or another act)
+    @returns sorted latencies of the successful requests
+    '''
+    latencies, ready = [], threading.Barrier(number + 1)
+
+    def client():
+        try:
+            ws = websocket.create_connection("ws://localhost:%s/websocket" % settings['webport'], timeout=60)
+            request(ws, 'login')
+        except Exception as e:
+            logger.error(e)
+            ready.abort()
+            return
+        ready.wait()
+        starttime = time.time()
+        try:
+            request(ws, act, delay) # NB empty DB gives an error of empty result, which is fine here
+        except Exception as e:
+            logger.error(e)
+        else:
+            latencies.append(time.time() - starttime)
+        ws.close()
+
+    threads = [threading.Thread(target=client) for i in range(number)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies)
+
+class Test_Pool_Load(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.daemon = subprocess.Popen([sys.executable, os.path.join(basedir, 'asleep_server.py')])
+        time.sleep(2) # wait for initialization
+
+    def test_load(self):
+        for number in [100, 500]:
+            latencies = run_clients(number)
+            self.assertEqual(len(latencies), number, "Not all the clients were served")
+            logger.info("%s concurrent clients: latency median %1.3f sc, 95%% %1.3f sc, max %1.3f sc" % (
+                number, latencies[number // 2], latencies[int(number * 0.95)], latencies[-1]
+            ))
+
+        ws = websocket.create_connection("ws://localhost:%s/websocket" % settings['webport'])
+        request(ws, 'login')
+        metrics = request(ws, 'metrics')['result']
+        ws.close()
+        logger.info("Pool metrics: %s" % metrics)
+
+        self.assertTrue(metrics['connects'] <= metrics['pool_size'], "Connections must be reused")
+        self.assertEqual(metrics['checked_out'], 0, "Connections must be returned to the pool")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.daemon.terminate()
+
+class Test_Coalesced_Load(unittest.TestCase):
+    server_args = ['coalesce']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.daemon = subprocess.Popen([sys.executable, os.path.join(basedir, 'asleep_server.py')] + cls.server_args)
+        time.sleep(2) # wait for initialization
+
+    def get_metrics(self):
+        ws = websocket.create_connection("ws://localhost:%s/websocket" % settings['webport'])
+        request(ws, 'login')
+        metrics = request(ws, 'metrics')['result']
+        ws.close()
+        return metrics
+
+    def test_load(self):
+        number = 500
+        before = self.get_metrics()
+        latencies = run_clients(number, delay=1)
+        self.assertEqual(len(latencies), number, "Not all the clients were served")
+        logger.info("%s concurrent identical requests: latency median %1.3f sc, max %1.3f sc" % (number, latencies[number // 2], latencies[-1]))
+
+        metrics = self.get_metrics()
+        logger.info("Pool metrics: %s" % metrics)
+
+        computed = metrics['requests'] - before['requests'] - number - 2 # NB the logins and metrics are not coalesced
+        self.assertEqual(computed + metrics['coalesced'] - before['coalesced'], number)
+        self.assertTrue(computed < number // 10, "Identical requests must share the computation")
+
+    def test_failure(self):
+        number = 10
+        connections = []
+        for i in range(number):
+            ws = websocket.create_connection("ws://localhost:%s/websocket" % settings['webport'], timeout=10)
+            request(ws, 'login')
+            connections.append(ws)
+        for ws in connections:
+            ws.send(json.dumps({'act': 'fail', 'req': 1}))
+        for ws in connections:
+            response = json.loads(ws.recv()) # NB raises on timeout, if the client hangs
+            self.assertTrue(response['error'] and not response['result'], "Failed action must give an error to every waiter")
+            ws.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.daemon.terminate()
+
+class Test_Asyncio_Coalesced_Load(Test_Coalesced_Load):
+    server_args = ['asyncio', 'coalesce']
+
+class Test_Asyncio_Load(unittest.TestCase):
+    timeout = 2
+
+    @classmethod
+    def setUpClass(cls):
+        cls.daemon = subprocess.Popen([sys.executable, os.path.join(basedir, 'asleep_server.py'), 'asyncio', str(cls.timeout)])
+        time.sleep(2) # wait for initialization
+
+    def test_load(self):
+        number, delay = 500, 1
+        latencies = run_clients(number, delay, act='nap')
+        self.assertEqual(len(latencies), number, "Not all the clients were served")
+        logger.info("%s concurrent coroutine clients: latency median %1.3f sc, max %1.3f sc" % (number, latencies[number // 2], latencies[-1]))
+        self.assertTrue(latencies[-1] < 2*delay, "Coroutine actions must not wait for the threads")
+
+        latencies = run_clients(100)
+        self.assertEqual(len(latencies), 100, "Not all the clients were served")
+
+    def test_timeout(self):
+        ws = websocket.create_connection("ws://localhost:%s/websocket" % settings['webport'])
+        request(ws, 'login')
+        starttime = time.time()
+        response = request(ws, 'nap', self.timeout + 3)
+        ws.close()
+        self.assertTrue(response['error'] and not response['result'], "Timed out action must give an error")
+        self.assertTrue(time.time() - starttime < self.timeout + 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.daemon.terminate()
@@ -0,0 +1,68 @@
+
+# Batched saving should give the same DB as the per-calc saving
+
+import ujson as json
+
+import tilde.core.model as model
+from tilde.core.settings import EXAMPLE_DIR
+from . import TestLayerDB, Setup_FileDB
+
+
+class Test_Bulk_Save(TestLayerDB):
+    __test_calcs_dir__ = EXAMPLE_DIR
+
+    @classmethod
+    def setUpClass(cls):
+        super(Test_Bulk_Save, cls).setUpClass(dbname=__name__.split('.')[-1], preferred_engine='sqlite')
+
+        cls.bulk_db = Setup_FileDB(dbname=__name__.split('.')[-1] + '_bulk')
+        cls.bulk_db.create()
+
+        calcs = []
+        for task in cls.engine.savvyize(cls.__test_calcs_dir__, recursive=True):
+            for calc, error in cls.engine.parse(task):
+                if error:
+                    continue
+                calc, error = cls.engine.classify(calc)
+                if error:
+                    continue
+                calcs.append(calc)
+
+        cls.results = cls.engine.save_many(calcs + calcs[:1], cls.bulk_db.session, batch_size=4)
+
+    def test_results(self):
+        errors = [error for checksum, error in self.results if error]
+        self.assertEqual(errors, ["This calculation already exists!"],
+            "Unexpected errors of the batched saving: %s" % errors)
+
+    def test_tables(self):
+        for table, order in [
+            (model.Calculation, model.Calculation.checksum),
+            (model.Energy, model.Energy.checksum),
+            (model.Spectra, model.Spectra.checksum),
+            (model.Struct_ratios, model.Struct_ratios.checksum),
+            (model.Structure, model.Structure.struct_id),
+            (model.Lattice, model.Lattice.struct_id),
+            (model.Atom, model.Atom.atom_id)
+        ]:
+            columns = [c for c in table.__table__.columns if c.name not in ('atom_id', 'pottype_id')]
+            expected = self.db.session.query(*columns).order_by(order).all()
+            obtained = self.bulk_db.session.query(*columns).order_by(order).all()
+            self.assertEqual(expected, obtained, "Table %s differs after the batched saving" % table.__tablename__)
+
+    def test_grid(self):
+        def get_grid(session):
+            grid = {}
+            for checksum, info in session.query(model.Grid.checksum, model.Grid.info).all():
+                grid[checksum] = json.loads(info)
+                del grid[checksum]['perf'] # timing
+            return grid
+        self.assertEqual(get_grid(self.db.session), get_grid(self.bulk_db.session), "Grid differs after the batched saving")
+
+    def test_tags(self):
+        get_tags = lambda session: sorted(session.query(model.tags.c.checksum, model.Topic.cid, model.Topic.topic).join(model.Topic, model.tags.c.tid == model.Topic.tid).all())
+        self.assertEqual(get_tags(self.db.session), get_tags(self.bulk_db.session), "Tags differ after the batched saving")
+
+    def test_facets(self):
+        get_facets = lambda session: sorted((cid, topic) for tid, cid, topic in self.engine.get_facets(session)[0]) + sorted(self.engine.get_facets(session)[1].items())
+        self.assertEqual(get_facets(self.db.session), get_facets(self.bulk_db.session), "Facets differ after the batched saving")
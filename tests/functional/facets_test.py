@@ -0,0 +1,50 @@
+# Facet summary should follow the data changes
+
+from sqlalchemy import func
+
+import tilde.core.model as model
+from tilde.core.settings import EXAMPLE_DIR
+from . import TestLayerDB
+
+
+class Test_Facets(TestLayerDB):
+    __test_calcs_dir__ = EXAMPLE_DIR
+
+    @classmethod
+    def setUpClass(cls):
+        super(Test_Facets, cls).setUpClass(dbname=__name__.split('.')[-1])
+
+    def get_expected(self):
+        session = self.db.session
+        topics = session.query(model.Topic.tid, model.Topic.cid, model.Topic.topic) \
+        .filter(model.Topic.tid.in_(session.query(model.tags.c.tid))) \
+        .order_by(model.Topic.topic).all()
+
+        sliders = {}
+        for entity in self.engine.hierarchy:
+            if entity.get('has_slider'):
+                cls, attr = entity['has_slider'].split('.')
+                orm_inst = getattr(getattr(model, cls), attr)
+                minimum, maximum = session.query(func.min(orm_inst), func.max(orm_inst)).one()
+                if minimum is not None:
+                    sliders[entity['cid']] = (minimum, maximum)
+        return sorted(topics), sliders
+
+    def check(self, msg):
+        topics, sliders = self.engine.get_facets(self.db.session)
+        self.assertEqual((sorted(topics), sliders), self.get_expected(), msg)
+        for tid, count in self.db.session.query(model.Topic_count.tid, model.Topic_count.count).all():
+            self.assertEqual(count, self.db.session.query(model.tags).filter(model.tags.c.tid == tid).count())
+
+    def test_facets(self):
+        self.check("Facets differ after saving")
+        self.assertTrue(self.get_expected()[1], "Sliders are expected")
+
+        gap, checksum = self.db.session.query(model.Electrons.gap, model.Electrons.checksum).order_by(model.Electrons.gap.desc()).first()
+        self.assertEqual(self.engine.purge(self.db.session, checksum), False)
+        self.check("Facets differ after purging")
+
+        self.db.session.execute(model.delete(model.Topic_count))
+        self.db.session.execute(model.delete(model.Slider_range))
+        self.db.session.commit()
+        self.check("Facets differ after rebuilding")
@@ -0,0 +1,65 @@
+
+# Cached and typed grid rows should be rendered the same as from Grid.info
+
+import os
+
+import ujson as json
+
+import tilde.core.model as model
+from tilde.core.settings import EXAMPLE_DIR
+from tilde.berlinium.grid import GridRows
+from tilde.berlinium.categs import wrap_cell
+from . import TestLayerDB
+
+
+class Test_Grid_Rows(TestLayerDB):
+    __test_calcs_dir__ = EXAMPLE_DIR
+
+    @classmethod
+    def setUpClass(cls):
+        super(Test_Grid_Rows, cls).setUpClass(dbname=__name__.split('.')[-1])
+
+        cls.engine.settings['grid_columns'] = True
+        try:
+            for task in cls.engine.savvyize(os.path.join(EXAMPLE_DIR, 'CRYSTAL')):
+                for calc, error in cls.engine.parse(task):
+                    if error:
+                        continue
+                    calc, error = cls.engine.classify(calc)
+                    if error:
+                        continue
+                    cls.engine.purge(cls.db.session, calc.get_checksum())
+                    cls.engine.save(calc, cls.db.session)
+        finally:
+            cls.engine.settings['grid_columns'] = False
+
+    def get_expected(self, cols):
+        expected = {}
+        for checksum, info in self.db.session.query(model.Grid.checksum, model.Grid.info).all():
+            data_obj = json.loads(info)
+            html_output = '<tr id="i_' + checksum + '" data-filename="' + data_obj.get('location', '').split(os.sep)[-1] + '">'
+            html_output += '<td><input type="checkbox" id="d_cb_'+ checksum + '" class="SHFT_cb"></td>'
+            for entity in self.engine.hierarchy:
+                if entity['has_column'] and entity['cid'] in cols:
+                    html_output += wrap_cell(entity, data_obj, self.engine.hierarchy_values, table_view=True)
+            expected[checksum] = html_output + '</tr>'
+        return expected
+
+    def test_rows(self):
+        typed = [i[0] for i in self.db.session.query(model.Grid_columns.checksum).all()]
+        checksums = [i[0] for i in self.db.session.query(model.Grid.checksum).all()]
+        self.assertEqual(len(typed), 3, "Typed columns are expected for the re-saved calcs")
+
+        promoted_cols = [entity['cid'] for entity in self.engine.hierarchy if entity['has_column'] and entity['source'] in model.GRID_COLUMNS]
+        all_cols = [entity['cid'] for entity in self.engine.hierarchy if entity['has_column']]
+
+        grid_rows = GridRows(self.engine.hierarchy, self.engine.hierarchy_values)
+        for cols in [promoted_cols, all_cols, promoted_cols]:
+            self.assertEqual(grid_rows.render(self.db.session, checksums, cols), self.get_expected(cols), "Rows differ for columns %s" % cols)
+        self.assertEqual(grid_rows.cache.hits, 2*len(checksums))
+
+        for checksum in checksums:
+            self.assertEqual(grid_rows.get_info(self.db.session, checksum), json.loads(self.db.session.query(model.Grid.info).filter(model.Grid.checksum == checksum).one()[0]))
+
+        self.engine.purge(self.db.session, typed[0])
+        self.assertEqual(self.db.session.query(model.Grid_columns.checksum).filter(model.Grid_columns.checksum == typed[0]).count(), 0)
@@ -0,0 +1,51 @@
+# Packed atoms storage should restore the same structures as one row per atom storage
+
+import numpy as np
+
+import tilde.core.model as model
+from tilde.core.settings import EXAMPLE_DIR
+from . import TestLayerDB, Setup_FileDB
+
+
+class Test_Packed_Atoms(TestLayerDB):
+    __test_calcs_dir__ = EXAMPLE_DIR
+
+    @classmethod
+    def setUpClass(cls):
+        super(Test_Packed_Atoms, cls).setUpClass(dbname=__name__.split('.')[-1], preferred_engine='sqlite')
+
+        cls.packed_db = Setup_FileDB(dbname=__name__.split('.')[-1] + '_packed')
+        cls.packed_db.create()
+
+        cls.engine.settings['atoms_storage'] = 'packed'
+        try:
+            for task in cls.engine.savvyize(cls.__test_calcs_dir__, recursive=True):
+                for calc, error in cls.engine.parse(task):
+                    if error:
+                        continue
+                    calc, error = cls.engine.classify(calc)
+                    if error:
+                        continue
+                    cls.engine.save(calc, cls.packed_db.session)
+        finally:
+            cls.engine.settings['atoms_storage'] = 'rows'
+
+    def test_storage(self):
+        self.assertEqual(self.packed_db.session.query(model.Atom).count(), 0, "Atoms must not be stored one per row")
+        self.assertEqual(self.packed_db.session.query(model.Packed_atoms).count(), self.packed_db.session.query(model.Structure).count())
+
+    def test_atoms(self):
+        checksums = [i[0] for i in self.db.session.query(model.Calculation.checksum).all()]
+        self.assertTrue(checksums)
+        for checksum in checksums:
+            for step in [None, 0]:
+                expected = self.engine.get_atoms(self.db.session, checksum, step)
+                obtained = self.engine.get_atoms(self.packed_db.session, checksum, step)
+                if expected is None:
+                    self.assertIsNone(obtained)
+                    continue
+                self.assertEqual(list(expected.numbers), list(obtained.numbers))
+                self.assertTrue(np.allclose(expected.positions, obtained.positions) and np.allclose(expected.cell, obtained.cell),
+                    "Packed structure of %s differs" % checksum)
+                for prop in ['charges', 'magmoms']:
+                    self.assertEqual(prop in expected.arrays, prop in obtained.arrays)
@@ -0,0 +1,30 @@
+
+# Index of the processed source files (incremental import)
+
+import os
+
+import tilde.core.model as model
+from tilde.core.settings import EXAMPLE_DIR
+from . import TestLayerDB
+
+
+class Test_Sources(TestLayerDB):
+    __test_calcs_dir__ = os.path.join(EXAMPLE_DIR, 'VASP')
+
+    @classmethod
+    def setUpClass(cls):
+        super(Test_Sources, cls).setUpClass(dbname=__name__.split('.')[-1])
+        cls.path = cls.engine.savvyize(cls.__test_calcs_dir__)[0]
+        cls.checksum = cls.db.session.query(model.Metadata.checksum).filter(model.Metadata.location == cls.path).one()[0]
+        cls.engine.index_source(cls.db.session, cls.path, os.stat(cls.path), 'XML_Output', [cls.checksum])
+
+    def test_index(self):
+        sources = self.engine.get_sources(self.db.session)
+        self.assertTrue(self.engine.is_unchanged(self.path, sources), "Indexed file must be considered unchanged")
+
+        size, mtime, parser = sources[self.path]
+        sources[self.path] = (size, mtime - 1, parser)
+        self.assertFalse(self.engine.is_unchanged(self.path, sources), "Modified file must be considered changed")
+
+        self.engine.purge(self.db.session, self.checksum)
+        self.assertFalse(self.path in self.engine.get_sources(self.db.session), "Purged calculation must be removed from the index")
@@ -0,0 +1,35 @@
+
+# Inverted tags index should follow the writes done by another process
+
+import os
+
+from tilde.core.settings import EXAMPLE_DIR
+from tilde.berlinium.tagindex import TagIndex
+from . import TestLayerDB
+
+
+class Test_Tag_Index_Sync(TestLayerDB):
+    __test_calcs_dir__ = os.path.join(EXAMPLE_DIR, 'VASP')
+
+    @classmethod
+    def setUpClass(cls):
+        super(Test_Tag_Index_Sync, cls).setUpClass(dbname=__name__.split('.')[-1])
+
+    def test_readded(self):
+        tag_index = TagIndex()
+        postings = tag_index.get(self.db.session)
+        signature = TagIndex.get_signature(self.db.session)
+        self.assertTrue(tag_index.get(self.db.session) is postings)
+
+        # NB the index is not cleared, as if the calc were re-imported by a separate entry.py run
+        task = self.engine.savvyize(self.__test_calcs_dir__, recursive=True)[0]
+        for calc, error in self.engine.parse(task):
+            self.assertFalse(error)
+            calc, error = self.engine.classify(calc)
+            self.assertFalse(error)
+            self.engine.purge(self.db.session, calc.get_checksum())
+            checksum, error = self.engine.save(calc, self.db.session)
+            self.assertFalse(error)
+
+        self.assertNotEqual(TagIndex.get_signature(self.db.session), signature, "Re-added calc must change the signature")
+        self.assertFalse(tag_index.get(self.db.session) is postings, "Index must be rebuilt")
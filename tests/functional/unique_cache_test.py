@@ -0,0 +1,51 @@
+
+# Identity cache of the unique objects
+
+import os
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import tilde.core.model as model
+from tilde.core.orm_tools import use_process_cache
+from tilde.core.settings import EXAMPLE_DIR
+from . import TestLayerDB
+
+
+class Test_Unique_Cache(TestLayerDB):
+    __test_calcs_dir__ = os.path.join(EXAMPLE_DIR, 'VASP')
+
+    @classmethod
+    def setUpClass(cls):
+        super(Test_Unique_Cache, cls).setUpClass(dbname=__name__.split('.')[-1])
+        cls.statements = []
+        event.listen(cls.db.session.get_bind(), 'before_cursor_execute', lambda conn, cursor, statement, *args: cls.statements.append(statement))
+
+    def lookup(self, session):
+        del self.statements[:]
+        topic = model.Topic.as_unique(session, cid=2, topic='Sr')
+        self.assertTrue(topic.tid, "Topic is expected to exist")
+        return len(self.statements)
+
+    def test_session_cache(self):
+        self.assertEqual(self.lookup(self.db.session), 0,
+            "The topics saved in this session must be known without queries")
+
+    def test_rollback(self):
+        session = Session(bind=self.db.session.get_bind())
+        self.lookup(session)
+        session.commit()
+        session.rollback()
+        self.assertEqual(self.lookup(session), 1, "The cache must be forgotten after rollback")
+        session.close()
+
+    def test_process_cache(self):
+        use_process_cache()
+        try:
+            first, second = Session(bind=self.db.session.get_bind()), Session(bind=self.db.session.get_bind())
+            self.assertEqual(self.lookup(first), 1)
+            first.commit()
+            self.assertEqual(self.lookup(second), 0, "The committed topics must be shared between the sessions")
+            first.close(), second.close()
+        finally:
+            use_process_cache(False)
@@ -2,8 +2,11 @@
 import os, sys
 import unittest
 
+from ase import Atoms
+
 from tilde.core.api import API
 from tilde.core.settings import BASE_DIR, EXAMPLE_DIR
+from tilde.parsers import Output
 
 
 class Test_API(unittest.TestCase):
@@ -43,3 +46,29 @@ class Test_API(unittest.TestCase):
         self.assertEqual(len(found), 2,
             "Unexpected number of files has been found in %s: %s. May be number of files has been changed since?" % (path, len(found)))
 
+
+    def test_detect(self):
+        qe_line = "     Current dimensions of program PWSCF are:\n"
+        vasp_line = '  <i name="program" type="string">vasp </i>\n'
+        self.assertEqual(self.sample.detect("header\n" + vasp_line + qe_line), 'XML_Output')
+        self.assertEqual(self.sample.detect("header\n" + qe_line + vasp_line), 'QuantumESPRESSO')
+        self.assertEqual(self.sample.detect("header\n" * (self.sample.detect_lines - 1) + vasp_line), 'XML_Output')
+        self.assertEqual(self.sample.detect("header\n" * self.sample.detect_lines + vasp_line), None,
+            "Fingerprints must be searched only in the first %s lines" % self.sample.detect_lines)
+
+    def test_trajectory(self):
+        calc = Output('dummy')
+        calc.structures = [Atoms('H') for n in range(10)]
+        calc.tresholds = [[None, None, None, None, e] for e in [-10, -10.5, -10.6, -10.61, -10.62, -10.9, -10.91, -10.92, -10.93]]
+        policies = {
+            'all':        list(range(10)),
+            'ends':       [0, 9],
+            'every:4':    [0, 4, 8, 9],
+            'energy:0.2': [0, 1, 2, 6, 9]
+        }
+        try:
+            for policy, expected in policies.items():
+                self.sample.settings['trajectory'] = policy
+                self.assertEqual(self.sample.get_trajectory(calc), expected, "Wrong steps selected by %s" % policy)
+        finally:
+            self.sample.settings['trajectory'] = 'all'
@@ -0,0 +1,47 @@
+import time
+import unittest
+
+from tilde.core.api import API
+from tilde.berlinium.cache import ResultCache
+
+
+class Test_Result_Cache(unittest.TestCase):
+    def test_lru(self):
+        cache = ResultCache(maxsize=2)
+        cache.set('a', [1])
+        cache.set('b', [2])
+        self.assertEqual(cache.get('a'), [1])
+        cache.set('c', [3])
+        self.assertEqual(cache.get('b'), None, "Least recently used item must be evicted")
+        self.assertEqual(cache.get('a'), [1])
+        self.assertEqual(cache.get('c'), [3])
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.1)
+        cache.set('a', [1])
+        self.assertEqual(cache.get('a'), [1])
+        time.sleep(0.2)
+        self.assertEqual(cache.get('a'), None, "Expired item must not be served")
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidation(self):
+        cache = ResultCache()
+        cache.set('a', [1])
+        API.write_callbacks.append(cache.clear)
+        try:
+            API()._written()
+        finally:
+            API.write_callbacks.remove(cache.clear)
+        self.assertEqual(cache.get('a'), None, "Data change must drop the cached results")
+
+    def test_maxbytes(self):
+        cache = ResultCache(maxsize=100, maxbytes=10)
+        cache.set('a', [1], size=4)
+        cache.set('b', [2], size=4)
+        self.assertEqual(cache.get('a'), [1])
+        cache.set('c', [3], size=4)
+        self.assertEqual(cache.get('b'), None, "Least recently used item must be evicted by size")
+        self.assertEqual(cache.get('a'), [1])
+        self.assertEqual(cache.get('c'), [3])
+        cache.set('c', [3], size=6)
+        self.assertEqual(cache.nbytes, 10)
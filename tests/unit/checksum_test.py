@@ -0,0 +1,89 @@
+# Checksums must stay the same as given by the former per-atom implementation
+
+import sys
+import math
+import time
+import logging
+import hashlib
+import base64
+import unittest
+
+import numpy as np
+from ase import Atoms
+from ase.data import chemical_symbols
+
+from tilde.core.api import API
+from tilde.core.settings import EXAMPLE_DIR
+from tilde.parsers import Output
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+def legacy_checksum(calc):
+    calc_checksum = hashlib.sha224()
+    struc_repr = ""
+    for ase_obj in calc.structures:
+        struc_repr += "%3.6f %3.6f %3.6f %3.6f %3.6f %3.6f %3.6f %3.6f %3.6f " % tuple(map(abs, [ase_obj.cell[0][0], ase_obj.cell[0][1], ase_obj.cell[0][2], ase_obj.cell[1][0], ase_obj.cell[1][1], ase_obj.cell[1][2], ase_obj.cell[2][0], ase_obj.cell[2][1], ase_obj.cell[2][2]]))
+
+        for atom in ase_obj:
+            struc_repr += "%s %3.6f %3.6f %3.6f " % tuple(map(abs, [chemical_symbols.index(atom.symbol), atom.x, atom.y, atom.z]))
+
+    if calc.info["energy"] is None:
+        energy = str(None)
+    else:
+        energy = str(round(calc.info['energy'], 11 - int(math.log10(math.fabs(calc.info['energy'])))))
+
+    calc_checksum.update((
+        struc_repr + "\n" +
+        energy + "\n" +
+        calc.info['prog'] + "\n" +
+        str(calc.info['input']) + "\n" +
+        str(sum([2**x for x in calc.info['calctypes']]))
+    ).encode('ascii'))
+
+    result = base64.b32encode(calc_checksum.digest()).decode('ascii')
+    result = result[:result.index('=')] + 'CI'
+    return result
+
+def get_trajectory(nsteps, natoms):
+    calc = Output('dummy')
+    calc.info['energy'] = -1234.56789
+    rnd = np.random.RandomState(0)
+    for n in range(nsteps):
+        cell = rnd.uniform(-10, 10, (3, 3))
+        cell[0][1] = -0.0 # minus zero
+        positions = rnd.uniform(-10, 10, (natoms, 3))
+        positions[0] = [-1E-9, 0.0, -0.0000004]
+        calc.structures.append(Atoms(numbers=rnd.randint(1, 100, natoms), cell=cell, positions=positions))
+    return calc
+
+class Test_Checksum(unittest.TestCase):
+    def test_examples(self):
+        work = API()
+        count = 0
+        for task in work.savvyize(EXAMPLE_DIR, recursive=True):
+            for calc, error in work.parse(task):
+                if error:
+                    continue
+                calc, error = work.classify(calc)
+                if error:
+                    continue
+                self.assertEqual(calc.get_checksum(), legacy_checksum(calc), "Checksum of %s has changed" % task)
+                count += 1
+        self.assertTrue(count)
+
+    def test_trajectory(self):
+        calc = get_trajectory(300, 200)
+
+        starttime = time.time()
+        expected = legacy_checksum(calc)
+        legacy_duration = time.time() - starttime
+
+        starttime = time.time()
+        obtained = calc.get_checksum()
+        duration = time.time() - starttime
+
+        logger.info("Checksum of 300 x 200 atoms: %1.3f sc against former %1.3f sc" % (duration, legacy_duration))
+        self.assertEqual(obtained, expected)
@@ -0,0 +1,64 @@
+
+# Vectorised DOS smearing should give the same output as the former loop over omegas
+
+import unittest
+
+import numpy as np
+
+from tilde.berlinium.dos import TotalDos, PartialDos
+
+
+def loop_total_dos(tdos):
+    omega, dos = tdos.omega_min, []
+    while omega < tdos.omega_max + tdos.omega_pitch/10:
+        dos.append([round(omega, 3), round(np.sum(tdos.smearing_function.calc(tdos.eigenvalues - omega)), 3)])
+        omega += tdos.omega_pitch
+    return dos
+
+def loop_impact(pdos, omega):
+    if omega in pdos.eigenvalues:
+        return pdos.impacts[np.where(pdos.eigenvalues == omega)[0][0]]
+    if omega < pdos.eigenvalues[0]:
+        return np.zeros(len(pdos.impacts[0]))
+    elif omega > pdos.eigenvalues[-1]:
+        return pdos.impacts[-1]
+    for n in range(len(pdos.eigenvalues)):
+        if pdos.eigenvalues[n] < omega < pdos.eigenvalues[n+1]:
+            return (omega - pdos.eigenvalues[n])*(pdos.impacts[n+1] - pdos.impacts[n])/(pdos.eigenvalues[n+1] - pdos.eigenvalues[n]) + pdos.impacts[n]
+
+
+class Test_Dos(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(0)
+        cls.eigenvalues = np.sort(np.random.uniform(-10, 10, 500))
+        cls.impacts = np.random.uniform(0, 1, (500, 4))
+
+    def assertClose(self, obtained, expected, atol=0.0015):
+        self.assertEqual(len(obtained), len(expected))
+        self.assertTrue(np.allclose(np.array(obtained), np.array(expected), rtol=0, atol=atol))
+
+    def test_total(self):
+        for smearing in ['Normal', 'Cauchy']:
+            tdos = TotalDos(self.eigenvalues, sigma=0.1)
+            tdos.set_smearing_function(smearing)
+            tdos.max_cells = 1000 # several blocks
+            self.assertClose(tdos.calculate(), loop_total_dos(tdos))
+
+    def test_fft(self):
+        tdos = TotalDos(self.eigenvalues, sigma=0.5)
+        tdos.set_draw_area(omega_pitch=0.01)
+        expected = np.array(tdos.calculate())
+        obtained = np.array(tdos.calculate(fft=True))
+        self.assertTrue(np.allclose(obtained[:,0], expected[:,0]))
+        self.assertTrue(np.abs(obtained[:,1] - expected[:,1]).max() < 0.01 * expected[:,1].max(), "FFT convolution is too far off")
+
+    def test_partial(self):
+        pdos = PartialDos(self.eigenvalues, self.impacts, sigma=0.1)
+        omegas = np.concatenate([pdos.get_omegas(), self.eigenvalues[::50]])
+        self.assertClose(pdos.get_partial_dos_impacts(omegas), [loop_impact(pdos, omega) for omega in omegas], atol=1E-12)
+
+        types, labels = [[1, 3], [2], [4]], {'O': 0, 'Si': 1, 'H': 2}
+        plots = pdos.calculate(types, labels)
+        self.assertEqual([plot['label'] for plot in plots], ['O', 'Si', 'H'])
+        self.assertClose(plots[0]['data'], [[omega, round((impacts[0] + impacts[2]) * dos, 3)] for (omega, dos), impacts in zip(loop_total_dos(pdos), [loop_impact(pdos, omega) for omega in pdos.get_omegas()])], atol=0.003)
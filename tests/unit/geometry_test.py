@@ -0,0 +1,41 @@
+
+# Array routines over the structures should agree with the per-atom loops
+
+import math
+import unittest
+
+import numpy as np
+from ase.build import fcc111, add_adsorbate
+from ase.data import chemical_symbols, covalent_radii
+
+from tilde.core.constants import Perovskite_Structure
+from tilde.core.geometry import get_atoms_volume, get_projection, get_layers, get_goldschmidt_factors
+
+
+class Test_Geometry(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.slab = fcc111('Pt', size=(2, 2, 4), vacuum=10)
+        add_adsorbate(cls.slab, 'O', 1.5, 'ontop')
+        add_adsorbate(cls.slab, 'X', 3, 'ontop')
+
+    def test_volume(self):
+        expected = sum(4/3 * math.pi * (covalent_radii[chemical_symbols.index(atom.symbol)] + 0.1) ** 3 for atom in self.slab)
+        self.assertAlmostEqual(get_atoms_volume(self.slab, 0.1), expected)
+
+    def test_layers(self):
+        symbols, z_coords = get_projection(self.slab, 2)
+        self.assertEqual(symbols, ['Pt'] * 16 + ['O'])
+        self.assertTrue((np.diff(z_coords) >= 0).all())
+        self.assertEqual(get_layers(z_coords, 0.7).tolist(), [0] * 4 + [1] * 4 + [2] * 4 + [3] * 4 + [4])
+        self.assertEqual(get_layers(np.array([]), 0.7).tolist(), [])
+
+    def test_goldschmidt(self):
+        A_site, B_site, C_site = ['Sr', 'Ba'], ['Ti', 'Zr'], ['O']
+        factors = get_goldschmidt_factors(A_site, B_site, C_site)
+        for i, A in enumerate(A_site):
+            for j, B in enumerate(B_site):
+                rA, rB, rC = [covalent_radii[chemical_symbols.index(e)] for e in (A, B, 'O')]
+                self.assertAlmostEqual(factors[i, j, 0], (rA + rC) / (math.sqrt(2) * (rB + rC)))
+        self.assertTrue(np.allclose(get_goldschmidt_factors(['Sr', 'Si'], ['Ti'], ['O'])[0], factors[0, :1]), "Elements beyond the perovskite sites are allowed")
+        self.assertEqual(get_goldschmidt_factors(Perovskite_Structure.A, Perovskite_Structure.B, Perovskite_Structure.C).shape, (36, 30, 6))
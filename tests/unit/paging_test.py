@@ -0,0 +1,71 @@
+
+# Keyset pagination should give the same pages as OFFSET/LIMIT
+
+import random
+import unittest
+
+from sqlalchemy import create_engine, MetaData, Table, Column, String
+from sqlalchemy.dialects import postgresql
+
+from tilde.berlinium.paging import encode_cursor, decode_cursor, seek_order, seek_clause, split_parts
+from tilde.berlinium.impl import iterate_parts
+
+
+class Test_Paging(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        random.seed(0)
+        cls.engine = create_engine('sqlite://')
+        metadata = MetaData()
+        cls.table = Table('metadata', metadata, Column('checksum', String, primary_key=True), Column('chemical_formula', String))
+        metadata.create_all(cls.engine)
+        cls.engine.execute(cls.table.insert(), [
+            {'checksum': '%032x' % random.getrandbits(128), 'chemical_formula': random.choice([None, 'H2O', 'NaCl', 'SiO2'])} for n in range(100)
+        ])
+
+    def test_cursor(self):
+        for value in [None, 'H2O', 1.5]:
+            self.assertEqual(decode_cursor(encode_cursor(value, 'A' * 32, 10)), (value, 'A' * 32, 10))
+        for cursor in ['', '!', encode_cursor('H2O', 1, 10), encode_cursor('H2O', 'A' * 32, -1)]:
+            self.assertRaises(ValueError, decode_cursor, cursor)
+
+    def get_pages(self, sortby, tiebreaker, colnum):
+        query = self.table.select().order_by(*seek_order(sortby, tiebreaker))
+        obtained, cursor = [], None
+        while True:
+            page_query = query
+            if cursor:
+                value, checksum, _ = decode_cursor(cursor)
+                page_query = query.where(seek_clause(sortby, tiebreaker, value, checksum))
+            page = self.engine.execute(page_query.limit(colnum)).fetchall()
+            if not page:
+                break
+            obtained.append(page)
+            cursor = encode_cursor(page[-1][sortby.name], page[-1].checksum, len(obtained) * colnum)
+        return obtained
+
+    def test_pages(self):
+        sortby, tiebreaker, colnum = self.table.c.chemical_formula, self.table.c.checksum, 7
+        query = self.table.select().order_by(sortby, tiebreaker)
+        expected = [self.engine.execute(query.offset(start).limit(colnum)).fetchall() for start in range(0, 100, colnum)]
+
+        self.assertEqual(self.get_pages(sortby, tiebreaker, colnum), expected, "Keyset pages differ from the offset ones")
+
+    def test_nulls(self):
+        sortby, tiebreaker, colnum = self.table.c.chemical_formula, self.table.c.checksum, 3
+        order = str(self.table.select().order_by(*seek_order(sortby, tiebreaker)).compile(dialect=postgresql.dialect()))
+        self.assertTrue('chemical_formula NULLS FIRST' in order, "NULLs must go first in any DB")
+
+        rows = self.engine.execute(self.table.select()).fetchall()
+        nulls = sorted(row.checksum for row in rows if row.chemical_formula is None)
+        self.assertTrue(0 < len(nulls) < len(rows))
+
+        obtained = [row.checksum for page in self.get_pages(sortby, tiebreaker, colnum) for row in page]
+        self.assertEqual(obtained[:len(nulls)], nulls, "NULL sort keys are paged first")
+        self.assertEqual(sorted(obtained), sorted(row.checksum for row in rows), "Rows are repeated or skipped")
+
+    def test_parts(self):
+        self.assertEqual(split_parts(list(range(5)), 2), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(iterate_parts(({'html': ''}, None))), [({'html': ''}, None, None)])
+        self.assertEqual(list(iterate_parts((n, None) for n in range(3))), [(0, None, (0, False)), (1, None, (1, False)), (2, None, (2, True))])
+        self.assertEqual(list(iterate_parts(item for item in [])), [(None, None, None)])
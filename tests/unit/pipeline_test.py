@@ -0,0 +1,49 @@
+
+# Classifiers should be staged by their declared info keys and skipped if not applicable
+
+import unittest
+
+from tilde.core.api import API
+from tilde.core.pipeline import ClassifierPipeline
+
+
+class Calc:
+    def __init__(self):
+        self.info = {'log': [], 'elements': ['Si']}
+        self.timings = {}
+
+def make_classifier(name, order, reads, writes, applies=None):
+    def classify(calc):
+        calc.info['log'].append(name)
+        return calc
+    return {'class': name, 'order': order, 'reads': reads, 'writes': writes, 'classify': classify, 'applies': applies}
+
+
+class Test_Pipeline(unittest.TestCase):
+    def test_stages(self):
+        pipeline = ClassifierPipeline([
+            make_classifier('tags', 2, ['elements'], ['tags', 'log']),
+            make_classifier('dims', 1, [], ['periodicity', 'log*']),
+            make_classifier('skipped', 3, ['periodicity'], ['bs*'], applies=lambda calc: False),
+            make_classifier('legacy', 4, None, None),
+            make_classifier('free', 5, [], [])
+        ])
+        self.assertEqual([[c['class'] for c in stage] for stage in pipeline.stages], [['dims'], ['tags', 'skipped'], ['legacy'], ['free']], "Undeclared classifier must separate the rest")
+        self.assertEqual(pipeline.requires['legacy'], ['dims', 'tags', 'skipped'], "Undeclared classifier must follow all the preceding")
+
+        calc, error = pipeline.run(Calc())
+        self.assertEqual(error, None)
+        self.assertEqual(calc.info['log'], ['dims', 'tags', 'legacy', 'free'])
+        self.assertEqual(sorted(calc.timings), ['classify.dims', 'classify.free', 'classify.legacy', 'classify.tags'])
+
+    def test_error(self):
+        def fail(calc):
+            raise RuntimeError('Unknown xc type')
+        calc, error = ClassifierPipeline([dict(make_classifier('failing', 1, [], []), classify=fail)]).run(Calc())
+        self.assertEqual(calc, None)
+        self.assertTrue('Unknown xc type' in error)
+
+    def test_declarations(self):
+        work = API()
+        for classifier in work.Classifiers:
+            self.assertTrue(isinstance(classifier['reads'], list) and isinstance(classifier['writes'], list), "Classifier %s must declare its info keys" % classifier['class'])
@@ -0,0 +1,27 @@
+
+import unittest
+
+from tilde.core.api import API
+from tilde.core.pool import scan
+from tilde.core.settings import EXAMPLE_DIR
+
+
+class Test_Pool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.work = API()
+        cls.tasks = cls.work.savvyize(EXAMPLE_DIR, recursive=True)
+
+    def get_checksums(self, processes):
+        found = []
+        for task, results in scan(self.work, self.tasks, processes=processes):
+            for calc, error in results:
+                if not error:
+                    found.append((task, calc.get_checksum()))
+        return found
+
+    def test_serial_vs_pool(self):
+        serial = self.get_checksums(1)
+        self.assertTrue(serial, "No calculations were found in %s" % EXAMPLE_DIR)
+        self.assertEqual(serial, self.get_checksums(2),
+            "Parallel parsing produced different results or order of results!")
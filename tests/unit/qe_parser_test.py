@@ -0,0 +1,70 @@
+
+# Parity and memory footprint of the streaming QuantumESPRESSO parser
+
+import os, sys
+import time
+import logging
+import tempfile
+import tracemalloc
+import unittest
+
+import ujson as json
+
+from tilde.core.settings import EXAMPLE_DIR
+from tilde.parsers.QuantumESPRESSO.QuantumESPRESSO import QuantumESPRESSO
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+class Test_QE_Parser(unittest.TestCase):
+    path = os.path.join(EXAMPLE_DIR, 'QuantumESPRESSO', 'STO.out')
+
+    def test_parity(self):
+        # reference is taken from the former parser reading the whole file
+        with open(self.path + '.ref.json') as f:
+            ref = json.load(f)
+
+        calc = QuantumESPRESSO(self.path)
+        info = dict((k, v) for k, v in calc.info.items() if k not in ('perf', 'location'))
+        self.assertEqual(json.loads(json.dumps(info)), ref['info'])
+
+        structures = [{'symbols': s.get_chemical_symbols(), 'cell': s.cell.tolist(), 'positions': s.positions.tolist()} for s in calc.structures]
+        self.assertEqual(structures, ref['structures'])
+        self.assertEqual(calc.electrons['bands'].todict(), ref['bands'])
+
+    def measure(self, path):
+        tracemalloc.start()
+        starttime = time.time()
+        QuantumESPRESSO(path)
+        duration = time.time() - starttime
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak, duration
+
+    def test_memory(self):
+        with open(self.path) as f:
+            lines = f.readlines()
+        # repeat the first SCF cycle, which has no effect on the results
+        start = [n for n, line in enumerate(lines) if 'iteration #' in line][0]
+        end = [n for n, line in enumerate(lines) if 'End of self-consistent calculation' in line][0]
+        lines = lines[:end] + lines[start:end] * 400 + lines[end:]
+
+        tmpdir = tempfile.mkdtemp()
+        big_path = os.path.join(tmpdir, 'STO.out')
+        with open(big_path, 'w') as f:
+            f.writelines(lines)
+
+        self.measure(self.path) # warm-up
+        small_peak, small_duration = self.measure(self.path)
+        big_peak, big_duration = self.measure(big_path)
+        logger.info("QE parser: %s bytes peak, %1.3f sc for %s bytes; %s bytes peak, %1.3f sc for %s bytes" % (
+            small_peak, small_duration, os.path.getsize(self.path), big_peak, big_duration, os.path.getsize(big_path)
+        ))
+        self.assertTrue(os.path.getsize(self.path) * 5 < os.path.getsize(big_path))
+        os.unlink(big_path)
+        os.rmdir(tmpdir)
+
+        self.assertTrue(big_peak < small_peak * 1.5,
+            "Peak memory of parsing must not depend on the file size: %s bytes against %s bytes" % (big_peak, small_peak))
@@ -0,0 +1,67 @@
+# API startup from the cached snapshot of hierarchy and plugins
+
+import os, sys
+import shutil
+import logging
+import tempfile
+import subprocess
+import unittest
+
+import ujson as json
+
+from tilde.core.api import API
+from tilde.core.settings import ROOT_DIR
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+STARTUP_SCRIPT = '''
+import sys, time
+import ujson as json
+import tilde.core.registry
+tilde.core.registry.REGISTRY_PATH = sys.argv[1]
+from tilde.core.api import API
+from tilde.core.settings import settings, connect_database
+import tilde.core.model as model
+settings['db']['engine'], settings['db']['default_sqlite_db'] = 'sqlite', sys.argv[2]
+starttime = time.time()
+work = API()
+duration = time.time() - starttime
+imported = [name for name in sys.modules if name.startswith('tilde.parsers.') or name.startswith('tilde.classifiers.')]
+session = connect_database(settings, default_actions=False)
+print(json.dumps({'duration': duration, 'imported': imported, 'hierarchy_values': session.query(model.Hierarchy_value).count()}))
+'''
+
+class Test_Registry(unittest.TestCase):
+    def startup(self, registry_path, db_path):
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(ROOT_DIR))
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT, registry_path, db_path], env=env, cwd=os.path.dirname(ROOT_DIR))
+        return json.loads(output.decode('utf-8').splitlines()[-1])
+
+    def test_snapshot(self):
+        work = API()
+        snapshot = work._discover()
+        self.assertEqual(list(work.Parsers.keys()), [parser['name'] for parser in snapshot['parsers']])
+        self.assertEqual([C_obj['class'] for C_obj in work.Classifiers], [classifier['class'] for classifier in snapshot['classifiers']])
+        self.assertEqual(sorted(work.Apps.keys()), sorted(app['name'] for app in snapshot['apps']))
+        self.assertEqual(work.hierarchy_values, snapshot['hierarchy_values'])
+        self.assertEqual([entity['cid'] for entity in work.hierarchy if entity['cid'] < 2000], [entity['cid'] for entity in sorted(snapshot['hierarchy'], key=lambda x: x['sort'])])
+
+    def test_startup(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            registry_path, db_path = os.path.join(tmpdir, 'registry.json'), os.path.join(tmpdir, 'test.db')
+            cold = self.startup(registry_path, db_path)
+            self.assertTrue(os.path.exists(registry_path))
+            self.assertTrue(cold['imported'], "Plugins must be imported while the snapshot is taken")
+
+            os.unlink(db_path) # NB the new DB at the same URL
+            warm = self.startup(registry_path, db_path)
+            logger.info("API startup: %1.3f sc from the snapshot against %1.3f sc without it" % (warm['duration'], cold['duration']))
+
+            self.assertEqual(warm['imported'], [], "Plugins must be imported lazily")
+            self.assertEqual(warm['hierarchy_values'], cold['hierarchy_values'], "New DB must be initialized also from the snapshot")
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,39 @@
+
+# Batched band interpolation should give the same curves as the spline per band
+
+import unittest
+
+import numpy as np
+
+from tilde.berlinium.cubicspline import NaturalCubicSpline, NaturalCubicSplines
+from tilde.berlinium.plotter import bdplotter
+
+
+class Test_Splines(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(0)
+
+    def test_splines(self):
+        x = np.cumsum(np.random.uniform(0.1, 1, 30))
+        y = np.random.randn(30, 5)
+        xnew = np.linspace(x[0] - 1, x[-1] + 1, 500) # with extrapolation
+        expected = np.array([NaturalCubicSpline(x, y[:,n])(xnew) for n in range(5)]).transpose()
+        self.assertTrue(np.allclose(NaturalCubicSplines(x, y)(xnew), expected, rtol=0, atol=1E-12))
+
+    def test_bands(self):
+        nkpoints, nbands = 200, 50
+        order = ['%s 0 1/2' % k for k in range(nkpoints)]
+        values = dict((bz, np.sort(np.random.randn(nbands)).tolist()) for bz in order)
+        results = bdplotter('bands', values=values, order=order, xyz_matrix=np.eye(3))
+
+        self.assertEqual(len(results), nbands)
+        ticks = results[0]['ticks']
+        self.assertEqual([tick[1] for tick in ticks], [bz.replace(' ', '') for bz in order[::20]], "The k-points are expected to be reduced")
+        self.assertEqual([tick[0] for tick in ticks[:2]], [np.linalg.norm([0, 0, 0.5]), np.linalg.norm([0, 0, 0.5]) + np.linalg.norm([20, 0, 1])])
+
+        x = np.array([tick[0] for tick in ticks])
+        for n in [0, nbands - 1]:
+            f = NaturalCubicSpline(x, np.array([values[bz][n] for bz in order[::20]]))
+            data = np.array(results[n]['data'])
+            self.assertTrue(np.allclose(f(data[:,0]), data[:,1], rtol=0, atol=0.05))
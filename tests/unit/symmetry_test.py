@@ -0,0 +1,78 @@
+
+# Recurring structures should get the same symmetry without calling spglib
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import spglib as spg
+from ase.build import bulk
+
+from tilde.core.symmetry import SymmetryCache, SymmetryFinder
+
+
+class Test_Symmetry_Cache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_cache(self):
+        cache = SymmetryCache(maxsize=2)
+        structures = [bulk('NaCl', 'rocksalt', a=5.64), bulk('Si', 'diamond', a=5.43), bulk('Cu', 'fcc', a=3.6)]
+
+        for atoms in structures + structures[-1:]:
+            self.assertEqual(cache.call('get_spacegroup', atoms, 1e-04, -1), spg.get_spacegroup(atoms, symprec=1e-04))
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertEqual(len(cache.items), 2, "Least recently used result must be evicted")
+
+        self.assertNotEqual(cache.get_key('get_spacegroup', structures[0], 1e-04, -1), cache.get_key('get_spacegroup', structures[0], 1e-03, -1))
+        self.assertNotEqual(cache.get_key('get_spacegroup', structures[0], 1e-04, -1), cache.get_key('refine_cell', structures[0], 1e-04, -1))
+
+        shifted = structures[0].copy()
+        shifted.positions[0, 0] += 0.1
+        self.assertNotEqual(cache.get_key('get_spacegroup', shifted, 1e-04, -1), cache.get_key('get_spacegroup', structures[0], 1e-04, -1))
+
+    def test_persistence(self):
+        path = os.path.join(self.tmpdir, 'symmetry.db')
+        atoms = bulk('NaCl', 'rocksalt', a=5.64)
+
+        cache = SymmetryCache(path=path)
+        lattice, positions, numbers = cache.call('refine_cell', atoms, 1e-04, -1)
+        cache.close()
+
+        cache = SymmetryCache(path=path)
+        cached = cache.call('refine_cell', atoms, 1e-04, -1)
+        self.assertEqual(cache.hits, 1, "Result must be read from disk")
+        self.assertEqual(cached[2].tolist(), numbers.tolist())
+        cache.close()
+
+    def test_finder(self):
+        atoms = bulk('Si', 'diamond', a=5.43)
+        for n in range(2):
+            finder = SymmetryFinder()
+            finder.get_spacegroup({'structures': [atoms]})
+            self.assertEqual((finder.sg, finder.ng, finder.error), ('Fd-3m', 227, None))
+        self.assertGreaterEqual(SymmetryFinder.cache.hits, 1)
+
+    def test_dataset(self):
+        atoms = bulk('NaCl', 'rocksalt', a=5.64)
+        finder = SymmetryFinder()
+        finder.get_spacegroup({'structures': [atoms]})
+        finder.refine_cell({'structures': [atoms]})
+
+        lattice, positions, numbers = spg.refine_cell(atoms, symprec=finder.accuracy, angle_tolerance=finder.angle_tolerance)
+        self.assertEqual((finder.dataset['number'], finder.dataset['hall'], finder.dataset['pointgroup']), (225, '-F 4 2 3', 'm-3m'))
+        self.assertTrue(np.allclose(finder.refinedcell.cell[:], lattice))
+        self.assertEqual(finder.refinedcell.get_atomic_numbers().tolist(), numbers.tolist())
+
+        calls = SymmetryFinder.cache.hits + SymmetryFinder.cache.misses
+        given = SymmetryFinder(dataset=finder.dataset)
+        given.refine_cell({'structures': [atoms]})
+        self.assertEqual(SymmetryFinder.cache.hits + SymmetryFinder.cache.misses, calls, "Given dataset must not be found again")
+        self.assertTrue(np.allclose(given.refinedcell.cell[:], finder.refinedcell.cell[:]))
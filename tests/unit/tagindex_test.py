@@ -0,0 +1,96 @@
+
+# Inverted tags index should give the same as the N-way self-joins, but faster
+
+import os
+import time
+import random
+import sqlite3
+import logging
+import unittest
+
+import numpy as np
+
+from tilde.berlinium.tagindex import Postings
+
+
+logger = logging.getLogger(__name__)
+
+def get_selfjoin_results(cursor, tids):
+    query = 'SELECT DISTINCT t1.tid FROM tags t1 INNER JOIN tags t2 ON t1.checksum = t2.checksum AND t2.tid = ?'
+    for n in range(2, len(tids) + 1):
+        query += ' INNER JOIN tags t%s ON t%s.checksum = t%s.checksum AND t%s.tid = ?' % ((n+1), n, (n+1), (n+1))
+    return sorted(item for item, in cursor.execute(query, tids).fetchall())
+
+def get_tags_table(checksums, rows, tids):
+    db = sqlite3.connect(':memory:')
+    cursor = db.cursor()
+    cursor.execute('CREATE TABLE tags (checksum VARCHAR, tid INTEGER, CONSTRAINT u_checksum_tid UNIQUE (checksum, tid))')
+    cursor.execute('CREATE INDEX checksum_to_tid ON tags (checksum, tid)')
+    cursor.executemany('INSERT INTO tags VALUES (?, ?)', ((checksums[row], int(tid)) for row, tid in zip(rows, tids)))
+    return cursor
+
+def get_synthetic_tags(ncalcs, seed=0):
+    '''
+    Every calc has a tag from each of the facets of different selectivity
+    '''
+    rng = np.random.RandomState(seed)
+    rows, tids = [], []
+    for offset, ntopics in [(0, 2), (10, 5), (100, 20), (1000, 100), (10000, 1000)]:
+        rows.append(np.arange(ncalcs))
+        tids.append(offset + rng.randint(0, ntopics, ncalcs))
+    return np.concatenate(rows), np.concatenate(tids)
+
+
+class Test_Tag_Index(unittest.TestCase):
+    def test_small(self):
+        random.seed(0)
+        checksums = ['%032x' % random.getrandbits(128) for n in range(200)]
+        formulae = [random.choice([None, 'H2O', 'NaCl', 'SiO2', 'C']) for n in range(200)]
+        pairs = set((random.randrange(200), random.randrange(30)) for n in range(2000))
+        rows, tids = zip(*pairs)
+        postings = Postings(rows, tids, checksums, {'chemical_formula': formulae})
+
+        for n in range(50):
+            selected = random.sample(range(32), random.randint(1, 3))
+            matched = [row for row in range(200) if all((row, tid) in pairs for tid in selected)]
+
+            self.assertEqual(postings.intersect(selected).tolist(), matched)
+            self.assertEqual(postings.cooccurring(selected), sorted(set(tid for row, tid in pairs if row in matched)))
+            self.assertEqual(
+                postings.get_checksums(postings.intersect(selected), 'chemical_formula'),
+                [checksums[row] for row in sorted(matched, key=lambda row: (formulae[row] is not None, formulae[row] or '', checksums[row]))]
+            )
+
+    def test_selfjoins(self):
+        ncalcs = 2000
+        rows, tids = get_synthetic_tags(ncalcs)
+        checksums = ['%032x' % n for n in range(ncalcs)]
+        postings = Postings(rows, tids, checksums)
+        cursor = get_tags_table(checksums, rows, tids)
+
+        for selected in [[1], [1, 12], [1, 12, 105], [1, 12, 105, 1010]]:
+            self.assertEqual(postings.cooccurring(selected), get_selfjoin_results(cursor, selected), "Index differs from self-joins for %s" % selected)
+
+    @unittest.skipUnless(os.environ.get('TILDE_BENCHMARK'), "set TILDE_BENCHMARK to run")
+    def test_benchmark(self):
+        ncalcs = 1000000
+        rows, tids = get_synthetic_tags(ncalcs)
+        checksums = ['%032x' % n for n in range(ncalcs)]
+
+        tick = time.time()
+        postings = Postings(rows, tids, checksums)
+        logger.warning("Index of %s calcs built in %1.2f sc" % (ncalcs, time.time() - tick))
+
+        cursor = get_tags_table(checksums, rows, tids)
+
+        for selected in [[1], [1, 12], [1, 12, 105], [1, 12, 105, 1010]]:
+            tick = time.time()
+            expected = get_selfjoin_results(cursor, selected)
+            selfjoin_time = time.time() - tick
+
+            tick = time.time()
+            obtained = postings.cooccurring(selected)
+            index_time = time.time() - tick
+
+            self.assertEqual(obtained, expected, "Index differs from self-joins for %s" % selected)
+            logger.warning("Tags %s: self-joins %1.3f sc, index %1.3f sc" % (selected, selfjoin_time, index_time))
@@ -0,0 +1,88 @@
+
+# Per-stage timings should be collected for every file and reported
+
+import os
+import copy
+import shutil
+import tempfile
+import unittest
+
+import ujson as json
+from sqlalchemy import create_engine
+
+from tilde.core.api import API
+from tilde.core.pool import scan
+from tilde.core.settings import EXAMPLE_DIR
+from tilde.core.timing import TimingsReport, sql_timer, get_total, get_profile_path, profile_task
+
+
+class Test_Timings(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.work = API()
+        cls.tasks = cls.work.savvyize(EXAMPLE_DIR, recursive=True)
+        cls.tmpdir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_stages(self):
+        jsonl, prom = os.path.join(self.tmpdir, 'timings.jsonl'), os.path.join(self.tmpdir, 'timings.prom')
+        reports = [TimingsReport(jsonl), TimingsReport(prom)]
+
+        for task, results in scan(self.work, self.tasks):
+            for calc, error in results:
+                if error:
+                    continue
+                calc = self.work.postprocess(calc)
+                for stage in ['parse', 'classify', 'classify.symmetry', 'classify.dimensions', 'postprocess']:
+                    self.assertTrue(stage in calc.timings, "No %s timing for %s" % (stage, task))
+                self.assertGreaterEqual(calc.timings['classify'], calc.timings['classify.symmetry'])
+                for appname in calc.apps:
+                    self.assertTrue('app.' + appname in calc.timings)
+                    self.assertGreaterEqual(calc.timings['postprocess'], calc.timings['app.' + appname])
+                self.assertAlmostEqual(get_total(calc.timings), sum(calc.timings.get(stage, 0.0) for stage in ['read', 'detect', 'parse', 'classify', 'postprocess']))
+                for report in reports:
+                    report.add(task, calc.timings)
+        for report in reports:
+            report.close()
+
+        lines = [json.loads(line) for line in open(jsonl)]
+        self.assertTrue(lines)
+        self.assertAlmostEqual(lines[0]['total'], get_total(lines[0]['timings']), places=4)
+        self.assertEqual(reports[0].slowest(1), [max(reports[0].files, key=reports[0].files.get)])
+
+        text = open(prom).read()
+        self.assertTrue('tilde_stage_seconds_count{stage="parse"} %s' % len(lines) in text)
+        self.assertTrue('tilde_files_total %s' % len(reports[1].files) in text)
+
+    def test_multiple(self):
+        work = API()
+        parse = work._parse
+
+        def parse_twice(*args):
+            # as if the file contained two calcs
+            for calc, error in parse(*args):
+                clone = copy.deepcopy(calc)
+                yield calc, error
+                yield clone, error
+        work._parse = parse_twice
+
+        calcs = [calc for calc, error in work.parse(self.tasks[0])]
+        self.assertEqual(len(calcs), 2)
+        self.assertTrue('read' in calcs[0].timings and 'detect' in calcs[0].timings)
+        self.assertFalse('read' in calcs[1].timings or 'detect' in calcs[1].timings, "File must be read only once")
+        self.assertTrue('parse' in calcs[1].timings)
+
+    def test_sql(self):
+        engine = create_engine('sqlite://')
+        before = sql_timer.total
+        for n in range(10):
+            engine.execute('SELECT 1')
+        self.assertGreater(sql_timer.total, before)
+
+    def test_profile(self):
+        path = profile_task(self.work, self.tasks[0], output_dir=self.tmpdir)
+        self.assertTrue(os.path.getsize(path))
+        self.assertNotEqual(get_profile_path(os.path.join('a', 'OUTCAR')), get_profile_path(os.path.join('b', 'OUTCAR')), "Profiles of the same-named files must not overwrite each other")
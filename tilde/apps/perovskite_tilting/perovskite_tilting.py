@@ -31,7 +31,7 @@ class Perovskite_tilting():
         self.prec_angles = {}    # non-rounded, non-unique, all-planes angles
         self.angles = {}         # rounded, unique, one-plane angles
 
-        symm = SymmetryFinder()
+        symm = SymmetryFinder(dataset=tilde_calc.symmetry) # NB found at the classification, spglib is only called if absent
         symm.refine_cell(tilde_calc)
         if symm.error:
             raise ModuleError("Cell refinement error: %s" % symm.error)
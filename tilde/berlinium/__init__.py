@@ -4,3 +4,6 @@ from tilde.berlinium.block_impl import Connection as Block_Connection
 from tilde.berlinium.redirect import add_redirection
 from tilde.berlinium.plotter import bdplotter, eplotter
 from tilde.berlinium.categs import wrap_cell
+from tilde.berlinium.cache import ResultCache
+from tilde.berlinium.tagindex import TagIndex
+from tilde.berlinium.grid import GridRows
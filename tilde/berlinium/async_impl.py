@@ -1,28 +1,105 @@
 
 # implementation of thread pool for asynchronous websocket connections
-# with dynamically re-created DB sessions
+# with per-request DB sessions over a single engine, pooling as many connections as there are threads
 
+import time
 import logging
+import threading
 import multiprocessing
 from functools import partial
 
 from concurrent.futures import ThreadPoolExecutor
 
+from sqlalchemy import event
 from tornado import ioloop
 from sockjs.tornado import SockJSConnection
 
 import ujson as json
 
-from tilde.berlinium.impl import GUIProviderMockup, Client
+from tilde.berlinium.impl import GUIProviderMockup, Client, iterate_parts, share
 from tilde.core.settings import settings, connect_database
 
 
-thread_pool = ThreadPoolExecutor(max_workers=4*multiprocessing.cpu_count())
+POOL_SIZE = 4*multiprocessing.cpu_count()
+thread_pool = ThreadPoolExecutor(max_workers=POOL_SIZE)
+db_sessions = None # see get_db_sessions
+
+class PoolMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects, self.checkouts, self.checked_out, self.peak_checked_out = 0, 0, 0, 0
+        self.requests, self.total_wait, self.max_wait, self.total_duration = 0, 0.0, 0.0, 0.0
+        self.coalesced = 0
+
+    def on_connect(self, *args):
+        with self.lock:
+            self.connects += 1
+
+    def on_checkout(self, *args):
+        with self.lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def on_checkin(self, *args):
+        with self.lock:
+            self.checked_out -= 1
+
+    def on_request(self, wait, duration):
+        with self.lock:
+            self.requests += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.total_duration += duration
+
+    def on_coalesced(self):
+        with self.lock:
+            self.coalesced += 1
+
+    def report(self):
+        with self.lock:
+            return {
+                'pool_size': POOL_SIZE,
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'requests': self.requests,
+                'avg_wait': self.total_wait / self.requests if self.requests else 0.0,
+                'max_wait': self.max_wait,
+                'avg_duration': self.total_duration / self.requests if self.requests else 0.0,
+                'coalesced': self.coalesced
+            }
+
+pool_metrics = PoolMetrics()
+
+def get_db_sessions():
+    '''
+    Creates the process-wide engine once, at the first request
+    @returns scoped (i.e. thread-local) session factory
+    '''
+    global db_sessions
+    if db_sessions is None:
+        db_sessions = connect_database(settings, default_actions=False, scoped=True, pool_size=POOL_SIZE)
+        engine = db_sessions().get_bind()
+        db_sessions.remove()
+        event.listen(engine, 'connect', pool_metrics.on_connect)
+        event.listen(engine, 'checkout', pool_metrics.on_checkout)
+        event.listen(engine, 'checkin', pool_metrics.on_checkin)
+        logging.debug("DB engine for %s pooling %s connections" % (
+            settings['db']['default_sqlite_db']
+            if settings['db']['engine'] == 'sqlite'
+            else settings['db']['dbname'] + '@' + settings['db']['engine'],
+            POOL_SIZE
+        ))
+    return db_sessions
 
 class Connection(SockJSConnection):
     Type = 'asynchronous'
     Clients = {}
     GUIProvider = GUIProviderMockup
+    Coalesced = set() # idempotent actions, the identical concurrent requests of which share a single computation
+    InFlight = {} # NB accessed only from the IOLoop thread
 
     def on_open(self, info):
         self.Clients[ getattr(self.session, 'session_id', self.session.__hash__()) ] = Client()
@@ -50,32 +127,100 @@ class Connection(SockJSConnection):
             frame['error'] = 'No server handler for action: %s' % frame['act']
             return self.respond(frame)
 
-        def worker(frame):
-            db_session = connect_database(settings, default_actions=False, no_pooling=True)
-            logging.debug("New DB connection to %s" % (
-                settings['db']['default_sqlite_db']
-                if settings['db']['engine'] == 'sqlite'
-                else settings['db']['dbname'] + '@' + settings['db']['engine']
-            ))
+        self.dispatch(frame)
 
-            frame['result'], frame['error'] = getattr(self.GUIProvider, frame['act'])( frame['req'], frame['client_id'], db_session )
-
-            # must explicitly close db connection inside a thread
-            db_session.close()
-            del db_session
-            logging.debug("DB connection closed")
-
-            return frame
+    def work(self, sessions, frame, submitted, send_part):
+        '''
+        Runs the action in the current (pooled) thread,
+        the ready parts of the multipart result are passed to send_part
+        @returns the final frame
+        '''
+        starttime = time.time()
+        db_session = sessions()
+        try:
+            output = getattr(self.GUIProvider, frame['act'])( frame['req'], frame['client_id'], db_session )
+            for frame['result'], frame['error'], part in iterate_parts(output):
+                if part:
+                    frame['part'], frame['final'] = part
+                    if not frame['final']:
+                        send_part(dict(frame))
+        finally:
+            # return the connection to the pool
+            sessions.remove()
+        pool_metrics.on_request(starttime - submitted, time.time() - starttime)
+
+        return frame
+
+    def get_flight_key(self, frame):
+        '''
+        Requests are identical if they have the same action, request and client settings
+        @returns key of the request or None if it must not be coalesced
+        '''
+        if frame['act'] not in self.Coalesced:
+            return None
+        return json.dumps([frame['act'], frame['req'], self.Clients[frame['client_id']].usettings], sort_keys=True)
+
+    def join(self, frame):
+        '''
+        Joins the identical request being computed, or starts a new flight
+        @returns (key, joined), key being None if the request must not be coalesced
+        '''
+        key = self.get_flight_key(frame)
+        if key is not None:
+            flight = self.InFlight.get(key)
+            if flight is not None:
+                flight['waiters'].append((self, frame))
+                for output in flight['parts']:
+                    self.respond(share(frame, output))
+                pool_metrics.on_coalesced()
+                return key, True
+            self.InFlight[key] = {'waiters': [(self, frame)], 'parts': []}
+        return key, False
+
+    def dispatch(self, frame):
+        key, joined = self.join(frame)
+        if joined:
+            # the identical request is being computed
+            return
+
+        def send_part(output):
+            # send the ready parts while preparing the rest
+            ioloop.IOLoop.instance().add_callback(partial(self.land, key, output))
 
         def callback(res):
-            return self.respond(res.result())
-
-        thread_pool.submit( partial(worker, frame) ).add_done_callback(
+            try:
+                output = res.result()
+            except Exception as ex:
+                # all the waiters must get the error, not only the one which has started the computation
+                logging.exception("Handler %s failed" % frame['act'])
+                output = dict(frame, result='', error='Handler %s has failed: %s' % (frame['act'], ex))
+                if 'part' in output:
+                    output['final'] = True # NB the multipart result is cut short
+            return self.land(key, output, final=True)
+
+        sessions = get_db_sessions()
+        thread_pool.submit( partial(self.work, sessions, frame, time.time(), send_part) ).add_done_callback(
             lambda future: ioloop.IOLoop.instance().add_callback(
                 partial(callback, future)
             )
         )
 
+    def land(self, key, output, final=False):
+        '''
+        Delivers the result (or its part) to all the clients waiting for it
+        '''
+        if key is None:
+            return self.respond(output)
+
+        flight = self.InFlight[key]
+        if final:
+            del self.InFlight[key]
+        else:
+            flight['parts'].append(output)
+
+        for connection, frame in flight['waiters']:
+            connection.respond(share(frame, output))
+
     def respond(self, output):
         del output['client_id']
         if not output['error'] and not output['result']:
@@ -0,0 +1,101 @@
+
+# implementation of asynchronous websocket connections over the asyncio event loop (Python 3.5+):
+# the actions defined as coroutines are run in the event loop without occupying threads,
+# the usual actions go to the thread pool (as they compute and render a lot besides the DB queries);
+# any action is limited in time (see get_timeout) and cancelled as soon as its client disconnects (unless coalesced, see join);
+# NB only the waiting for the action run in a thread is cancelled, the thread keeps running to the end
+
+import time
+import asyncio
+import logging
+from functools import partial
+
+from tornado.platform.asyncio import AsyncIOMainLoop
+
+from tilde.berlinium.async_impl import Connection as ThreadedConnection, thread_pool, get_db_sessions, pool_metrics
+from tilde.core.settings import settings
+
+
+def install():
+    '''
+    Runs Tornado over the asyncio event loop,
+    must be called before the Tornado IOLoop is used
+    '''
+    AsyncIOMainLoop().install()
+
+def get_timeout(act):
+    '''
+    @returns seconds the action may take
+    '''
+    return settings['action_timeouts'].get(act, settings['action_timeout'])
+
+class Connection(ThreadedConnection):
+    Type = 'asyncio'
+    Clients = {}
+
+    def on_open(self, info):
+        self.tasks = set()
+        super().on_open(info)
+
+    def dispatch(self, frame):
+        key, joined = self.join(frame)
+        if joined:
+            # the identical request is being computed
+            return
+        task = asyncio.ensure_future(self.process(frame, key))
+        if key is None:
+            # NB the coalesced action goes on for the other waiters, even if its client has gone
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def process(self, frame, key=None):
+        state = {'finished': False}
+
+        def send(output, final=False):
+            # NB the late parts of the timed out action are dropped
+            if state['finished']:
+                return
+            if key is not None:
+                state['finished'] = final
+                return self.land(key, output, final)
+            if self.is_closed:
+                return
+            state['finished'] = final
+            self.respond(output)
+
+        timeout = get_timeout(frame['act'])
+        try:
+            await asyncio.wait_for(self.run(frame, send), timeout)
+
+        except asyncio.TimeoutError:
+            send(dict(frame, result='', error='Handler %s has not finished in %s sc' % (frame['act'], timeout)), final=True)
+
+        except asyncio.CancelledError:
+            logging.info("Handler %s cancelled, as the client has gone" % frame['act'])
+            raise
+
+        except Exception as ex:
+            logging.exception("Handler %s failed" % frame['act'])
+            send(dict(frame, result='', error='Handler %s has failed: %s' % (frame['act'], ex)), final=True)
+
+    async def run(self, frame, send):
+        handler = getattr(self.GUIProvider, frame['act'])
+        starttime = time.time()
+
+        if asyncio.iscoroutinefunction(handler):
+            # NB the coroutines get no DB session, as the sync DB access would block the event loop
+            frame['result'], frame['error'] = await handler( frame['req'], frame['client_id'], None )
+            pool_metrics.on_request(0, time.time() - starttime)
+            send(frame, final=True)
+
+        else:
+            loop = asyncio.get_event_loop()
+            frame = await loop.run_in_executor(thread_pool, partial(
+                self.work, get_db_sessions(), frame, starttime, lambda output: loop.call_soon_threadsafe(send, output)
+            ))
+            send(frame, final=True)
+
+    def on_close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        super().on_close()
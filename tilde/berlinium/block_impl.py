@@ -9,7 +9,7 @@ from sockjs.tornado import SockJSConnection
 
 import ujson as json
 
-from tilde.berlinium.impl import GUIProviderMockup, Client
+from tilde.berlinium.impl import GUIProviderMockup, Client, iterate_parts
 from tilde.core.settings import settings, connect_database
 
 
@@ -52,8 +52,11 @@ class Connection(SockJSConnection):
                 else settings['db']['dbname'] + '@' + settings['db']['engine']
             ))
 
-        frame['result'], frame['error'] = getattr(self.GUIProvider, frame['act'])( frame['req'], frame['client_id'], Connection.Clients[frame['client_id']].db )
-        self.respond(frame)
+        output = getattr(self.GUIProvider, frame['act'])( frame['req'], frame['client_id'], Connection.Clients[frame['client_id']].db )
+        for frame['result'], frame['error'], part in iterate_parts(output):
+            if part:
+                frame['part'], frame['final'] = part
+            self.respond(dict(frame))
 
     def respond(self, output):
         del output['client_id']
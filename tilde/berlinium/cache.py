@@ -0,0 +1,59 @@
+
+# LRU cache of the query results with the limited lifetime:
+# the results are dropped at any data change made by this process (see API.write_callbacks),
+# the changes made by other processes are taken into account after *ttl* seconds;
+# the cache is bounded by the number of items and optionally by their (estimated) size in bytes
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    def __init__(self, maxsize=64, ttl=600, maxbytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits, self.misses = 0, 0
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        @returns cached value or None
+        '''
+        with self._lock:
+            try:
+                created, value, size = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            if time.time() - created > self.ttl:
+                del self._items[key]
+                self.nbytes -= size
+                self.misses += 1
+                return None
+
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=0):
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items[key][2]
+            self._items[key] = (time.time(), value, size)
+            self._items.move_to_end(key)
+            self.nbytes += size
+            while len(self._items) > self.maxsize or (self.maxbytes and self.nbytes > self.maxbytes and len(self._items) > 1):
+                self.nbytes -= self._items.popitem(last=False)[1][2]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._items)
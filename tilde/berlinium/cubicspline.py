@@ -17,7 +17,7 @@ The benefit is that the class function is set with some starting values before u
 Further the decorator uFuncConverter is added to the __call__ such that the cubic
 spline behaves like a numpy universal function.
 '''
-from numpy import zeros, ones, float64, array, linspace, asarray, ndarray
+from numpy import zeros, ones, float64, array, linspace, asarray, ndarray, searchsorted, clip, newaxis
 from decimal import Decimal
 
 def uFuncConverter(variableIndex):
@@ -247,8 +247,84 @@ class NaturalCubicSpline:
         while True:
             if iRight - iLeft <= 1:
                 return iLeft
-            i = (iRight + iLeft) / 2
+            i = (iRight + iLeft) // 2
             if x < self.xData[i]:
                 iRight = i
             else:
-                iLeft = i
\ No newline at end of file
+                iLeft = i
+
+class NaturalCubicSplines:
+    '''Function class for the natural cubic spline interpolation of many curves
+    sharing the same x-values at once, e.g. all the bands along the k-path.
+    The tridiagonal matrix depends only on the x-values, so it is decomposed once
+    and solved for all the curves, then the curves are evaluated for all the
+    x-values by array operations. The result is the same as of NaturalCubicSpline
+    applied to every curve.
+
+    **At instantiation:**
+
+    :param xData: Array of x-coordinates
+    :type xData: A n-dimensional numpy array of float
+    :param yData: Array of y-coordinates, a column per curve
+    :type yData: A (n, m)-dimensional numpy array of float
+
+    **When called as a function:**
+
+    :param x: The values to interpolate from
+    :type x: A list, tuple or numpy array of real numbers
+    :return: The (len(x), m)-dimensional numpy array of y-values
+
+    **How to use:**
+
+    >>> xData = array([1, 2, 3, 4, 5], float64)
+    >>> yData = array([[0, 1], [1, 0], [0, 1], [1, 0], [0, 1]], float64)
+    >>> f = NaturalCubicSplines(xData, yData)
+    >>> print(f([1.5, 4.5]))
+    [[0.76785714 0.23214286]
+     [0.76785714 0.23214286]]
+
+    '''
+    def __init__(self, xData, yData):
+        xData = asarray(xData, float64)
+        yData = asarray(yData, float64)
+        n, m = yData.shape
+        c = zeros(n-1, float64)
+        d = ones(n, float64)
+        e = zeros(n-1, float64)
+        k = zeros((n, m), float64)
+        dx = xData[1:] - xData[0:-1]
+        dy = yData[1:] - yData[0:-1]
+        c[0:n-2] = dx[0:-1]
+        d[1:n-1] = 2.0 * (dx[1:] + dx[0:-1])
+        e[1:n-1] = dx[1:n-1]
+        k[1:n-1] = 6.0 * (dy[1:] / dx[1:, newaxis] - dy[0:-1] / dx[0:-1, newaxis])
+        self.xData = xData
+        self.yData = yData
+        lu = LUdecomp3(c, d, e) # NB the rows of k are processed for all the curves at once
+        self.k = lu(k)
+
+    def __call__(self, x):
+        x = asarray(x, float64)
+        xData, yData, k = self.xData, self.yData, self.k
+        i = clip(searchsorted(xData, x, side='right') - 1, 0, len(xData) - 2)
+
+        xl, xu = xData[i][:, newaxis], xData[i+1][:, newaxis]
+        yl, yu = yData[i], yData[i+1]
+        kl, ku = k[i], k[i+1]
+        h = xu - xl
+        xi = clip(x, xData[0], xData[-1])[:, newaxis]
+        y = (ku * (xi - xl)**3 + kl * (xu - xi)**3) / (6 * h) \
+            + (yl / h - h * kl / 6) * (xu - xi) \
+            + (yu / h - h * ku / 6) * (xi - xl)
+
+        # linear extrapolation with the slopes at the endpoints
+        below, above = x < xData[0], x > xData[-1]
+        if below.any():
+            h0 = xData[1] - xData[0]
+            slope = -k[0] * h0 / 2 + (yData[1] - yData[0]) / h0 - h0 / 6 * (k[1] - k[0])
+            y[below] = slope * (x[below] - xData[0])[:, newaxis] + yData[0]
+        if above.any():
+            h1 = xData[-1] - xData[-2]
+            slope = k[-1] * h1 / 2 + (yData[-1] - yData[-2]) / h1 - h1 / 6 * (k[-1] - k[-2])
+            y[above] = slope * (x[above] - xData[-1])[:, newaxis] + yData[-1]
+        return y
@@ -23,6 +23,8 @@ class CauchyDistribution:
         return self.gamma / np.pi / ( x**2 + self.gamma**2 )
 
 class Dos:
+    max_cells = 64*1024 # memory cap for the (omega x eigenvalue) smearing blocks, 512 Kb of floats fit the CPU cache
+
     def __init__(self, eigenvalues, sigma=None):
         self.eigenvalues = np.array(eigenvalues)
         if sigma == None: self.sigma = 0.2
@@ -46,6 +48,52 @@ class Dos:
         if omega_max == None: self.omega_max = self.eigenvalues.max() + self.sigma * 10
         else: self.omega_max = omega_max
 
+    def get_omegas(self):
+        # NB the grid is accumulated exactly as before, not with np.arange, to keep the same points
+        if self.omega_pitch == 0: self.omega_pitch = 1 # beware of endless loop if omega_pitch=0
+        omega = self.omega_min
+        omegas = []
+        while omega < self.omega_max + self.omega_pitch/10:
+            omegas.append(omega)
+            omega += self.omega_pitch
+        return np.array(omegas, dtype=float)
+
+    def get_density_of_states(self, omegas, fft=False):
+        '''
+        Smeared eigenvalues at all the omegas,
+        summed in the blocks of at most max_cells differences;
+        the FFT convolution is approximate (the eigenvalues are binned
+        linearly to the grid nodes) and is meant for the large eigenvalue sets
+        '''
+        eigenvalues = self.eigenvalues.ravel().astype(float)
+        if fft and len(omegas) > 1:
+            return self._convolve(eigenvalues, omegas)
+
+        dos = np.empty(len(omegas))
+        chunk = max(1, self.max_cells // max(1, len(eigenvalues)))
+        for start in range(0, len(omegas), chunk):
+            block = omegas[start:start + chunk]
+            dos[start:start + chunk] = self.smearing_function.calc(eigenvalues[np.newaxis, :] - block[:, np.newaxis]).sum(axis=1)
+        return dos
+
+    def _convolve(self, eigenvalues, omegas):
+        pitch = self.omega_pitch
+        n = len(omegas)
+
+        # linear binning to the nodes omega_min + k*pitch, spanning both the eigenvalues and the omegas
+        position = (eigenvalues - omegas[0]) / pitch
+        lower = np.floor(position).astype(int)
+        k0, k1 = min(lower.min(), 0), max(lower.max() + 1, n - 1)
+        weights = np.zeros(k1 - k0 + 1)
+        np.add.at(weights, lower - k0, 1 - (position - lower))
+        np.add.at(weights, lower + 1 - k0, position - lower)
+
+        # dos[i] = sum_k weights[k] * f(k*pitch - i*pitch), i.e. the convolution with the kernel f(-j*pitch)
+        kernel = self.smearing_function.calc(-np.arange(-k1, n - k0) * pitch)
+        size = len(weights) + len(kernel) - 1
+        full = np.fft.irfft(np.fft.rfft(weights, size) * np.fft.rfft(kernel, size), size)
+        return full[k1 - k0:k1 - k0 + n]
+
 class TotalDos(Dos):
     def __init__(self, eigenvalues, sigma=None):
         Dos.__init__(self, eigenvalues, sigma)
@@ -53,16 +101,10 @@ class TotalDos(Dos):
     def get_density_of_states_at_omega(self, omega):
         return np.sum( self.smearing_function.calc(self.eigenvalues - omega))
 
-    def calculate(self):
-        omega = self.omega_min
-        dos = []
-
-        if self.omega_pitch == 0: self.omega_pitch = 1 # beware of endless loop if omega_pitch=0
-        while omega < self.omega_max + self.omega_pitch/10 :
-            p = self.get_density_of_states_at_omega(omega)
-            dos.append( [round(omega, 3), round(p, 3)] ) # round to reduce output
-            omega += self.omega_pitch
-        return dos
+    def calculate(self, fft=False):
+        omegas = self.get_omegas()
+        dos = self.get_density_of_states(omegas, fft=fft)
+        return [ [round(omega, 3), round(p, 3)] for omega, p in zip(omegas.tolist(), dos.tolist()) ] # round to reduce output
 
 class PartialDos(Dos):
     # eigenvalues and impacts must be unique and one-to-one correspondent
@@ -72,36 +114,33 @@ class PartialDos(Dos):
 
     def get_partial_dos_impact_at_omega(self, omega):
         # function for obtaining scaled partial impacts in any omega point using a linear equation interpolation
-        if omega in self.eigenvalues:
-            return self.impacts[ np.where(self.eigenvalues == omega)[0][0] ]
-        if omega < self.eigenvalues[0]:
-            return np.zeros( len(self.impacts[0]) )
-        elif omega > self.eigenvalues[-1]:
-            return self.impacts[-1]
-        else:
-            for n in range(len(self.eigenvalues)):
-                if n < len(self.eigenvalues) and self.eigenvalues[n] < omega < self.eigenvalues[n+1]:
-                    result = (omega - self.eigenvalues[n])*(self.impacts[n+1] - self.impacts[n])/(self.eigenvalues[n+1] - self.eigenvalues[n]) + self.impacts[n]
-                    return result
-
-    def calculate(self, types, labels):
-        omega = self.omega_min
-        pdos = []
-        omegas = []
+        return self.get_partial_dos_impacts(np.array([omega], dtype=float))[0]
+
+    def get_partial_dos_impacts(self, omegas):
+        '''
+        Impacts linearly interpolated at all the omegas (sorted eigenvalues are expected),
+        zeros below the first eigenvalue and the last impacts above the last one
+        '''
+        impacts = self.impacts.astype(float)
+        n = np.searchsorted(self.eigenvalues, omegas, side='right') - 1
+        inner = (n >= 0) & (n < len(self.eigenvalues) - 1)
+        result = np.zeros((len(omegas), impacts.shape[1]))
+        result[n >= len(self.eigenvalues) - 1] = impacts[-1]
+
+        n, omegas = n[inner], omegas[inner][:, np.newaxis]
+        lower, upper = self.eigenvalues[n][:, np.newaxis], self.eigenvalues[n+1][:, np.newaxis]
+        result[inner] = (omegas - lower)*(impacts[n+1] - impacts[n])/(upper - lower) + impacts[n]
+        return result
+
+    def calculate(self, types, labels, fft=False):
+        omegas = self.get_omegas()
+        dos = self.get_density_of_states(omegas, fft=fft)
+        partial_dos = (self.get_partial_dos_impacts(omegas) * dos[:, np.newaxis]).transpose()
 
         plots = []
 
-        if self.omega_pitch == 0: self.omega_pitch = 1 # beware of endless loop if omega_pitch=0
-        while omega < self.omega_max + self.omega_pitch/10:
-            partial = self.get_partial_dos_impact_at_omega(omega) * np.sum( self.smearing_function.calc(self.eigenvalues - omega) )
-            omegas.append( omega )
-            pdos.append( partial )
-            omega += self.omega_pitch
-        partial_dos = np.array(pdos).transpose()
-        omegas = np.array(omegas)
-
         for n, set_for_sum in enumerate(types):
-            atom = [k for k, v in labels.iteritems() if v == n][0] # find k by v
+            atom = [k for k, v in labels.items() if v == n][0] # find k by v
 
             multdos = 1
             #if atom != 'Fe': continue
@@ -110,5 +149,5 @@ class PartialDos(Dos):
             pdos_sum = np.zeros(omegas.shape, dtype=float)
             for i in set_for_sum:
                 pdos_sum += multdos * partial_dos[(i-1):i].sum(axis=0)
-            plots.append( {'label': atom, 'data': [ [ round(omegas[n], 3), round(i, 3) ] for n, i in enumerate(pdos_sum.tolist()) ]} ) # round to reduce output
+            plots.append( {'label': atom, 'data': [ [ round(omega, 3), round(i, 3) ] for omega, i in zip(omegas.tolist(), pdos_sum.tolist()) ]} ) # round to reduce output
         return plots
@@ -0,0 +1,101 @@
+
+# Decoded and rendered rows of the data table cached per checksum,
+# so that Grid.info is not parsed again on every request;
+# at the cache miss the cells are rendered from model.Grid_columns if possible,
+# and only then from the whole Grid.info
+
+import os
+
+import ujson as json
+
+import tilde.core.model as model
+from tilde.berlinium.cache import ResultCache
+from tilde.berlinium.categs import wrap_cell
+
+
+class GridRows:
+    def __init__(self, hierarchy, hierarchy_values, maxbytes=128*1024*1024, ttl=600):
+        self.hierarchy = hierarchy
+        self.hierarchy_values = hierarchy_values
+        self.cache = ResultCache(maxsize=float('inf'), ttl=ttl, maxbytes=maxbytes)
+
+    def clear(self):
+        self.cache.clear()
+
+    def _store(self, checksum, entry):
+        # NB the decoded JSON takes several times more memory than its string
+        self.cache.set(checksum, entry, size=4*entry['raw_size'] + sum(len(cell) for cell in entry['cells'].values()))
+
+    def _fetch_info(self, session, checksums):
+        entries = {}
+        for checksum, info in session.query(model.Grid.checksum, model.Grid.info).filter(model.Grid.checksum.in_(checksums)).all():
+            entries[checksum] = {'data': json.loads(info), 'full': True, 'cells': {}, 'raw_size': len(info)}
+        return entries
+
+    def _fetch_columns(self, session, checksums):
+        entries = {}
+        columns = [getattr(model.Grid_columns, key) for key in model.GRID_COLUMNS]
+        for row in session.query(model.Grid_columns.checksum, model.Metadata.location, *columns) \
+            .join(model.Metadata, model.Metadata.checksum == model.Grid_columns.checksum) \
+            .filter(model.Grid_columns.checksum.in_(checksums)).all():
+            data = dict(zip(model.GRID_COLUMNS, row[2:]))
+            data['location'] = row[1]
+            entries[row[0]] = {'data': data, 'full': False, 'cells': {}, 'raw_size': 100}
+        return entries
+
+    def get_info(self, session, checksum):
+        '''
+        @returns decoded Grid.info or None
+        '''
+        entry = self.cache.get(checksum)
+        if entry and entry['full']:
+            return entry['data']
+
+        entry = self._fetch_info(session, [checksum]).get(checksum)
+        if entry is None:
+            return None
+        self._store(checksum, entry)
+        return entry['data']
+
+    def render(self, session, checksums, cols):
+        '''
+        @returns {checksum: html} of the table rows with the given columns
+        '''
+        entities = [entity for entity in self.hierarchy if entity['has_column'] and entity['cid'] in cols]
+        sources = set(entity['source'] for entity in entities) | set(['location'])
+        promoted = sources.issubset(set(model.GRID_COLUMNS) | set(['location']))
+
+        entries, missing = {}, []
+        for checksum in checksums:
+            entry = self.cache.get(checksum)
+            if entry is None or not (entry['full'] or promoted) and any(entity['cid'] not in entry['cells'] for entity in entities):
+                missing.append(checksum)
+            else:
+                entries[checksum] = entry
+
+        if missing:
+            found = self._fetch_columns(session, missing) if promoted else {}
+            found.update(self._fetch_info(session, [checksum for checksum in missing if checksum not in found]))
+            entries.update(found)
+
+        output = {}
+        for checksum, entry in entries.items():
+            changed = checksum in missing
+            html_output = ['<tr id="i_', checksum, '" data-filename="', (entry['data'].get('location') or '').split(os.sep)[-1], '">']
+            html_output.append('<td><input type="checkbox" id="d_cb_' + checksum + '" class="SHFT_cb"></td>')
+
+            for entity in entities:
+                try:
+                    cell = entry['cells'][entity['cid']]
+                except KeyError:
+                    cell = entry['cells'][entity['cid']] = wrap_cell(entity, entry['data'], self.hierarchy_values, table_view=True)
+                    changed = True
+                html_output.append(cell)
+
+            html_output.append('</tr>')
+            output[checksum] = ''.join(html_output)
+
+            if changed:
+                self._store(checksum, entry)
+
+        return output
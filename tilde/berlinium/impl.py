@@ -1,4 +1,7 @@
 
+import types
+
+
 class GUIProviderMockup:
     pass
 
@@ -7,3 +10,35 @@ class Client:
         self.usettings = {}
         self.authorized = False
         self.db = None
+
+def iterate_parts(output):
+    '''
+    A handler either returns (result, error) or yields them part by part,
+    so that the client gets the first parts while the rest are still being prepared
+    @returns iterator over (result, error, part) triples,
+    where part is None for the single response, or (n, is_last) otherwise
+    '''
+    if not isinstance(output, types.GeneratorType):
+        yield output[0], output[1], None
+        return
+
+    n, previous = 0, None
+    for item in output:
+        if previous is not None:
+            yield previous[0], previous[1], (n, False)
+            n += 1
+        previous = item
+    if previous is None:
+        yield None, None, None
+    else:
+        yield previous[0], previous[1], (n, True)
+
+def share(frame, output):
+    '''
+    @returns copy of the frame of one request carrying the output computed for another
+    '''
+    shared = dict(frame)
+    for key in ['result', 'error', 'part', 'final']:
+        if key in output:
+            shared[key] = output[key]
+    return shared
@@ -0,0 +1,55 @@
+
+# Keyset (seek) pagination: a page is requested with an opaque cursor,
+# pointing to the last row of the previous page by its (sort key, checksum),
+# so that the DB starts right from it instead of skipping OFFSET rows
+
+import base64
+
+from sqlalchemy import and_, or_
+
+import six
+import ujson as json
+
+
+def encode_cursor(value, checksum, position):
+    '''
+    @returns opaque string for the client
+    '''
+    return base64.urlsafe_b64encode(json.dumps([value, checksum, position]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    '''
+    @returns (value, checksum, position) tuple
+    @raises ValueError on the malformed cursor
+    '''
+    try:
+        value, checksum, position = json.loads(base64.urlsafe_b64decode(str(cursor).encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+    if not isinstance(checksum, six.string_types) or len(checksum) > 100 or not isinstance(position, six.integer_types) or position < 0:
+        raise ValueError('Invalid cursor')
+    return value, checksum, position
+
+def seek_order(sortby, tiebreaker):
+    '''
+    Order of the pages, NULLs of sortby go first explicitly,
+    as the DBs differ here (e.g. PostgreSQL puts them last in ASC order)
+    @returns ORDER BY clauses
+    '''
+    return sortby.nullsfirst(), tiebreaker
+
+def seek_clause(sortby, tiebreaker, value, checksum):
+    '''
+    Condition for the rows following (value, checksum) in the order of (sortby, tiebreaker),
+    NB NULLs of sortby must go first, see seek_order
+    '''
+    if value is None:
+        return or_(sortby != None, and_(sortby == None, tiebreaker > checksum))
+    return or_(sortby > value, and_(sortby == value, tiebreaker > checksum))
+
+def split_parts(rows, size):
+    '''
+    @returns list of lists of at most size rows
+    '''
+    return [rows[n:n + size] for n in range(0, len(rows), size)]
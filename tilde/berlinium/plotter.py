@@ -5,9 +5,9 @@
 
 import math
 
-from numpy import dot, array, linalg, arange
+from numpy import dot, array, linalg, arange, around, cumsum, empty, vstack, zeros
 
-from tilde.berlinium.cubicspline import NaturalCubicSpline
+from tilde.berlinium.cubicspline import NaturalCubicSplines
 from tilde.berlinium.dos import TotalDos, PartialDos
 
 from ase.data.colors import jmol_colors
@@ -16,7 +16,7 @@ from ase.data import chemical_symbols
 
 def frac2float(num):
     if '/' in str(num):
-        fract = map(float, num.split('/'))
+        fract = list(map(float, num.split('/')))
         return fract[0] / fract[1]
     return float(num)
 
@@ -59,39 +59,33 @@ def bdplotter(task, **kwargs):
                     red_order.append(order[i])
                 order = red_order
 
-            for N in range(len( kwargs['values'][nullstand] )):
-                # interpolate for each curve throughout the BZ
-                results.append({'color':'#000000', 'data':[], 'ticks':[]})
-                d = 0.0
-                x = []
-                y = []
-                bz_vec_ref = [0, 0, 0]
-
-                for bz in order:
-                    y.append( kwargs['values'][bz][N] )
-                    bz_coords = map(frac2float, bz.split() )
-                    bz_vec_cur = dot( bz_coords, linalg.inv( kwargs['xyz_matrix'] ).transpose() )
-                    bz_vec_dir = map(sum, zip(bz_vec_cur, bz_vec_ref))
-                    bz_vec_ref = bz_vec_cur
-                    d += linalg.norm( bz_vec_dir )
-                    x.append(d)
-                    results[-1]['ticks'].append( [d, bz.replace(' ', '')] )
-
-                # end in nullstand point (normally, Gamma)
-                #y.append(kwargs['values'][nullstand][N])
-                #if d == 0: d+=0.5
-                #else: d += linalg.norm( bz_vec_ref )
-                #x.append(d)
-                #results[-1]['ticks'].append( [d, nullstand.replace(' ', '')] )
-
-                divider = 10 if len(order)<10 else 1.5
-                step = (max(x)-min(x)) / len(kwargs['values']) / divider
-
-                xnew = arange(min(x), max(x)+step/2, step).tolist()
-                ynew = []
-                f = NaturalCubicSpline( array(x), array(y) )
-                for i in xnew:
-                    results[-1]['data'].append([ round(  i, 3  ), round(  f(i), 3  ) ]) # round to reduce output
+            # distances along the k-path, shared by all the curves
+            bz_coords = array([[frac2float(i) for i in bz.split()] for bz in order])
+            bz_vecs = dot( bz_coords, linalg.inv( kwargs['xyz_matrix'] ).transpose() )
+            bz_vecs_dir = bz_vecs + vstack([ zeros((1, 3)), bz_vecs[:-1] ])
+            x = cumsum( linalg.norm(bz_vecs_dir, axis=1) )
+            ticks = [ [d, bz.replace(' ', '')] for d, bz in zip(x.tolist(), order) ]
+
+            # end in nullstand point (normally, Gamma)
+            #y.append(kwargs['values'][nullstand][N])
+            #if d == 0: d+=0.5
+            #else: d += linalg.norm( bz_vec_ref )
+            #x.append(d)
+            #results[-1]['ticks'].append( [d, nullstand.replace(' ', '')] )
+
+            divider = 10 if len(order)<10 else 1.5
+            step = (x.max()-x.min()) / len(kwargs['values']) / divider
+
+            # interpolate all the curves throughout the BZ at once
+            nbands = len( kwargs['values'][nullstand] )
+            xnew = arange(x.min(), x.max()+step/2, step)
+            ynew = NaturalCubicSplines( x, array([ kwargs['values'][bz][:nbands] for bz in order ], dtype=float) )(xnew)
+
+            data = empty((nbands, len(xnew), 2))
+            data[:,:,0] = around(xnew, 3) # round to reduce output
+            data[:,:,1] = around(ynew, 3).transpose()
+            for curve in data.tolist():
+                results.append({'color':'#000000', 'data':curve, 'ticks':[ list(tick) for tick in ticks ]})
 
         return results
 
@@ -0,0 +1,136 @@
+
+# In-process inverted index of the tags table:
+# every tid is mapped to the sorted array of calc row numbers (posting list),
+# every calc row is mapped to its tids (forward index in CSR format),
+# so that the facets are intersected in memory instead of the N-way self-joins
+
+import time
+import threading
+
+import numpy as np
+from sqlalchemy import func
+
+import tilde.core.model as model
+
+
+class Postings:
+    def __init__(self, rows, tids, checksums, sort_keys=None):
+        '''
+        **rows**, **tids** are the pairs of the tags table, where calcs are given by row numbers in **checksums**
+        **sort_keys** maps the sorting name to the list of values per row
+        '''
+        rows, tids = np.asarray(rows, dtype=np.int64), np.asarray(tids, dtype=np.int64)
+        self.checksums = np.asarray(checksums, dtype=object)
+
+        order = np.lexsort((rows, tids))
+        tids_sorted, rows_sorted = tids[order], rows[order]
+        uniq, starts = np.unique(tids_sorted, return_index=True)
+        ends = np.append(starts[1:], len(tids_sorted))
+        self.lists = dict((int(tid), rows_sorted[start:end]) for tid, start, end in zip(uniq, starts, ends))
+
+        order = np.lexsort((tids, rows))
+        self.indices = tids[order]
+        self.indptr = np.zeros(len(self.checksums) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self.checksums)), out=self.indptr[1:])
+
+        # ranks of rows per sorting, NB NULLs go first, ties are resolved by checksum
+        self.ranks = {}
+        for name, values in (sort_keys or {}).items():
+            order = sorted(range(len(values)), key=lambda n: (values[n] is not None, values[n] or '', self.checksums[n]))
+            self.ranks[name] = np.empty(len(values), dtype=np.int64)
+            self.ranks[name][order] = np.arange(len(values))
+
+    @classmethod
+    def from_db(cls, session):
+        checksums, formulae, locations = [], [], []
+        for checksum, formula, location in session.query(model.Calculation.checksum, model.Metadata.chemical_formula, model.Metadata.location) \
+            .outerjoin(model.Metadata, model.Metadata.checksum == model.Calculation.checksum).all():
+            checksums.append(checksum)
+            formulae.append(formula)
+            locations.append(location)
+        row_ids = dict((checksum, n) for n, checksum in enumerate(checksums))
+
+        rows, tids = [], []
+        for checksum, tid in session.query(model.tags.c.checksum, model.tags.c.tid).all():
+            if checksum in row_ids:
+                rows.append(row_ids[checksum])
+                tids.append(tid)
+
+        return cls(rows, tids, checksums, {'chemical_formula': formulae, 'location': locations})
+
+    def intersect(self, tids):
+        '''
+        @returns sorted array of rows having all the tids
+        '''
+        lists = [self.lists.get(int(tid)) for tid in set(tids)]
+        if not lists or any(item is None for item in lists):
+            return np.empty(0, dtype=np.int64)
+
+        lists.sort(key=len)
+        rows = lists[0]
+        for item in lists[1:]:
+            rows = np.intersect1d(rows, item, assume_unique=True)
+            if not rows.size:
+                break
+        return rows
+
+    def cooccurring(self, tids):
+        '''
+        @returns sorted list of tids present in the calcs having all the given tids
+        '''
+        rows = self.intersect(tids)
+        if not rows.size:
+            return []
+
+        starts, lengths = self.indptr[rows], self.indptr[rows + 1] - self.indptr[rows]
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.unique(self.indices[offsets]).tolist()
+
+    def get_checksums(self, rows, sortby=None):
+        '''
+        @returns list of checksums of rows, ordered as requested
+        '''
+        if sortby:
+            rows = rows[np.argsort(self.ranks[sortby][rows], kind='stable')]
+        return self.checksums[rows].tolist()
+
+
+class TagIndex:
+    '''
+    Keeps Postings in sync with the tags table:
+    the index is rebuilt when the facet summary (see API.get_facets)
+    or the latest addition time changes (a calc may be purged and re-added with the same topics),
+    when it is dropped by clear() or after *ttl* seconds
+    '''
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None
+
+    @staticmethod
+    def get_signature(session):
+        '''
+        @returns tuple changing with any write to the tags table
+        '''
+        count, total = session.query(func.count(model.Topic_count.tid), func.sum(model.Topic_count.count)).one()
+        return count, total, session.query(func.max(model.Metadata.added)).scalar()
+
+    def get(self, session, signature=None):
+        '''
+        The **signature** may be given, if just obtained
+        @returns up-to-date Postings
+        '''
+        if signature is None:
+            signature = self.get_signature(session)
+        state = self._state
+        if state and state[0] == signature and time.time() - state[1] < self.ttl:
+            return state[2]
+
+        with self._lock:
+            state = self._state
+            if not state or state[0] != signature or time.time() - state[1] >= self.ttl:
+                state = self._state = (signature, time.time(), Postings.from_db(session))
+        return state[2]
+
+    def clear(self):
+        self._state = None
@@ -8,6 +8,13 @@ import six
 # hierarchy API: __order__ to apply classifier
 __order__ = 5
 
+# hierarchy API: info keys read and written by classifier, see pipeline.py
+__reads__ = ['ansatz']
+__writes__ = ['bs*']
+
+def applies(tilde_obj):
+    return tilde_obj.electrons['basis_set'] and tilde_obj.info['ansatz'] != 0x1
+
 def classify(tilde_obj):
     if not tilde_obj.electrons['basis_set'] or tilde_obj.info['ansatz'] == 0x1:
         return tilde_obj
@@ -9,6 +9,13 @@ from functools import reduce
 # hierarchy API: __order__ to apply classifier
 __order__ = 20
 
+# hierarchy API: info keys read and written by classifier, see pipeline.py
+__reads__ = ['elements', 'contents', 'lack', 'periodicity']
+__writes__ = ['expanded', 'contents', 'standard', 'vac', 'tags']
+
+def applies(tilde_obj):
+    return len(tilde_obj.info['elements']) > 1 and tilde_obj.structures[-1].periodicity not in [0, 1, 2]
+
 def classify(tilde_obj):
     if len(tilde_obj.info['elements']) < 2: return tilde_obj
     elif tilde_obj.structures[-1].periodicity in [0, 1, 2]: return tilde_obj
@@ -5,16 +5,18 @@
 # Author: Evgeny Blokhin
 # TODO: account all "pseudo-periodic" cases for 1d and 0d
 
-import math
-
 from numpy.linalg import det
 
-from ase.data import chemical_symbols, covalent_radii
+from tilde.core.geometry import get_atoms_volume
 
 
 # hierarchy API: __order__ to apply classifier
 __order__ = 1
 
+# hierarchy API: info keys read and written by classifier, see pipeline.py
+__reads__ = ['cellpar']
+__writes__ = ['techs', 'periodicity', 'dims']
+
 # empirical criteria
 L = 3.9                     # a must be L times larger than b and c
 r_EC = 0.0                  # additional radius of electron cloud around the atom
@@ -26,9 +28,7 @@ def classify(tilde_obj):
         cmpveci = [i for i in range(3) if i not in [zi, mi]][0]
 
         # vacuum per one atom (av)
-        atoms_volume = 0.0
-        for i in tilde_obj.structures[-1]:
-            atoms_volume += 4/3 * math.pi * (covalent_radii[ chemical_symbols.index( i.symbol ) ] + r_EC) ** 3
+        atoms_volume = get_atoms_volume(tilde_obj.structures[-1], r_EC)
         av = (abs(det(tilde_obj.structures[-1].cell)) - atoms_volume)/len(tilde_obj.structures[-1])
         #print "av:", av
 
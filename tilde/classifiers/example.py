@@ -5,5 +5,9 @@
 # hierarchy API: __order__ to apply classifier
 __order__ = 1000
 
+# hierarchy API: info keys read and written by classifier, see pipeline.py
+__reads__ = []
+__writes__ = []
+
 def classify(tilde_obj):
     return tilde_obj # this means stop trying to classify object in scope of a current classifier
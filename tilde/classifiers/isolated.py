@@ -10,9 +10,16 @@ from ase.data import chemical_symbols, covalent_radii
 # hierarchy API: __order__ to apply classifier
 __order__ = 30
 
+# hierarchy API: info keys read and written by classifier, see pipeline.py
+__reads__ = ['elements', 'contents', 'dims', 'periodicity']
+__writes__ = ['periodicity']
+
 
 REL = 100
 
+def applies(tilde_obj):
+    return len(tilde_obj.info['elements']) == 1 and tilde_obj.info['contents'][0] == 1
+
 def classify(tilde_obj):
     if not len(tilde_obj.info['elements']) == 1 or tilde_obj.info['contents'][0] != 1: return tilde_obj
 
@@ -5,6 +5,13 @@
 # hierarchy API: __order__ to apply classifier
 __order__ = 30
 
+# hierarchy API: info keys read and written by classifier, see pipeline.py
+__reads__ = ['elements', 'periodicity']
+__writes__ = ['tags', 'expanded']
+
+def applies(tilde_obj):
+    return 'C' in tilde_obj.info['elements'] and 'H' in tilde_obj.info['elements'] and tilde_obj.structures[-1].periodicity not in [2, 3]
+
 def classify(tilde_obj):
     if not 'C' in tilde_obj.info['elements'] or not 'H' in tilde_obj.info['elements']:
         return tilde_obj
@@ -6,17 +6,27 @@ import math
 import random
 import six
 
+import numpy as np
+
 from ase.data import chemical_symbols
 from ase.data import covalent_radii
 from ase.spacegroup import crystal
 
 from tilde.core.constants import Perovskite_Structure
+from tilde.core.geometry import get_goldschmidt_factors
 from tilde.apps.perovskite_tilting.perovskite_tilting import Perovskite_tilting
 
 
 # hierarchy API: __order__ to apply classifier
 __order__ = 10
 
+# hierarchy API: info keys read and written by classifier, see pipeline.py
+__reads__ = ['elements', 'contents', 'periodicity']
+__writes__ = ['tags', 'elements', 'contents', 'impurity*', 'lack']
+
+def applies(tilde_obj):
+    return len(tilde_obj.info['elements']) > 1 and any(e in Perovskite_Structure.C for e in tilde_obj.info['elements'])
+
 def classify(tilde_obj):
     if len(tilde_obj.info['elements']) == 1: return tilde_obj
 
@@ -45,24 +55,16 @@ def classify(tilde_obj):
 
     if not 1.3 < D_prop < 2.3: return tilde_obj # D_prop grows for 2D adsorption cases (>1.9)
 
-    n_combs, n_offs = 0, 0
-    for A in A_site:
-        for B in B_site:
-            if B == A: continue
-            for C in C_site:
-                rA = covalent_radii[chemical_symbols.index(A)]
-                rB = covalent_radii[chemical_symbols.index(B)]
-                rC = covalent_radii[chemical_symbols.index(C)]
-
-                # Goldschmidt tolerance factor
-                # t = (rA + rC) / sqrt(2) * (rB + rC)
-                # 0.71 =< t =< 1.2
-                # t < 0.71 ilmenite, corundum or KNbO3 structure
-                # t > 1 hexagonal perovskite polytypes
-                # http://en.wikipedia.org/wiki/Goldschmidt_tolerance_factor
-                factor = (rA + rC) / (math.sqrt(2) * (rB + rC))
-                if not 0.71 <= factor <= 1.4: n_offs += 1
-                n_combs += 1
+    # Goldschmidt tolerance factor
+    # t = (rA + rC) / sqrt(2) * (rB + rC)
+    # 0.71 =< t =< 1.2
+    # t < 0.71 ilmenite, corundum or KNbO3 structure
+    # t > 1 hexagonal perovskite polytypes
+    # http://en.wikipedia.org/wiki/Goldschmidt_tolerance_factor
+    factors = get_goldschmidt_factors(A_site, B_site, C_site)
+    combs = np.broadcast_to((np.array(A_site)[:, np.newaxis] != np.array(B_site)[np.newaxis, :])[:, :, np.newaxis], factors.shape)
+    n_combs = int(combs.sum())
+    n_offs = int(((factors < 0.71) | (factors > 1.4))[combs].sum())
     if n_offs == n_combs: return tilde_obj
 
     tilde_obj.info['tags'].append(0x4)
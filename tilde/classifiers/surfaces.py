@@ -5,34 +5,29 @@
 import math
 from functools import reduce
 
+from tilde.core.geometry import get_projection, get_layers
+
 # hierarchy API: __order__ to apply classifier
 __order__ = 40
 
-def classify(tilde_obj):
-    if tilde_obj.structures[-1].periodicity != 2: return tilde_obj
+# hierarchy API: info keys read and written by classifier, see pipeline.py
+__reads__ = ['cellpar', 'elements', 'contents', 'periodicity']
+__writes__ = ['layers', 'tags', 'adsorbent', 'termination', 'expanded', 'standard']
 
-    vectors = []
-    for i in range(3):
-        vectors.append([i, tilde_obj.info['cellpar'][i]])
-    z_axis = sorted(vectors, key = lambda k: k[1])[-1][0]
+def applies(tilde_obj):
+    return tilde_obj.structures[-1].periodicity == 2
 
-    z_coords = []
-    for i in tilde_obj.structures[-1]:
-        if i.symbol == 'X': continue
-        z_coords.append([ i.symbol, i.position[z_axis] ])
-    z_coords = sorted(z_coords, key = lambda k: k[1])
+def classify(tilde_obj):
+    if tilde_obj.structures[-1].periodicity != 2: return tilde_obj
 
-    content_by_layer = [{}]
-    for i in range(len(z_coords)):
-        try: content_by_layer[-1][ z_coords[i][0] ]
-        except KeyError: content_by_layer[-1][ z_coords[i][0] ] = 1
-        else: content_by_layer[-1][ z_coords[i][0] ] += 1
+    z_axis = max(range(3), key=lambda i: (tilde_obj.info['cellpar'][i], i))
 
-        try: z_coords[i+1]
-        except IndexError: break
+    symbols, z_coords = get_projection(tilde_obj.structures[-1], z_axis)
+    layers = get_layers(z_coords, 0.7).tolist() # diff by Z
 
-        if z_coords[i+1][1] - z_coords[i][1] > 0.7: # diff by Z
-            content_by_layer.append({})
+    content_by_layer = [{} for _ in range(layers[-1] + 1 if layers else 1)]
+    for layer, symbol in zip(layers, symbols):
+        content_by_layer[layer][symbol] = content_by_layer[layer].get(symbol, 0) + 1
 
     adsorbate = {}
     to_delete = []
@@ -6,6 +6,10 @@
 
 __order__ = 4
 
+# hierarchy API: info keys read and written by classifier, see pipeline.py
+__reads__ = ['H_types']
+__writes__ = []
+
 xc_types = [                    # see hierarchy values in the file init-data.sql
     0x1, 0x2, 0x3, 0x4,         # main types of the Jacob's ladder, http://dx.doi.org/10.1063/1.1904565
     0x5, 0x6, 0x7,              # Hartree-Fock, +U, vdW
@@ -4,6 +4,8 @@
 
 import os, sys
 import re
+import time
+import locale
 from math import gcd
 import inspect
 import traceback
@@ -13,13 +15,17 @@ from functools import reduce
 from numpy import dot, array
 
 from tilde import __version__
-from tilde.core.common import u, is_binary_string, html_formula
-from tilde.core.symmetry import SymmetryHandler
-from tilde.core.settings import BASE_DIR, settings as default_settings, virtualize_path, get_hierarchy
+from tilde.core.common import u, is_binary_string, html_formula, pack_atoms, unpack_atoms
+from tilde.core.symmetry import SymmetryFinder, SymmetryHandler
+from tilde.core.settings import BASE_DIR, DATA_DIR, settings as default_settings, virtualize_path, get_hierarchy, check_database
+from tilde.core.registry import LazyPlugin, get_registry_key, load_registry, save_registry
+from tilde.core.pipeline import ClassifierPipeline
+from tilde.core.timing import timed, sql_timer
 from tilde.core.electron_structure import ElectronStructureError
 from tilde.parsers import Output
 import tilde.core.model as model
 
+from ase.atoms import Atoms
 from ase.data import chemical_symbols
 from ase.geometry import cell_to_cellpar
 from sqlalchemy import func
@@ -27,11 +33,13 @@ from sqlalchemy.orm.exc import NoResultFound
 
 import json as _json
 import ujson as json
-import six
 
 
 class TildeAPI:
     version = __version__
+    head_size = 131072 # bytes read at once for the format detection
+    detect_lines = 701
+    write_callbacks = [] # called after any change of the stored data, e.g. to drop the cached results
 
     formula_sequence = [
         'Fr','Cs','Rb','K','Na','Li',
@@ -61,9 +69,35 @@ class TildeAPI:
         for item in (settings or {}):
             self.settings[item] = settings[item]
 
+        # The hierarchy and the plugins are discovered once and then taken from the snapshot
+        # (until anything they depend on is changed), the plugins being imported at their first use
+        key = get_registry_key(self.settings) if self.settings['registry_cache'] else None
+        snapshot = load_registry(key) if key else None
+        if not snapshot:
+            snapshot = self._discover()
+            if key:
+                save_registry(key, snapshot)
+        else:
+            # NB the DB at the same URL may be new or replaced
+            check_database(self.settings)
+        self._register(snapshot)
+
+        # The symmetry of the recurring structures is taken from the cache, also from disk if given
+        if self.settings['symmetry_cache']:
+            path = os.path.join(DATA_DIR, self.settings['symmetry_cache'])
+            if SymmetryFinder.cache.path != path:
+                SymmetryFinder.cache.persist(path)
+
+    def _discover(self):
+        '''
+        Reads the hierarchy from DB and imports all the plugins
+        @returns registry snapshot (JSON-serializable)
+        '''
+        snapshot = {'parsers': [], 'apps': [], 'connectors': [], 'classifiers': []}
+
         # Default hierarchy is set in the file init-data.sql
         # Conventionally, the hierarchy values are set by hexadecimal numbers (with leading 0x)
-        self.hierarchy, self.hierarchy_groups, self.hierarchy_values = get_hierarchy(self.settings)
+        snapshot['hierarchy'], snapshot['hierarchy_groups'], snapshot['hierarchy_values'] = get_hierarchy(self.settings)
 
         # *parser API*
         # Subfolder "parsers" contains directories with parsers.
@@ -71,7 +105,9 @@ class TildeAPI:
         # (1) its class defines a fingerprints method
         # (2) it is enabled by its manifest file
         # (3) its filename repeats the name of parser folder
-        All_parsers, self.Parsers = {}, {}
+        # Parser should also define a fingerprint_pattern regex (a faster equivalent of its fingerprints method)
+        # and may accept the already opened stream in its iparse classmethod
+        All_parsers = {}
         for parsername in os.listdir( os.path.realpath(BASE_DIR + '/../parsers') ):
             if self.settings.get('no_parse'):
                 continue
@@ -93,7 +129,7 @@ class TildeAPI:
         for parser, module in All_parsers.items():
             for name, cls in inspect.getmembers(module):
                 if inspect.isclass(cls) and hasattr(cls, 'fingerprints'):
-                    self.Parsers[cls.__name__] = cls
+                    snapshot['parsers'].append({'name': cls.__name__, 'module': module.__name__, 'fingerprint_pattern': getattr(cls, 'fingerprint_pattern', None)})
 
         # *module API*
         # Tilde module (app) is a subfolder (%appfolder%) of apps folder
@@ -106,8 +142,6 @@ class TildeAPI:
         # *on3d* - app provides the data which may be shown in GUI on atomic structure rendering pane (used only by make3d of daemon.py)
         # *plottable* - column provided may be plotted in GUI
         # NB. GUI (has_column) is supported only if the class %Appfolder% defines cell_wrapper
-        self.Apps = {}
-        n = 1
         for appname in os.listdir( os.path.realpath(BASE_DIR + '/../apps') ):
             if self.settings.get('no_parse'):
                 continue
@@ -125,42 +159,32 @@ class TildeAPI:
                         app = __import__('tilde.apps.' + appname + '.' + appname, fromlist=[appname.capitalize()]) # from foo import Foo
                     except ImportError:
                         raise RuntimeError('Module API Error: module ' + appname + ' is invalid or not found!')
-                    self.Apps[appname] = {
-                        'appmodule': getattr(app, appname.capitalize()),
+                    snapshot['apps'].append({
+                        'name': appname,
+                        'module': app.__name__,
+                        'class': appname.capitalize(),
                         'appdata': appmanifest['appdata'],
                         'apptarget': appmanifest.get('apptarget', None),
                         'appcaption': appmanifest['appcaption'],
-                        'on3d': appmanifest.get('on3d', 0)
-                    }
-
-                    # compiling table columns:
-                    if hasattr(self.Apps[appname]['appmodule'], 'cell_wrapper'):
-                        self.hierarchy.append({
-                            'cid': (2000 + n),
-                            'category': appmanifest['appcaption'],
-                            'sort': (2000 + n),
-                            'has_column': True,
-                            'cell_wrapper': getattr(self.Apps[appname]['appmodule'], 'cell_wrapper')
-                        })
-                        if appmanifest.get('plottable', False):
-                            self.hierarchy[-1].update({'plottable': 1})
-                        n += 1
-
-        self.hierarchy = sorted( self.hierarchy, key=lambda x: x['sort'] )
+                        'on3d': appmanifest.get('on3d', 0),
+                        'plottable': appmanifest.get('plottable', False),
+                        'cell_wrapper': hasattr(getattr(app, appname.capitalize()), 'cell_wrapper')
+                    })
 
         # *connector API*
         # Every connector implements reading methods:
         # *list* (if applicable) and *report* (obligatory)
-        self.Conns = {}
         for connectname in os.listdir( os.path.realpath(BASE_DIR + '/../connectors') ):
             if connectname.endswith('.py') and connectname != '__init__.py':
                 connectname = connectname[0:-3]
                 conn = importlib.import_module('tilde.connectors.' + connectname) # this means: from foo import Foo
-                self.Conns[connectname] = {'list': getattr(conn, 'list'), 'report': getattr(conn, 'report')}
+                for method in ['list', 'report']:
+                    if not hasattr(conn, method):
+                        raise RuntimeError('Connector %s has not defined %s method!' % (connectname, method))
+                snapshot['connectors'].append({'name': connectname, 'module': conn.__name__})
 
         # *hierarchy API*
         # This is used for classification
-        self.Classifiers = []
         for classifier in os.listdir( os.path.realpath(BASE_DIR + '/../classifiers') ):
             if self.settings.get('no_parse'):
                 continue
@@ -170,12 +194,73 @@ class TildeAPI:
                 if getattr(obj, '__order__') is None:
                     raise RuntimeError('Classifier %s has not defined an order to apply!' % classifier)
 
-                self.Classifiers.append({
-                    'classify': getattr(obj, 'classify'),\
-                    'order': getattr(obj, '__order__'),\
-                    'class': classifier
+                if not hasattr(obj, 'classify'):
+                    raise RuntimeError('Classifier %s has not defined classify method!' % classifier)
+                snapshot['classifiers'].append({
+                    'module': obj.__name__,
+                    'order': getattr(obj, '__order__'),
+                    'class': classifier,
+                    'reads': getattr(obj, '__reads__', None),
+                    'writes': getattr(obj, '__writes__', None),
+                    'applies': hasattr(obj, 'applies')
                 })
-                self.Classifiers = sorted(self.Classifiers, key = lambda x: x['order'])
+        snapshot['classifiers'] = sorted(snapshot['classifiers'], key = lambda x: (x['order'], x['class']))
+
+        return snapshot
+
+    def _register(self, snapshot):
+        '''
+        Sets up the hierarchy and the plugins from the snapshot,
+        NB the plugins are not imported here
+        '''
+        self.hierarchy, self.hierarchy_groups, self.hierarchy_values = list(snapshot['hierarchy']), snapshot['hierarchy_groups'], snapshot['hierarchy_values']
+
+        self.Parsers = {}
+        for parser in snapshot['parsers']:
+            self.Parsers[parser['name']] = LazyPlugin(parser['module'], parser['name'], {'fingerprint_pattern': parser['fingerprint_pattern']})
+        self._compile_fingerprints()
+
+        self.Apps = {}
+        n = 1
+        for app in snapshot['apps']:
+            self.Apps[app['name']] = {
+                'appmodule': LazyPlugin(app['module'], app['class']),
+                'appdata': app['appdata'],
+                'apptarget': app['apptarget'],
+                'appcaption': app['appcaption'],
+                'on3d': app['on3d']
+            }
+
+            # compiling table columns:
+            if app['cell_wrapper']:
+                self.hierarchy.append({
+                    'cid': (2000 + n),
+                    'category': app['appcaption'],
+                    'sort': (2000 + n),
+                    'has_column': True,
+                    'cell_wrapper': LazyPlugin(app['module'], app['class'] + '.cell_wrapper')
+                })
+                if app['plottable']:
+                    self.hierarchy[-1].update({'plottable': 1})
+                n += 1
+
+        self.hierarchy = sorted( self.hierarchy, key=lambda x: x['sort'] )
+
+        self.Conns = {}
+        for conn in snapshot['connectors']:
+            self.Conns[conn['name']] = {'list': LazyPlugin(conn['module'], 'list'), 'report': LazyPlugin(conn['module'], 'report')}
+
+        self.Classifiers = []
+        for classifier in snapshot['classifiers']:
+            self.Classifiers.append({
+                'classify': LazyPlugin(classifier['module'], 'classify'),
+                'applies': LazyPlugin(classifier['module'], 'applies') if classifier['applies'] else None,
+                'order': classifier['order'],
+                'class': classifier['class'],
+                'reads': classifier['reads'],
+                'writes': classifier['writes']
+            })
+        self.classifier_pipeline = ClassifierPipeline(self.Classifiers)
 
     def assign_parser(self, name):
         '''
@@ -189,6 +274,15 @@ class TildeAPI:
                 del self.Parsers[n]
         if len(self.Parsers) != 1:
             raise RuntimeError('Parser cannot be assigned!')
+        self._compile_fingerprints()
+
+    def _compile_fingerprints(self):
+        '''
+        Combines the fingerprint patterns of parsers into a single regex,
+        which is matched at every line start (the earliest line wins)
+        '''
+        patterns = ['(?P<%s>(?=.*?(?:%s)))' % (name, Parser.fingerprint_pattern) for name, Parser in self.Parsers.items() if getattr(Parser, 'fingerprint_pattern', None)]
+        self._fingerprints = re.compile('^(?:' + '|'.join(patterns) + ')', re.M) if patterns else None
 
     def formula(self, atom_sequence):
         '''
@@ -220,6 +314,42 @@ class TildeAPI:
     def count(self, session):
         return session.query(func.count(model.Calculation.checksum)).one()[0]
 
+    def get_sources(self, session):
+        '''
+        Retrieves the index of the already processed files
+        NB: this is the PUBLIC method
+        @returns dict {path: (size, mtime, parser)}
+        '''
+        return dict((path, (size, mtime, parser)) for path, size, mtime, parser in session.query(
+            model.Sourcefile.path,
+            model.Sourcefile.size,
+            model.Sourcefile.mtime,
+            model.Sourcefile.parser
+        ).all())
+
+    def is_unchanged(self, path, sources):
+        '''
+        Checks whether the file was already processed in its current state
+        NB the unsupported files are not re-read even if new parsers are enabled
+        NB: this is the PUBLIC method
+        @returns bool
+        '''
+        try: size, mtime, parser = sources[path]
+        except KeyError: return False
+        try: stat = os.stat(path)
+        except OSError: return False
+        return stat.st_size == size and stat.st_mtime == mtime and (parser is None or parser in self.Parsers)
+
+    def index_source(self, session, path, stat, parser, checksums):
+        '''
+        Records the processed file into the index
+        **stat** is taken before parsing, **parser** is None for unsupported files
+        NB: this is the PUBLIC method
+        @procedure
+        '''
+        session.merge(model.Sourcefile(path=path, size=stat.st_size, mtime=stat.st_mtime, parser=parser, checksums=json.dumps(checksums)))
+        session.commit()
+
     def savvyize(self, input_string, recursive=False, stemma=False):
         '''
         Determines which files should be processed
@@ -290,7 +420,7 @@ class TildeAPI:
                         tasks.append(parent + os.sep + filename)
         return tasks
 
-    def _parse(self, parsable, parser_name):
+    def _parse(self, parsable, parser_name, stream=None):
         '''
         Low-level parsing
         NB: this is the PRIVATE method
@@ -298,7 +428,7 @@ class TildeAPI:
         '''
         calc, error = None, None
         try:
-            for calc in self.Parsers[parser_name].iparse(parsable):
+            for calc in self.Parsers[parser_name].iparse(parsable, stream=stream):
                 yield calc, None
             return
         except RuntimeError as e:
@@ -308,62 +438,96 @@ class TildeAPI:
             error = "unexpected %s parser error in %s:\n %s" % (parser_name, parsable, "".join(traceback.format_exception( exc_type, exc_value, exc_tb )))
         yield None, error
 
+    def detect(self, head):
+        '''
+        Determines the data format by the fingerprints
+        criterion: parser must detect its working format within the first detect_lines
+        NB: this is the PUBLIC method
+        @returns parser_name or None
+        '''
+        lines = head.split('\n', self.detect_lines)
+        end = len(head) - len(lines[-1]) if len(lines) > self.detect_lines else len(head)
+        lines = [line + '\n' for line in lines[:-1]] + [lines[-1]]
+        lines = lines[:self.detect_lines]
+
+        found, found_line = None, len(lines)
+        if self._fingerprints:
+            match = self._fingerprints.search(head, 0, end)
+            if match:
+                found, found_line = match.lastgroup, head.count('\n', 0, match.start())
+
+        # parsers having no fingerprint_pattern are checked line by line
+        legacy = [name for name, Parser in self.Parsers.items() if not getattr(Parser, 'fingerprint_pattern', None)]
+        if legacy:
+            order = list(self.Parsers.keys())
+            for n, line in enumerate(lines[:found_line + 1]):
+                for name in legacy:
+                    if n == found_line and order.index(name) > order.index(found):
+                        continue
+                    if self.Parsers[name].fingerprints(line):
+                        return name
+        return found
+
     def parse(self, parsable):
         '''
         High-level parsing:
         determines the data format
         and combines parent-children outputs
+        NB: the file is opened once, its head is read by blocks,
+        and the same open file is handed over to the parser
         NB: this is the PUBLIC method
         @returns tilde_obj, error
         '''
         calc, error = None, None
+        starttime = time.time()
         try:
             f = open(parsable, 'rb')
-            if is_binary_string(f.read(2048)):
-                yield None, 'was read (binary data)...'
-                return
-            f.close()
+            head = f.read(self.head_size)
         except IOError:
             yield None, 'read error!'
             return
 
-        f = open(parsable, 'r', errors='surrogateescape') if six.PY3 else open(parsable, 'r') # open the file once again with right mode
-        f.seek(0)
-        counter, detected = 0, False
-
-        while not detected:
-
-            if counter > 700: break # criterion: parser must detect its working format until here
-
-            fingerprint = f.readline()
-            if not fingerprint:
-                break
-            for name, Parser in self.Parsers.items():
-                if Parser.fingerprints(fingerprint):
-                    for calc, error in self._parse(parsable, name):
-                        detected = True
-                        # check if we parsed something reasonable
-                        if not error and calc:
+        with f:
+            if is_binary_string(head[:2048]):
+                yield None, 'was read (binary data)...'
+                return
 
-                            if not len(calc.structures) or not len(calc.structures[-1]):
-                                error = 'Valid structure is not present!'
+            while head.count(b'\n') < self.detect_lines:
+                more = f.read(self.head_size)
+                if not more:
+                    break
+                head += more
+            timings = {'read': time.time() - starttime}
+
+            starttime = time.time()
+            head = head.decode(locale.getpreferredencoding(False), 'surrogateescape').replace('\r\n', '\n').replace('\r', '\n') # as in text mode
+            name = self.detect(head)
+            del head
+            timings['detect'] = time.time() - starttime
+
+            # unsupported data occured
+            if not name:
+                yield None, 'was read...'
+                return
 
-                            if calc.info['finished'] == 0x1:
-                                calc.warning('This calculation is not correctly finished!')
+            starttime = time.time()
+            for calc, error in self._parse(parsable, name, f):
+                # check if we parsed something reasonable
+                if not error and calc:
+                    calc.timings.update(timings, parse=time.time() - starttime)
+                    timings = {} # NB the file is read only once, for its first calc
 
-                            if not calc.info['H']:
-                                error = 'XC potential is not present!'
+                    if not len(calc.structures) or not len(calc.structures[-1]):
+                        error = 'Valid structure is not present!'
 
-                        yield calc, error
+                    if calc.info['finished'] == 0x1:
+                        calc.warning('This calculation is not correctly finished!')
 
-                    if detected:
-                        break
-            counter += 1
-        f.close()
+                    if not calc.info['H']:
+                        error = 'XC potential is not present!'
 
-        # unsupported data occured
-        if not detected:
-            yield None, 'was read...'
+                yield calc, error
+                starttime = time.time()
 
     def classify(self, calc, symprec=None):
         '''
@@ -372,6 +536,7 @@ class TildeAPI:
         @returns tilde_obj, error
         '''
         error = None
+        starttime = time.time()
         symbols = calc.structures[-1].get_chemical_symbols()
         calc.info['formula'] = self.formula(symbols)
         calc.info['cellpar'] = cell_to_cellpar(calc.structures[-1].cell).tolist()
@@ -401,14 +566,10 @@ class TildeAPI:
         # applying filter: TODO: only unaries
         #if len(calc.info['elements']) != 1: return None, 'data do not satisfy the filter'
 
-        # extend hierarchy with modules
-        for C_obj in self.Classifiers:
-            try:
-                calc = C_obj['classify'](calc)
-            except:
-                exc_type, exc_value, exc_tb = sys.exc_info()
-                error = "Fatal error during classification:\n %s" % "".join(traceback.format_exception( exc_type, exc_value, exc_tb ))
-                return None, error
+        # extend hierarchy with modules, see pipeline.py
+        calc, error = self.classifier_pipeline.run(calc)
+        if error:
+            return None, error
 
         # chemical ratios
         if not len(calc.info['standard']):
@@ -471,10 +632,12 @@ class TildeAPI:
         calc.info['latgamma'] = round(calc.info['cellpar'][5], 2)
 
         # invoke symmetry finder
-        found = SymmetryHandler(calc, symprec)
+        with timed(calc, 'classify.symmetry'):
+            found = SymmetryHandler(calc, symprec)
         if found.error:
             return None, found.error
 
+        calc.symmetry = found.dataset # for the apps, see SymmetryFinder.get_dataset
         calc.info['sg'] = found.sg
         calc.info['ng'] = found.ng
         calc.info['spg'] = "%s &mdash; %s" % (found.ng, found.sg)
@@ -534,6 +697,7 @@ class TildeAPI:
                 else:
                     calc.info[ entity['source'] ] = ['none'] if entity['multiple'] else 'none'
 
+        calc.timings['classify'] = time.time() - starttime
         calc.benchmark() # this call must be at the very end of parsing
 
         return calc, error
@@ -544,6 +708,7 @@ class TildeAPI:
         NB: this is the PUBLIC method
         @returns apps_dict
         '''
+        starttime = time.time()
         for appname, appclass in self.Apps.items():
             if with_module and with_module != appname: continue
 
@@ -574,28 +739,143 @@ class TildeAPI:
                 calc.apps[appname] = {'error': None, 'data': None}
                 if dry_run:
                     continue
-                try:
-                    AppInstance = appclass['appmodule'](calc)
-                except:
-                    exc_type, exc_value, exc_tb = sys.exc_info()
-                    errmsg = "Fatal error in %s module:\n %s" % (appname, " ".join(traceback.format_exception( exc_type, exc_value, exc_tb )))
-                    calc.apps[appname]['error'] = errmsg
-                    calc.warning(errmsg)
-                else:
+                with timed(calc, 'app.' + appname):
                     try:
-                        calc.apps[appname]['data'] = getattr(AppInstance, appclass['appdata'])
-                    except AttributeError:
-                        errmsg = 'No appdata-defined property found for %s module!' % appname
+                        AppInstance = appclass['appmodule'](calc)
+                    except:
+                        exc_type, exc_value, exc_tb = sys.exc_info()
+                        errmsg = "Fatal error in %s module:\n %s" % (appname, " ".join(traceback.format_exception( exc_type, exc_value, exc_tb )))
                         calc.apps[appname]['error'] = errmsg
                         calc.warning(errmsg)
+                    else:
+                        try:
+                            calc.apps[appname]['data'] = getattr(AppInstance, appclass['appdata'])
+                        except AttributeError:
+                            errmsg = 'No appdata-defined property found for %s module!' % appname
+                            calc.apps[appname]['error'] = errmsg
+                            calc.warning(errmsg)
+        calc.timings['postprocess'] = calc.timings.get('postprocess', 0.0) + time.time() - starttime
         return calc
 
+    def _prepare_phonons(self, calc):
+        '''
+        Prepares phonon data for saving
+        this is actually a dict to list conversion TODO re-structure this
+        @returns list or None
+        '''
+        if not calc.phonons['modes']:
+            return None
+
+        phonons_json = []
+
+        for bzpoint, frqset in calc.phonons['modes'].items():
+            # re-orientate eigenvectors
+            for i in range(0, len( (calc.phonons['ph_eigvecs'] or {}).get(bzpoint) )):
+                for j in range(0, len(calc.phonons['ph_eigvecs'][bzpoint][i])//3):
+                    eigv = array([
+                        calc.phonons['ph_eigvecs'][bzpoint][i][j*3],
+                        calc.phonons['ph_eigvecs'][bzpoint][i][j*3+1],
+                        calc.phonons['ph_eigvecs'][bzpoint][i][j*3+2]
+                    ])
+                    R = dot( eigv, calc.structures[-1].cell ).tolist()
+                    calc.phonons['ph_eigvecs'][bzpoint][i][j*3], \
+                    calc.phonons['ph_eigvecs'][bzpoint][i][j*3+1], \
+                    calc.phonons['ph_eigvecs'][bzpoint][i][j*3+2] = [round(x, 3) for x in R]
+
+            try: irreps = calc.phonons['irreps'][bzpoint]
+            except KeyError:
+                empty = []
+                for i in range(len(frqset)):
+                    empty.append('')
+                irreps = empty
+
+            phonons_json.append({'bzpoint': bzpoint, 'freqs': frqset, 'irreps': irreps, 'ph_eigvecs': (calc.phonons['ph_eigvecs'] or {}).get(bzpoint) })
+            if bzpoint == '0 0 0':
+                phonons_json[-1]['ir_active'] = calc.phonons['ir_active']
+                phonons_json[-1]['raman_active'] = calc.phonons['raman_active']
+            if calc.phonons['ph_k_degeneracy']:
+                phonons_json[-1]['ph_k_degeneracy'] = calc.phonons['ph_k_degeneracy'][bzpoint]
+        return phonons_json
+
+    def _get_topics(self, calc):
+        '''
+        Collects topics of tilde_obj according to hierarchy
+        @returns list of model.topic
+        '''
+        uitopics = []
+        for entity in self.hierarchy:
+
+            if not entity['creates_topic']:
+                continue
+
+            if entity['multiple'] or calc._calcset:
+                for item in calc.info.get( entity['source'], [] ):
+                    uitopics.append( model.topic(cid=entity['cid'], topic=item) )
+            else:
+                topic = calc.info.get(entity['source'])
+                if topic or not entity['optional']:
+                    uitopics.append( model.topic(cid=entity['cid'], topic=topic) )
+        return uitopics
+
+    def _get_grid_columns(self, info):
+        '''
+        Collects the typed values of the grid info, see model.Grid_columns
+        @returns dict or None if a value does not match the column type
+        '''
+        columns = {}
+        for key, types in model.GRID_COLUMNS.items():
+            value = info.get(key)
+            if value is not None and (not isinstance(value, types) or isinstance(value, bool)):
+                return None
+            columns[key] = value
+        return columns
+
+    def get_trajectory(self, calc):
+        '''
+        Selects the optimisation steps of tilde_obj to be stored
+        according to the trajectory setting, the final structure is always kept;
+        NB tilde_obj is not changed, so its checksum remains the same
+        NB: this is the PUBLIC method
+        @returns list of the structure indices
+        '''
+        nsteps = len(calc.structures)
+        policy = self.settings.get('trajectory', 'all')
+
+        if nsteps < 3 or policy == 'all':
+            return list(range(nsteps))
+
+        elif policy == 'ends':
+            return [0, nsteps - 1]
+
+        elif policy.startswith('every:'):
+            k = int(policy.split(':')[1])
+            steps = list(range(0, nsteps, k))
+            if steps[-1] != nsteps - 1:
+                steps.append(nsteps - 1)
+            return steps
+
+        elif policy.startswith('energy:'):
+            de = float(policy.split(':')[1])
+            # NB tresholds may lack the initial structure, so they are aligned at the end
+            energies = [None] * nsteps
+            for n, treshold in enumerate(calc.tresholds[-nsteps:]):
+                energies[nsteps - min(len(calc.tresholds), nsteps) + n] = treshold[4]
+            steps = [0]
+            for n in range(1, nsteps - 1):
+                if energies[n] is None or energies[steps[-1]] is None or abs(energies[n] - energies[steps[-1]]) >= de:
+                    steps.append(n)
+            steps.append(nsteps - 1)
+            return steps
+
+        raise RuntimeError('Unknown trajectory storage directive: %s' % policy)
+
     def save(self, calc, session):
         '''
         Saves tilde_obj into the database
         NB: this is the PUBLIC method
         @returns checksum, error
         '''
+        starttime, sqltime = time.time(), sql_timer.total
         checksum = calc.get_checksum()
 
         try:
@@ -621,39 +901,8 @@ class TildeAPI:
             ormcalc.nested_depth = calc._nested_depth
 
         else:
-            # prepare phonon data for saving
-            # this is actually a dict to list conversion TODO re-structure this
-            if calc.phonons['modes']:
-                phonons_json = []
-
-                for bzpoint, frqset in calc.phonons['modes'].items():
-                    # re-orientate eigenvectors
-                    for i in range(0, len( (calc.phonons['ph_eigvecs'] or {}).get(bzpoint) )):
-                        for j in range(0, len(calc.phonons['ph_eigvecs'][bzpoint][i])//3):
-                            eigv = array([
-                                calc.phonons['ph_eigvecs'][bzpoint][i][j*3],
-                                calc.phonons['ph_eigvecs'][bzpoint][i][j*3+1],
-                                calc.phonons['ph_eigvecs'][bzpoint][i][j*3+2]
-                            ])
-                            R = dot( eigv, calc.structures[-1].cell ).tolist()
-                            calc.phonons['ph_eigvecs'][bzpoint][i][j*3], \
-                            calc.phonons['ph_eigvecs'][bzpoint][i][j*3+1], \
-                            calc.phonons['ph_eigvecs'][bzpoint][i][j*3+2] = [round(x, 3) for x in R]
-
-                    try: irreps = calc.phonons['irreps'][bzpoint]
-                    except KeyError:
-                        empty = []
-                        for i in range(len(frqset)):
-                            empty.append('')
-                        irreps = empty
-
-                    phonons_json.append({'bzpoint': bzpoint, 'freqs': frqset, 'irreps': irreps, 'ph_eigvecs': (calc.phonons['ph_eigvecs'] or {}).get(bzpoint) })
-                    if bzpoint == '0 0 0':
-                        phonons_json[-1]['ir_active'] = calc.phonons['ir_active']
-                        phonons_json[-1]['raman_active'] = calc.phonons['raman_active']
-                    if calc.phonons['ph_k_degeneracy']:
-                        phonons_json[-1]['ph_k_degeneracy'] = calc.phonons['ph_k_degeneracy'][bzpoint]
-
+            phonons_json = self._prepare_phonons(calc)
+            if phonons_json:
                 ormcalc.phonons = model.Phonons()
                 try: ormcalc.spectra.append( model.Spectra(kind=model.Spectra.PHONON, eigenvalues=json.dumps(phonons_json)) )
                 except: calc.warning('Cannot save phonon eigenvalues!')
@@ -688,12 +937,13 @@ class TildeAPI:
             )
             codefamily = model.Codefamily.as_unique(session, content = calc.info['framework'])
             codeversion = model.Codeversion.as_unique(session, content=calc.info['prog'])
-
-            codeversion.instances.append(ormcalc.meta_data)
-            codefamily.versions.append(codeversion)
-
             pot = model.Pottype.as_unique(session, name=calc.info['H'])
-            pot.instances.append(ormcalc)
+            session.flush()
+
+            # NB foreign keys are assigned directly, as appending to the collections loads them entirely
+            codeversion.family_id = codefamily.family_id
+            ormcalc.meta_data.version_id = codeversion.version_id
+            ormcalc.pottype_id = pot.pottype_id
             ormcalc.recipinteg = model.Recipinteg(
                 kgrid=str(calc.info['k']),
                 kshift=calc.info['kshift'],
@@ -719,7 +969,8 @@ class TildeAPI:
                     ncycles=json.dumps(calc.ncycles)
                 )
 
-            for n, ase_repr in enumerate(calc.structures):
+            for n in self.get_trajectory(calc):
+                ase_repr = calc.structures[n]
                 is_final = True if n == len(calc.structures)-1 else False
                 struct = model.Structure(step=n, final=is_final)
 
@@ -730,32 +981,26 @@ class TildeAPI:
                     a21=ase_repr.cell[1][0], a22=ase_repr.cell[1][1], a23=ase_repr.cell[1][2],
                     a31=ase_repr.cell[2][0], a32=ase_repr.cell[2][1], a33=ase_repr.cell[2][2]
                 )
-                #rmts =      ase_repr.get_array('rmts') if 'rmts' in ase_repr.arrays else [None for j in range(len(ase_repr))]
-                charges =   ase_repr.get_array('charges') if 'charges' in ase_repr.arrays else [None for j in range(len(ase_repr))]
-                magmoms =   ase_repr.get_array('magmoms') if 'magmoms' in ase_repr.arrays else [None for j in range(len(ase_repr))]
-                for n, i in enumerate(ase_repr):
-                    struct.atoms.append(model.Atom(number=chemical_symbols.index(i.symbol), x=i.x, y=i.y, z=i.z, charge=charges[n], magmom=magmoms[n]))
+                if self.settings['atoms_storage'] == 'packed':
+                    struct.packed_atoms = model.Packed_atoms(natom=len(ase_repr), content=pack_atoms(ase_repr))
+                else:
+                    #rmts =      ase_repr.get_array('rmts') if 'rmts' in ase_repr.arrays else [None for j in range(len(ase_repr))]
+                    charges =   ase_repr.get_array('charges') if 'charges' in ase_repr.arrays else [None for j in range(len(ase_repr))]
+                    magmoms =   ase_repr.get_array('magmoms') if 'magmoms' in ase_repr.arrays else [None for j in range(len(ase_repr))]
+                    for n, i in enumerate(ase_repr):
+                        struct.atoms.append(model.Atom(number=chemical_symbols.index(i.symbol), x=i.x, y=i.y, z=i.z, charge=charges[n], magmom=magmoms[n]))
 
                 ormcalc.structures.append(struct)
             # TODO Forces
 
         ormcalc.uigrid = model.Grid(info=json.dumps(calc.info))
+        if self.settings['grid_columns']:
+            columns = self._get_grid_columns(calc.info)
+            if columns:
+                ormcalc.uigrid_columns = model.Grid_columns(**columns)
 
         # tags ORM
-        uitopics = []
-        for entity in self.hierarchy:
-
-            if not entity['creates_topic']:
-                continue
-
-            if entity['multiple'] or calc._calcset:
-                for item in calc.info.get( entity['source'], [] ):
-                    uitopics.append( model.topic(cid=entity['cid'], topic=item) )
-            else:
-                topic = calc.info.get(entity['source'])
-                if topic or not entity['optional']:
-                    uitopics.append( model.topic(cid=entity['cid'], topic=topic) )
-
+        uitopics = self._get_topics(calc)
         uitopics = [model.Topic.as_unique(session, cid=x.cid, topic=str(x.topic)) for x in uitopics]
 
         ormcalc.uitopics.extend(uitopics)
@@ -765,10 +1010,413 @@ class TildeAPI:
         else:
             session.add_all([codefamily, codeversion, pot, ormcalc])
 
+        session.flush()
+        self._update_facets(session, [checksum], [x.tid for x in uitopics])
+
         session.commit()
+        self._written()
+        calc.timings['save'] = time.time() - starttime
+        calc.timings['save.sql'] = sql_timer.total - sqltime
         del calc, ormcalc
         return checksum, None
 
+    def save_many(self, calcs, session, batch_size=250):
+        '''
+        Saves tilde_objs into the database in batches,
+        each batch is written by the bulk inserts in a single transaction;
+        NB calcsets are saved one by one
+        NB: this is the PUBLIC method
+        @returns list of (checksum, error) in the order of calcs
+        '''
+        output, batch = [], []
+        for calc in calcs:
+            batch.append(calc)
+            if len(batch) >= batch_size:
+                output += self._save_batch(batch, session)
+                batch = []
+        if batch:
+            output += self._save_batch(batch, session)
+        return output
+
+    def _save_batch(self, calcs, session):
+        starttime, sqltime = time.time(), sql_timer.total
+        output = [None for i in range(len(calcs))]
+        checksums = [calc.get_checksum() for calc in calcs]
+
+        existing = set()
+        for i in range(0, len(checksums), 500):
+            existing.update(row[0] for row in session.query(model.Calculation.checksum).filter(model.Calculation.checksum.in_(checksums[i:i+500])).all())
+
+        records = []
+        for n, calc in enumerate(calcs):
+            if checksums[n] in existing:
+                output[n] = (None, "This calculation already exists!")
+                continue
+            existing.add(checksums[n])
+
+            if calc._calcset:
+                if records: # keep the order of insertion
+                    self._write_records(session, records, output)
+                    records = []
+                output[n] = self.save(calc, session)
+                continue
+
+            records.append(self._get_record(n, checksums[n], calc))
+
+        if records:
+            self._write_records(session, records, output)
+
+        # NB the time of the batch is shared by its calculations, except the calcsets timed by save
+        elapsed, sqltime = time.time() - starttime, sql_timer.total - sqltime
+        shared = []
+        for n, calc in enumerate(calcs):
+            if calc._calcset and 'save' in calc.timings:
+                elapsed -= calc.timings['save']
+                sqltime -= calc.timings['save.sql']
+            elif not output[n][1]:
+                shared.append(calc)
+        for calc in shared:
+            calc.timings['save'] = elapsed / len(shared)
+            calc.timings['save.sql'] = sqltime / len(shared)
+        return output
+
+    def _get_record(self, n, checksum, calc):
+        '''
+        Converts tilde_obj into the table rows (except unique objects and foreign keys)
+        @returns dict
+        '''
+        if not calc.download_size:
+            for f in calc.related_files:
+                calc.download_size += os.stat(f).st_size
+
+        record = {
+            'n': n,
+            'checksum': checksum,
+            'framework': calc.info['framework'],
+            'prog': calc.info['prog'],
+            'H': calc.info['H'],
+            'structures': [],
+            'spectra': [],
+            'rows': {}
+        }
+        rows = record['rows']
+
+        phonons_json = self._prepare_phonons(calc)
+        if phonons_json:
+            rows[model.Phonons.__table__] = dict(checksum=checksum)
+            try: record['spectra'].append(dict(kind=model.Spectra.PHONON, eigenvalues=json.dumps(phonons_json)))
+            except: calc.warning('Cannot save phonon eigenvalues!')
+
+        for task in ['dos', 'bands']:
+            if calc.electrons[task]:
+                calc.electrons[task] = calc.electrons[task].todict()
+
+        if calc.electrons['dos'] or calc.electrons['bands']:
+            rows[model.Electrons.__table__] = dict(checksum=checksum, gap=calc.info['bandgap'], is_direct=0)
+            if 'bandgaptype' in calc.info:
+                rows[model.Electrons.__table__]['is_direct'] = 1 if calc.info['bandgaptype'] == 'direct' else -1
+            record['spectra'].append(dict(
+                kind=model.Spectra.ELECTRON,
+                dos=json.dumps(calc.electrons['dos']),
+                bands=json.dumps(calc.electrons['bands']),
+                projected=json.dumps(calc.electrons['projected']),
+                eigenvalues=json.dumps(calc.electrons['eigvals'])
+            ))
+
+        calc.related_files = list(map(virtualize_path, calc.related_files))
+        rows[model.Metadata.__table__] = dict(
+            checksum=checksum,
+            location=calc.info['location'],
+            finished=calc.info['finished'],
+            raw_input=calc.info['input'],
+            modeling_time=calc.info['duration'],
+            chemical_formula=html_formula(calc.info['standard']),
+            download_size=calc.download_size,
+            filenames=json.dumps(calc.related_files)
+        )
+        rows[model.Recipinteg.__table__] = dict(
+            checksum=checksum,
+            kgrid=str(calc.info['k']),
+            kshift=calc.info['kshift'],
+            smearing=calc.info['smear'],
+            smeartype=calc.info['smeartype']
+        )
+        rows[model.Basis.__table__] = dict(
+            checksum=checksum,
+            kind=calc.info['ansatz'],
+            content=_json.dumps(calc.electrons['basis_set']) if calc.electrons['basis_set'] else None # NB. ujson fails here on NaN
+        )
+        rows[model.Energy.__table__] = dict(checksum=checksum, convergence=json.dumps(calc.convergence), total=calc.info['energy'])
+        rows[model.Spacegroup.__table__] = dict(checksum=checksum, n=calc.info['ng'])
+        rows[model.Struct_ratios.__table__] = dict(
+            checksum=checksum,
+            chemical_formula=calc.info['standard'],
+            formula_units=calc.info['expanded'],
+            nelem=calc.info['nelem'],
+            dimensions=calc.info['dims']
+        )
+        if calc.tresholds:
+            rows[model.Struct_optimisation.__table__] = dict(
+                checksum=checksum,
+                tresholds=_json.dumps(calc.tresholds), # NB. ujson fails here on NaN
+                ncycles=json.dumps(calc.ncycles)
+            )
+
+        for n in self.get_trajectory(calc):
+            ase_repr = calc.structures[n]
+            s = cell_to_cellpar(ase_repr.cell)
+            if self.settings['atoms_storage'] == 'packed':
+                atoms = [dict(natom=len(ase_repr), content=pack_atoms(ase_repr))]
+            else:
+                charges =   ase_repr.get_array('charges') if 'charges' in ase_repr.arrays else [None for j in range(len(ase_repr))]
+                magmoms =   ase_repr.get_array('magmoms') if 'magmoms' in ase_repr.arrays else [None for j in range(len(ase_repr))]
+                atoms = [dict(number=chemical_symbols.index(i.symbol), x=i.x, y=i.y, z=i.z, charge=charges[j], magmom=magmoms[j]) for j, i in enumerate(ase_repr)]
+            record['structures'].append((
+                dict(checksum=checksum, step=n, final=(n == len(calc.structures)-1)),
+                dict(
+                    a=s[0], b=s[1], c=s[2], alpha=s[3], beta=s[4], gamma=s[5],
+                    a11=ase_repr.cell[0][0], a12=ase_repr.cell[0][1], a13=ase_repr.cell[0][2],
+                    a21=ase_repr.cell[1][0], a22=ase_repr.cell[1][1], a23=ase_repr.cell[1][2],
+                    a31=ase_repr.cell[2][0], a32=ase_repr.cell[2][1], a33=ase_repr.cell[2][2]
+                ),
+                atoms
+            ))
+
+        rows[model.Grid.__table__] = dict(checksum=checksum, info=json.dumps(calc.info))
+        if self.settings['grid_columns']:
+            columns = self._get_grid_columns(calc.info)
+            if columns:
+                rows[model.Grid_columns.__table__] = dict(checksum=checksum, **columns)
+
+        record['topics'] = set((x.cid, str(x.topic)) for x in self._get_topics(calc))
+        return record
+
+    def _reserve_struct_ids(self, session, count):
+        if session.bind.dialect.name == 'postgresql':
+            return [i[0] for i in session.execute("SELECT nextval('structures_struct_id_seq') FROM generate_series(1, %s)" % count)]
+
+        # NB this relies on a single writer, as SQLite has
+        last = session.query(func.max(model.Structure.struct_id)).scalar() or 0
+        return list(range(last + 1, last + count + 1))
+
+    def _write_records(self, session, records, output):
+        '''
+        Writes the prepared records in a single transaction;
+        in case of failure retries them one by one
+        to assign the errors to the particular checksums
+        '''
+        try:
+            uniques = {}
+            for record in records:
+                for key, cls, kw in [
+                    ('framework', model.Codefamily, {'content': record['framework']}),
+                    ('prog', model.Codeversion, {'content': record['prog']}),
+                    ('H', model.Pottype, {'name': record['H']})
+                ]:
+                    if (cls, record[key]) not in uniques:
+                        uniques[(cls, record[key])] = cls.as_unique(session, **kw)
+                for cid, topic in record['topics']:
+                    if (model.Topic, cid, topic) not in uniques:
+                        uniques[(model.Topic, cid, topic)] = model.Topic.as_unique(session, cid=cid, topic=topic)
+            session.flush()
+
+            for record in records:
+                codeversion = uniques[(model.Codeversion, record['prog'])]
+                codeversion.family_id = uniques[(model.Codefamily, record['framework'])].family_id
+            session.flush()
+
+            struct_ids = iter(self._reserve_struct_ids(session, sum(len(record['structures']) for record in records)))
+
+            atoms_table = model.Packed_atoms.__table__ if self.settings['atoms_storage'] == 'packed' else model.Atom.__table__
+            tables = {model.Calculation.__table__: [], model.Spectra.__table__: [], model.Structure.__table__: [], model.Lattice.__table__: [], atoms_table: [], model.tags: []}
+            for record in records:
+                tables[model.Calculation.__table__].append(dict(checksum=record['checksum'], pottype_id=uniques[(model.Pottype, record['H'])].pottype_id))
+                record['rows'][model.Metadata.__table__]['version_id'] = uniques[(model.Codeversion, record['prog'])].version_id
+
+                for table, row in record['rows'].items():
+                    tables.setdefault(table, []).append(row)
+
+                for row in record['spectra']:
+                    spectrum = dict(checksum=record['checksum'], dos=None, bands=None, projected=None, eigenvalues=None)
+                    spectrum.update(row)
+                    tables[model.Spectra.__table__].append(spectrum)
+
+                for struct, lattice, atoms in record['structures']:
+                    struct['struct_id'] = lattice['struct_id'] = next(struct_ids)
+                    tables[model.Structure.__table__].append(struct)
+                    tables[model.Lattice.__table__].append(lattice)
+                    for atom in atoms:
+                        atom['struct_id'] = struct['struct_id']
+                    tables[atoms_table] += atoms
+
+                for cid, topic in record['topics']:
+                    tables[model.tags].append(dict(checksum=record['checksum'], tid=uniques[(model.Topic, cid, topic)].tid))
+
+            # NB parent tables go first
+            for table in model.Base.metadata.sorted_tables:
+                if tables.get(table):
+                    session.execute(table.insert(), tables[table])
+
+            self._update_facets(session, [record['checksum'] for record in records], [row['tid'] for row in tables[model.tags]])
+
+            session.commit()
+
+        except Exception as ex:
+            session.rollback()
+            if len(records) > 1:
+                for record in records:
+                    self._write_records(session, [record], output)
+                return
+            output[records[0]['n']] = (None, "Cannot save: %s" % ex)
+
+        else:
+            self._written()
+            for record in records:
+                output[record['n']] = (record['checksum'], None)
+
+    def get_facets(self, session):
+        '''
+        Reads the facet summary (built at once for the databases lacking it)
+        NB: this is the PUBLIC method
+        @returns [(tid, cid, topic), ...] ordered by topic, {cid: (min, max), ...}
+        '''
+        if not session.query(model.Topic_count.tid).first() and session.query(model.Calculation.checksum).first():
+            self.refresh_facets(session) # the DB was filled before the summary was introduced
+
+        topics = session.query(model.Topic.tid, model.Topic.cid, model.Topic.topic) \
+        .join(model.Topic_count, model.Topic_count.tid == model.Topic.tid) \
+        .filter(model.Topic_count.count > 0) \
+        .order_by(model.Topic.topic).all()
+
+        sliders = dict((cid, (minimum, maximum)) for cid, minimum, maximum in session.query(model.Slider_range.cid, model.Slider_range.minimum, model.Slider_range.maximum).all())
+        return topics, sliders
+
+    def refresh_facets(self, session):
+        '''
+        Rebuilds the facet summary from scratch
+        NB: this is the PUBLIC method
+        @procedure
+        '''
+        self._rebuild_facets(session)
+        session.commit()
+
+    def _rebuild_facets(self, session):
+        session.execute( model.delete( model.Topic_count ) )
+        session.execute( model.delete( model.Slider_range ) )
+        session.flush()
+        counts = [dict(tid=tid, count=count) for tid, count in session.query(model.tags.c.tid, func.count(model.tags.c.checksum)).group_by(model.tags.c.tid).all()]
+        if counts:
+            session.execute(model.Topic_count.__table__.insert(), counts)
+        self._extend_sliders(session)
+
+    def _update_facets(self, session, checksums, tids, delta=1, sliders=True):
+        '''
+        Updates the facet summary incrementally with the calcs added (delta=1) or deleted (delta=-1),
+        unless the summary is missing for the other calcs: then it is rebuilt
+        @returns True if updated incrementally
+        '''
+        if not session.query(model.Topic_count.tid).first() and \
+            session.query(model.Calculation.checksum).filter(~model.Calculation.checksum.in_(checksums)).first():
+            self._rebuild_facets(session)
+            return False
+
+        self._count_topics(session, tids, delta)
+        if sliders and delta > 0:
+            self._extend_sliders(session, checksums)
+        return True
+
+    def _count_topics(self, session, tids, delta=1):
+        '''
+        Updates the numbers of calcs per topic
+        '''
+        table = model.Topic_count.__table__
+        increments = {}
+        for tid in tids:
+            increments[tid] = increments.get(tid, 0) + delta
+
+        for tid, increment in increments.items():
+            if not session.execute(table.update().where(table.c.tid == tid).values(count=table.c.count + increment)).rowcount and increment > 0:
+                session.execute(table.insert(), [dict(tid=tid, count=increment)])
+        if delta < 0:
+            session.execute(table.delete().where(table.c.count <= 0))
+
+    def _get_slider_range(self, session, entity, checksums=None):
+        '''
+        @returns min, max of the slider table field (for the given calcs only, if any)
+        '''
+        cls, attr = entity['has_slider'].split('.')
+        orm_inst = getattr(getattr(model, cls), attr)
+        query = session.query(func.min(orm_inst), func.max(orm_inst))
+
+        if cls == 'Lattice':
+            # Lattice objects require special join clause
+            query = query.filter(model.Lattice.struct_id == model.Structure.struct_id, model.Structure.final == True)
+            orm_checksum = model.Structure.checksum
+        else:
+            orm_checksum = getattr(model, cls).checksum
+
+        if checksums is not None:
+            query = query.filter(orm_checksum.in_(checksums))
+        return query.one()
+
+    def _extend_sliders(self, session, checksums=None, entities=None):
+        '''
+        Extends the slider ranges with the values of the given calcs (all calcs by default)
+        '''
+        for entity in entities or self.hierarchy:
+            if not entity.get('has_slider'):
+                continue
+
+            minimum, maximum = self._get_slider_range(session, entity, checksums)
+            if minimum is None or maximum is None:
+                continue
+
+            slider = session.query(model.Slider_range).get(entity['cid'])
+            if slider:
+                slider.minimum, slider.maximum = min(slider.minimum, minimum), max(slider.maximum, maximum)
+            else:
+                session.add(model.Slider_range(cid=entity['cid'], minimum=minimum, maximum=maximum))
+
+    def _written(self):
+        for callback in self.write_callbacks:
+            callback()
+
+    def get_atoms(self, session, checksum, step=None):
+        '''
+        Restores the stored structure of calc as ASE object
+        regardless of the atoms storage (packed or one row per atom);
+        the packed structure is fetched in a single row
+        NB: this is the PUBLIC method
+        @returns ASE object of the given step (the final one by default) or None
+        '''
+        clauses = [model.Structure.checksum == checksum]
+        clauses.append(model.Structure.final == True if step is None else model.Structure.step == step)
+        try:
+            struct_id, content = session.query(model.Structure.struct_id, model.Packed_atoms.content) \
+            .outerjoin(model.Packed_atoms, model.Packed_atoms.struct_id == model.Structure.struct_id) \
+            .filter(*clauses).one()
+        except NoResultFound:
+            return None
+
+        if content is not None:
+            return unpack_atoms(content)
+
+        lattice = session.query(model.Lattice).filter(model.Lattice.struct_id == struct_id).one()
+        cell = [[lattice.a11, lattice.a12, lattice.a13], [lattice.a21, lattice.a22, lattice.a23], [lattice.a31, lattice.a32, lattice.a33]]
+        numbers, positions, charges, magmoms = [], [], [], []
+        for number, x, y, z, charge, magmom in session.query(model.Atom.number, model.Atom.x, model.Atom.y, model.Atom.z, model.Atom.charge, model.Atom.magmom) \
+            .filter(model.Atom.struct_id == struct_id).order_by(model.Atom.atom_id).all():
+            numbers.append(number)
+            positions.append([x, y, z])
+            charges.append(charge)
+            magmoms.append(magmom)
+
+        ase_obj = Atoms(numbers=numbers, positions=positions, cell=cell, pbc=True)
+        for prop, values in [('charges', charges), ('magmoms', magmoms)]:
+            if any(value is not None for value in values):
+                ase_obj.set_array(prop, array(values, dtype=float)) # NB None becomes NaN
+        return ase_obj
+
     def purge(self, session, checksum):
         '''
         Deletes calc entry by checksum entirely from the database
@@ -781,6 +1429,10 @@ class TildeAPI:
         if not C:
             return 'Calculation does not exist!'
 
+        # facet summary to be updated
+        tids = [i[0] for i in session.query(model.tags.c.tid).filter(model.tags.c.checksum == checksum).all()]
+        slider_values = [(entity, self._get_slider_range(session, entity, [checksum])) for entity in self.hierarchy if entity.get('has_slider')]
+
         # dataset deletion includes editing the whole dataset hierarchical tree (if any)
         if C.siblings_count:
             C_meta = session.query(model.Metadata).get(checksum)
@@ -824,6 +1476,7 @@ class TildeAPI:
             struct_ids = [ int(i[0]) for i in session.query(model.Structure.struct_id).filter(model.Structure.checksum == checksum).all() ]
             for struct_id in struct_ids:
                 session.execute( model.delete( model.Atom ).where( model.Atom.struct_id == struct_id ) )
+                session.execute( model.delete( model.Packed_atoms ).where( model.Packed_atoms.struct_id == struct_id ) )
                 session.execute( model.delete( model.Lattice ).where( model.Lattice.struct_id == struct_id ) )
             session.execute( model.delete( model.Structure ).where( model.Structure.checksum == checksum ) )
 
@@ -844,12 +1497,27 @@ class TildeAPI:
         session.execute( model.delete( model.Metadata ).where( model.Metadata.checksum == checksum ) )
 
         session.execute( model.delete( model.Grid ).where( model.Grid.checksum == checksum ) )
+        session.execute( model.delete( model.Grid_columns ).where( model.Grid_columns.checksum == checksum ) )
+        session.execute( model.delete( model.Sourcefile ).where( model.Sourcefile.checksums.like('%%"%s"%%' % checksum) ) )
         session.execute( model.delete( model.tags ).where( model.tags.c.checksum == checksum ) )
 
         session.execute( model.delete( model.calcsets ).where( model.calcsets.c.children_checksum == checksum ) )
         session.execute( model.delete( model.calcsets ).where( model.calcsets.c.parent_checksum == checksum ) )
         session.execute( model.delete( model.Calculation ).where( model.Calculation.checksum == checksum ) )
+
+        if self._update_facets(session, [checksum], tids, -1):
+            # slider range is re-evaluated only if the deleted value was at its boundary
+            for entity, (minimum, maximum) in slider_values:
+                if minimum is None:
+                    continue
+                slider = session.query(model.Slider_range).get(entity['cid'])
+                if slider and (minimum <= slider.minimum or maximum >= slider.maximum):
+                    session.delete(slider)
+                    session.flush()
+                    self._extend_sliders(session, None, [entity])
+
         session.commit()
+        self._written()
         # NB tables topics, codefamily, codeversion, pottype are mostly irrelevant and, if needed, should be cleaned manually
         return False
 
@@ -984,14 +1652,24 @@ class TildeAPI:
         info_obj['standard'] = info_obj['standard'][0] # TODO
         parent_grid.info = json.dumps(info_obj)
 
+        # the typed values follow the merged info, the lists do not fit
+        session.execute( model.delete( model.Grid_columns ).where( model.Grid_columns.checksum == parent ) )
+        if self.settings['grid_columns']:
+            columns = self._get_grid_columns(info_obj)
+            if columns:
+                session.add(model.Grid_columns(checksum=parent, **columns))
+
         # tags ORM
+        existing_tids, added_topics = set(x.tid for x in parent_calc.uitopics), []
         for entity in self.hierarchy:
 
             if not entity['creates_topic']:
                 continue
 
             for item in info_obj.get( entity['source'], [] ):
-                parent_calc.uitopics.append( model.Topic.as_unique(session, cid=entity['cid'], topic="%s" % item) )
+                topic = model.Topic.as_unique(session, cid=entity['cid'], topic="%s" % item)
+                parent_calc.uitopics.append(topic)
+                added_topics.append(topic)
 
         for child in session.query(model.Calculation).filter(model.Calculation.checksum.in_(filtered_addendum)).all():
             parent_calc.children.append(child)
@@ -1008,7 +1686,11 @@ class TildeAPI:
                 session.add(member)
 
         session.add_all([parent_calc, parent_meta, parent_grid])
+        session.flush()
+        self._update_facets(session, [parent], set(x.tid for x in added_topics) - existing_tids, sliders=False)
+
         session.commit()
+        self._written()
         return False
 
 
@@ -4,7 +4,10 @@
 
 import math
 import re
+import io
 
+import numpy as np
+from ase.atoms import Atoms
 from ase.geometry import cell_to_cellpar
 
 
@@ -156,3 +159,31 @@ def write_cif(filename, structure, comment=None):
         file.close()
     except IOError: return False
     else: return True
+
+def pack_atoms(ase_obj):
+    '''
+    Packs ASE object (with the charges and magmoms arrays, if any)
+    into the compressed npz bytes, see model.Packed_atoms
+    '''
+    arrays = {
+        'numbers': ase_obj.get_atomic_numbers().astype(np.uint8),
+        'positions': np.asarray(ase_obj.get_positions(), dtype=np.float64),
+        'cell': np.asarray(ase_obj.cell, dtype=np.float64)
+    }
+    for prop in ['charges', 'magmoms']:
+        if prop in ase_obj.arrays:
+            arrays[prop] = np.array(ase_obj.get_array(prop), dtype=np.float64) # NB None becomes NaN
+    buff = io.BytesIO()
+    np.savez_compressed(buff, **arrays)
+    return buff.getvalue()
+
+def unpack_atoms(content):
+    '''
+    Restores ASE object packed by pack_atoms
+    '''
+    with np.load(io.BytesIO(content)) as arrays:
+        ase_obj = Atoms(numbers=arrays['numbers'], positions=arrays['positions'], cell=arrays['cell'], pbc=True)
+        for prop in ['charges', 'magmoms']:
+            if prop in arrays:
+                ase_obj.set_array(prop, arrays[prop])
+    return ase_obj
@@ -0,0 +1,80 @@
+
+# Array routines over the atomic structures, shared by the classifiers,
+# so that the per-atom work is done by numpy rather than in Python loops
+
+import math
+
+import numpy as np
+
+from ase.data import chemical_symbols, covalent_radii
+
+from tilde.core.constants import Perovskite_Structure
+
+
+ATOMIC_NUMBERS = dict((symbol, number) for number, symbol in enumerate(chemical_symbols))
+
+def get_numbers(symbols):
+    '''
+    @returns array of atomic numbers, X being 0
+    '''
+    return np.array([ATOMIC_NUMBERS[symbol] for symbol in symbols], dtype=int)
+
+def get_radii(symbols):
+    '''
+    @returns array of covalent radii
+    '''
+    return covalent_radii[get_numbers(symbols)]
+
+def get_atoms_volume(ase_obj, r_EC=0.0):
+    '''
+    @returns total volume of the atomic spheres of covalent radii increased by r_EC
+    '''
+    return 4/3 * math.pi * np.sum((covalent_radii[ase_obj.get_atomic_numbers()] + r_EC) ** 3)
+
+def get_projection(ase_obj, axis, skip=('X',)):
+    '''
+    Atoms sorted by their coordinate along the axis (stable for the equal ones)
+    @returns (symbols, coordinates) of the sorted atoms
+    '''
+    symbols = np.array(ase_obj.get_chemical_symbols())
+    coords = ase_obj.positions[:, axis]
+    if skip:
+        kept = ~np.in1d(symbols, list(skip))
+        symbols, coords = symbols[kept], coords[kept]
+    order = np.argsort(coords, kind='mergesort')
+    return symbols[order].tolist(), coords[order]
+
+def get_layers(coords, threshold):
+    '''
+    Clusters the sorted coordinates into layers split by the gaps larger than threshold
+    @returns array of layer indices
+    '''
+    if not len(coords):
+        return np.zeros(0, dtype=int)
+    return np.concatenate([[0], np.cumsum(np.diff(coords) > threshold)])
+
+
+# Goldschmidt tolerance factor
+# t = (rA + rC) / sqrt(2) * (rB + rC)
+# for all the combinations of perovskite sites
+A_INDICES = dict((symbol, n) for n, symbol in enumerate(Perovskite_Structure.A))
+B_INDICES = dict((symbol, n) for n, symbol in enumerate(Perovskite_Structure.B))
+C_INDICES = dict((symbol, n) for n, symbol in enumerate(Perovskite_Structure.C))
+
+def _get_goldschmidt_factors(A_site, B_site, C_site):
+    rA = get_radii(A_site)[:, np.newaxis, np.newaxis]
+    rB = get_radii(B_site)[np.newaxis, :, np.newaxis]
+    rC = get_radii(C_site)[np.newaxis, np.newaxis, :]
+    return (rA + rC) / (math.sqrt(2) * (rB + rC))
+
+GOLDSCHMIDT_FACTORS = _get_goldschmidt_factors(Perovskite_Structure.A, Perovskite_Structure.B, Perovskite_Structure.C)
+
+def get_goldschmidt_factors(A_site, B_site, C_site):
+    '''
+    @returns (A, B, C)-shaped array of the tolerance factors,
+    taken from the precomputed matrix for the perovskite site elements
+    '''
+    try:
+        return GOLDSCHMIDT_FACTORS[np.ix_([A_INDICES[e] for e in A_site], [B_INDICES[e] for e in B_site], [C_INDICES[e] for e in C_site])]
+    except KeyError:
+        return _get_goldschmidt_factors(A_site, B_site, C_site)
@@ -9,7 +9,7 @@ import six
 
 from tilde.core.orm_tools import UniqueMixin, get_or_create, correct_topics
 
-from sqlalchemy import and_, or_, Index, UniqueConstraint, MetaData, String, UnicodeText, Table, Column, Boolean, Float, Integer, BigInteger, Enum, Text, Date, DateTime, ForeignKey
+from sqlalchemy import and_, or_, Index, UniqueConstraint, MetaData, String, UnicodeText, Table, Column, Boolean, Float, Integer, BigInteger, LargeBinary, Enum, Text, Date, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.ext.declarative import DeclarativeMeta, declarative_base
@@ -96,11 +96,39 @@ tags = Table('tags', Base.metadata,
 
 tag = namedtuple('tag', ['checksum', 'tid'])
 
+# facet summary maintained by API on the data changes, see API.get_facets
+class Topic_count(Base):
+    __tablename__ = 'topic_counts'
+    tid = Column(Integer, ForeignKey('topics.tid'), primary_key=True)
+    count = Column(Integer, nullable=False)
+
+class Slider_range(Base):
+    __tablename__ = 'slider_ranges'
+    cid = Column(Integer, primary_key=True)
+    minimum = Column(Float, nullable=False)
+    maximum = Column(Float, nullable=False)
+
 class Grid(Base):
     __tablename__ = 'grid'
     checksum = Column(String, ForeignKey('calculations.checksum'), primary_key=True)
     info = Column(JSONString, default=None)
 
+class Grid_columns(Base):
+    '''
+    The most used Grid.info values as the typed columns (optional, see grid_columns setting),
+    a calc lacks this row if any of these values is not of the column type
+    '''
+    __tablename__ = 'grid_columns'
+    checksum = Column(String, ForeignKey('calculations.checksum'), primary_key=True)
+    formula = Column(String, default=None, index=True)
+    standard = Column(String, default=None, index=True)
+    energy = Column(Float, default=None, index=True)
+    bandgap = Column(Float, default=None, index=True)
+    ng = Column(Integer, default=None, index=True)
+    natom = Column(Integer, default=None, index=True)
+
+GRID_COLUMNS = {'formula': six.string_types, 'standard': six.string_types, 'energy': float, 'bandgap': float, 'ng': six.integer_types, 'natom': six.integer_types}
+
 calcsets = Table('calcsets', Base.metadata,
     Column('parent_checksum', String, ForeignKey('calculations.checksum'), primary_key=True),
     Column('children_checksum', String, ForeignKey('calculations.checksum'), primary_key=True),
@@ -130,6 +158,7 @@ class Calculation(Base):
     phonons = relationship("Phonons", uselist=False)
     forces = relationship("Forces", uselist=False)
     uigrid = relationship("Grid", uselist=False)
+    uigrid_columns = relationship("Grid_columns", uselist=False)
     uitopics = relationship("Topic", backref="calculations", secondary=tags)
     references = relationship("Reference", backref="calculations", secondary="metadata_references")
 
@@ -243,6 +272,7 @@ class Structure(Base):
     #struct_checksum = Column(String, nullable=False)
     lattice = relationship("Lattice", uselist=False)
     atoms = relationship("Atom")
+    packed_atoms = relationship("Packed_atoms", uselist=False)
 
 class Lattice(Base):
     __tablename__ = 'lattices'
@@ -275,6 +305,12 @@ class Atom(Base):
     magmom = Column(Float, default=None)
     rmt = Column(Float, default=None)
 
+class Packed_atoms(Base):
+    __tablename__ = 'packed_atoms'
+    struct_id = Column(Integer, ForeignKey('structures.struct_id'), primary_key=True)
+    natom = Column(Integer, nullable=False)
+    content = Column(LargeBinary, nullable=False) # compressed npz, see common.pack_atoms
+
 class Spacegroup(Base):
     __tablename__ = 'spacegroups'
     checksum = Column(String, ForeignKey('calculations.checksum'), primary_key=True)
@@ -294,3 +330,11 @@ class Struct_optimisation(Base):
     checksum = Column(String, ForeignKey('calculations.checksum'), primary_key=True)
     tresholds = Column(JSONString, default=None)
     ncycles = Column(JSONString, default=None)
+
+class Sourcefile(Base):
+    __tablename__ = 'sourcefiles'
+    path = Column(String, primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    mtime = Column(Float, nullable=False)
+    parser = Column(String, default=None) # None for unsupported files
+    checksums = Column(JSONString, default=None)
@@ -3,34 +3,98 @@
 # Idea by Fawzi Mohamed
 # Author: Evgeny Blokhin
 
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+
+_process_cache = None # {db url: {(cls, hash): column values}}, disabled by default
+
+def use_process_cache(enabled=True):
+    '''
+    Shares the identities of the unique objects between the sessions of the process;
+    NB this is safe only if these objects are not deleted by the others meanwhile
+    '''
+    global _process_cache
+    _process_cache = {} if enabled else None
+
 class UniqueMixin(object):
+    @classmethod
+    def unique_hash(cls, *arg, **kw):
+        return arg + tuple(sorted(kw.items()))
+
     @classmethod
     def unique_filter(cls, query, *arg, **kw):
         raise NotImplementedError()
 
     @classmethod
     def as_unique(cls, session, *arg, **kw):
-        return _unique(session, cls, cls.unique_filter, cls, arg, kw)
+        return _unique(session, cls, cls.unique_hash, cls.unique_filter, cls, arg, kw)
 
     @classmethod
     def as_unique_todict(cls, session, *arg, **kw):
         return _unique_todict(session, cls, cls.unique_filter, arg, kw)
 
-def _unique(session, cls, queryfunc, constructor, arg, kw):
+def _unique(session, cls, hashfunc, queryfunc, constructor, arg, kw):
     '''
     https://bitbucket.org/zzzeek/sqlalchemy/wiki/UsageRecipes/UniqueObject
     Checks if ORM entity exists according to criteria,
     if yes, returns it, if no, creates
+    The identities are cached: the objects themselves until the end of transaction,
+    their committed column values until rollback (per session and optionally per process)
     '''
-    with session.no_autoflush:
-        q = session.query(cls)
-        q = queryfunc(q, *arg, **kw)
-        obj = q.first()
-        if not obj:
-            obj = constructor(*arg, **kw)
-            session.add(obj)
+    key = (cls, hashfunc(*arg, **kw))
+    objects = session.info.setdefault('unique_objects', {})
+    if key in objects:
+        return objects[key]
+
+    session.info['unique_url'] = str(session.get_bind(cls).url)
+    state = session.info.get('unique_states', {}).get(key)
+    if state is None and _process_cache is not None:
+        state = _process_cache.get(session.info['unique_url'], {}).get(key)
+
+    if state is not None:
+        obj = cls(**state)
+        make_transient_to_detached(obj)
+        obj = session.merge(obj, load=False) # NB no SELECT
+    else:
+        with session.no_autoflush:
+            q = session.query(cls)
+            q = queryfunc(q, *arg, **kw)
+            obj = q.first()
+            if not obj:
+                obj = constructor(*arg, **kw)
+                session.add(obj)
+
+    objects[key] = obj
     return obj
 
+@event.listens_for(Session, 'before_commit')
+def _stage_unique(session, *arg):
+    staged = session.info.setdefault('unique_staged', {})
+    for key, obj in session.info.get('unique_objects', {}).items():
+        state = inspect(obj)
+        columns = [attr.key for attr in state.mapper.column_attrs]
+        if not state.has_identity or not all(column in state.dict for column in columns):
+            continue
+        staged[key] = dict((column, state.dict[column]) for column in columns)
+
+event.listen(Session, 'after_flush_postexec', _stage_unique) # NB new objects get their ids here
+
+@event.listens_for(Session, 'after_commit')
+def _promote_unique(session):
+    staged = session.info.pop('unique_staged', {})
+    session.info.pop('unique_objects', None) # NB expired now
+    session.info.setdefault('unique_states', {}).update(staged)
+    if _process_cache is not None and staged:
+        _process_cache.setdefault(session.info['unique_url'], {}).update(staged)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_unique(session, previous_transaction):
+    for item in ['unique_objects', 'unique_staged', 'unique_states']:
+        session.info.pop(item, None)
+    if _process_cache is not None:
+        _process_cache.pop(session.info.get('unique_url'), None)
+
 def _unique_todict(session, cls, queryfunc, arg, kw):
     '''
     Checks if ORM entity exists according to criteria,
@@ -0,0 +1,77 @@
+
+# Classifiers pipeline: every classifier declares the info keys it reads and writes
+# (__reads__ and __writes__, the names ending with * match by prefix)
+# and optionally an applicability predicate (applies function),
+# so that the classifiers are ordered as a dependency graph and the irrelevant ones are skipped;
+# a classifier declaring nothing depends on all the preceding ones and vice versa
+
+import sys
+import time
+import traceback
+
+
+def overlap(keys, other_keys):
+    '''
+    @returns True if any of the keys may denote the same info item
+    '''
+    if keys is None or other_keys is None:
+        return True
+    for key in keys:
+        for other_key in other_keys:
+            if key == other_key or \
+            key.endswith('*') and other_key.startswith(key[:-1]) or \
+            other_key.endswith('*') and key.startswith(other_key[:-1]):
+                return True
+    return False
+
+def depends(later, earlier):
+    '''
+    The later classifier must wait for the earlier one
+    if it reads what the earlier writes, or writes what the earlier reads or writes
+    '''
+    return overlap(later['reads'], earlier['writes']) or overlap(later['writes'], earlier['reads']) or overlap(later['writes'], earlier['writes'])
+
+
+class ClassifierPipeline:
+    def __init__(self, classifiers):
+        '''
+        classifiers are the dicts with classify, applies, order, class, reads and writes,
+        NB the order (and then the name) decides on which of the dependent classifiers goes first
+        '''
+        self.classifiers = sorted(classifiers, key=lambda x: (x['order'], x['class']))
+        self.requires = {}
+        for n, classifier in enumerate(self.classifiers):
+            self.requires[classifier['class']] = [earlier['class'] for earlier in self.classifiers[:n] if depends(classifier, earlier)]
+        self.stages = self.get_stages()
+
+    def get_stages(self):
+        '''
+        @returns list of lists of the classifiers, not depending on each other within a list
+        '''
+        level = {}
+        for classifier in self.classifiers:
+            level[classifier['class']] = max([level[name] + 1 for name in self.requires[classifier['class']]] or [0])
+
+        stages = [[] for _ in range(max(level.values()) + 1 if level else 0)]
+        for classifier in self.classifiers:
+            stages[ level[classifier['class']] ].append(classifier)
+        return stages
+
+    def run(self, calc):
+        '''
+        Applies the classifiers stage by stage,
+        the time of every applied one is kept in calc.timings
+        @returns tilde_obj, error
+        '''
+        for stage in self.stages:
+            for classifier in stage:
+                starttime = time.time()
+                try:
+                    if classifier['applies'] and not classifier['applies'](calc):
+                        continue
+                    calc = classifier['classify'](calc)
+                except:
+                    exc_type, exc_value, exc_tb = sys.exc_info()
+                    return None, "Fatal error during classification:\n %s" % "".join(traceback.format_exception( exc_type, exc_value, exc_tb ))
+                calc.timings['classify.' + classifier['class']] = time.time() - starttime
+        return calc, None
@@ -0,0 +1,64 @@
+
+# Parallel parsing and classification:
+# every worker process holds its own API instance,
+# the results are yielded back in the order of tasks,
+# so that a single consumer (owning the DB session) may save them
+
+import multiprocessing
+from collections import deque
+
+
+_worker = None # API instance of a worker process
+
+def _init_worker(settings):
+    global _worker
+    from tilde.core.api import API
+    _worker = API(settings)
+
+def _process(task, symprec):
+    results = []
+    for calc, error in scan_task(_worker, task, symprec):
+        if calc:
+            calc.data = '' # raw contents are not needed anymore, do not pickle them
+        results.append((calc, error))
+    return task, results
+
+def scan_task(work, task, symprec=None):
+    '''
+    Parses and classifies a single file
+    @returns iterator over (tilde_obj, error)
+    '''
+    for calc, error in work.parse(task):
+        if not error:
+            calc, error = work.classify(calc, symprec)
+        yield calc, error
+
+def scan(work, tasks, symprec=None, processes=1, window=None):
+    '''
+    Parses and classifies the files either serially
+    or in a pool of processes; the pending results are limited by window
+    @returns iterator over (task, [(tilde_obj, error), ...]) in the order of tasks
+    '''
+    if processes < 2:
+        for task in tasks:
+            yield task, scan_task(work, task, symprec)
+        return
+
+    window = window or 2 * processes
+    # NB scripts like entry.py have no __main__ guard, so spawning must be avoided
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing
+    pool = context.Pool(processes, initializer=_init_worker, initargs=(work.settings,))
+    pending = deque()
+    try:
+        for task in tasks:
+            pending.append(pool.apply_async(_process, (task, symprec)))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
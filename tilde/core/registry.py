@@ -0,0 +1,111 @@
+
+# Snapshot of the hierarchy and of the plugins (parsers, apps, connectors, classifiers)
+# cached on disk in order to construct API without DB queries and plugin imports;
+# the plugins are then imported lazily, at their first use
+
+import os
+import json
+import hashlib
+import importlib
+
+from tilde import __version__
+from tilde.core.settings import BASE_DIR, DATA_DIR, INIT_DATA, DB_SCHEMA_VERSION, connect_url
+
+
+REGISTRY_PATH = os.path.join(DATA_DIR, 'registry.json')
+PLUGIN_DIRS = ['parsers', 'apps', 'connectors', 'classifiers']
+
+class LazyPlugin:
+    '''
+    Stands for a plugin class or function,
+    the static attributes are known in advance,
+    the module is imported at the first access to anything else
+    '''
+    def __init__(self, module, name, attrs=None):
+        self._module = module
+        self._name = name
+        self._target = None
+        self.__dict__.update(attrs or {})
+
+    def _resolve(self):
+        if self._target is None:
+            target = importlib.import_module(self._module)
+            for name in self._name.split('.'):
+                target = getattr(target, name)
+            self._target = target
+        return self._target
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'): # NB to not recurse while copying or pickling
+            raise AttributeError(attr)
+        return getattr(self._resolve(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return '<lazy %s.%s>' % (self._module, self._name)
+
+
+def get_registry_key(settings):
+    '''
+    The snapshot is valid until the code version, DB schema,
+    hierarchy init data, DB or plugin files are changed
+    NB the hierarchy edited directly in DB is not tracked, remove the snapshot then
+    '''
+    key = [__version__, DB_SCHEMA_VERSION, connect_url(settings), bool(settings.get('no_parse')), bool(settings['debug_regime'])]
+
+    with open(INIT_DATA, 'rb') as f:
+        key.append(hashlib.sha224(f.read()).hexdigest())
+
+    for folder in PLUGIN_DIRS:
+        path = os.path.realpath(os.path.join(BASE_DIR, '..', folder))
+        for entry in sorted(os.listdir(path)):
+            if entry == '__pycache__':
+                continue
+            entry = os.path.join(path, entry)
+            if os.path.isdir(entry):
+                for item in sorted(os.listdir(entry)):
+                    if item.endswith('.py') or item == 'manifest.json':
+                        key.append([entry + os.sep + item, os.stat(entry + os.sep + item).st_mtime])
+            elif entry.endswith('.py'):
+                key.append([entry, os.stat(entry).st_mtime])
+
+    return hashlib.sha224(json.dumps(key).encode('utf-8')).hexdigest()
+
+def load_registry(key):
+    '''
+    @returns snapshot dict if it is up-to-date
+    @returns None otherwise
+    '''
+    try:
+        with open(REGISTRY_PATH) as f:
+            snapshot = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if snapshot.get('key') != key:
+        return None
+
+    # NB JSON keys are always strings
+    snapshot['hierarchy_values'] = dict(
+        (int(cid), dict((int(num), name) for num, name in values.items())) for cid, values in snapshot['hierarchy_values'].items()
+    )
+    return snapshot
+
+def save_registry(key, snapshot):
+    '''
+    Stores the snapshot atomically, no error is raised if the data dir is not writable
+    @returns True on success
+    @returns False on failure
+    '''
+    snapshot = dict(snapshot, key=key)
+    tmp_path = '%s.%s' % (REGISTRY_PATH, os.getpid())
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, REGISTRY_PATH)
+    except (IOError, OSError):
+        return False
+    else:
+        return True
@@ -3,10 +3,12 @@
 # Author: Evgeny Blokhin
 
 import os, sys
+import re
 import json
 import logging
 
 from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.pool import QueuePool, NullPool
@@ -35,6 +37,11 @@ DEFAULT_SETUP = {
     'skip_unfinished': False,
     'skip_notenergy': False,
     'skip_if_path': [],
+    'trajectory': 'all', # optimisation steps to store: all, ends, every:K or energy:dE (in eV)
+    'atoms_storage': 'rows', # rows: one DB row per atom, packed: one compressed row per structure
+    'registry_cache': True, # keep the snapshot of hierarchy and plugins, see registry.py
+    'grid_columns': False, # also store the most used Grid.info values as the typed columns, see model.Grid_columns
+    'symmetry_cache': None, # file to keep the spglib results between runs, see symmetry.SymmetryCache
 
     # DB part
     'db': {
@@ -49,6 +56,9 @@ DEFAULT_SETUP = {
 
     # Server part
     'webport': 8070,
+    'server_mode': 'threads', # threads: all the actions in the thread pool, asyncio: the coroutine actions in the event loop, the rest in the thread pool, see asyncio_impl.py
+    'action_timeout': 60, # seconds, asyncio server mode only, NB the action run in a thread is only abandoned, not stopped, and keeps its thread and DB connection till the end
+    'action_timeouts': {}, # seconds per action name, overriding action_timeout, e.g. {"tags": 10}
     'title': "Tilde GUI"
 }
 
@@ -74,14 +84,22 @@ def connect_url(settings, named=None):
     else: sys.exit('Unsupported DB type: %s!\n' % settings['db']['engine'])
 
 
-def connect_database(settings, named=None, no_pooling=False, default_actions=True, scoped=False):
+def connect_database(settings, named=None, no_pooling=False, default_actions=True, scoped=False, pool_size=None):
     '''
+    **pool_size** bounds the number of connections shared by the threads
+    (the threads should then wait for the connections rather than open the new ones)
     @returns session factory on success
     @returns False on failure
     '''
     connstring = connect_url(settings, named)
-    poolclass = NullPool if no_pooling else QueuePool
-    engine = create_engine(connstring, echo=settings['debug_regime'], poolclass=poolclass)
+    if pool_size:
+        options = dict(poolclass=QueuePool, pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
+        if settings['db']['engine'] == 'sqlite':
+            options['connect_args'] = {'check_same_thread': False} # NB a connection is only used by one thread at a time
+        engine = create_engine(connstring, echo=settings['debug_regime'], **options)
+    else:
+        poolclass = NullPool if no_pooling else QueuePool
+        engine = create_engine(connstring, echo=settings['debug_regime'], poolclass=poolclass)
     Session = sessionmaker(bind=engine, autoflush=False)
 
     if default_actions:
@@ -135,6 +153,25 @@ def connect_database(settings, named=None, no_pooling=False, default_actions=Tru
     return Session()
 
 
+def check_database(settings):
+    '''
+    Cheap counterpart of the default actions of connect_database,
+    these are only done if the DB has no schema or hierarchy yet (or has another schema version)
+    @returns True if the default actions were done
+    '''
+    session = connect_database(settings, no_pooling=True, default_actions=False)
+    try:
+        ready = session.query(model.Pragma.content).scalar() == DB_SCHEMA_VERSION and session.query(model.Hierarchy_value).first() is not None
+    except DBAPIError:
+        ready = False
+    finally:
+        session.close()
+
+    if not ready:
+        connect_database(settings).close()
+    return not ready
+
+
 def write_settings(settings):
     '''
     Saves user's settings
@@ -242,6 +279,18 @@ except NameError:
 if settings['skip_if_path'] and len(settings['skip_if_path']) > 3:
     sys.exit('Path skipping directive must not contain more than 3 symbols due to memory limits')
 
+if settings['trajectory'] not in ['all', 'ends'] and not re.match(r'^(every:[1-9]\d*|energy:\d*\.?\d+(e-?\d+)?)$', settings['trajectory']):
+    sys.exit('Trajectory storage directive must be one of: all, ends, every:K, energy:dE')
+
+if settings['atoms_storage'] not in ['rows', 'packed']:
+    sys.exit('Atoms storage directive must be either rows or packed')
+
+if settings['server_mode'] not in ['threads', 'asyncio']:
+    sys.exit('Server mode directive must be either threads or asyncio')
+
+if not isinstance(settings['action_timeouts'], dict):
+    sys.exit('Action timeouts directive must map the action names to seconds')
+
 if not 'engine' in settings['db'] or settings['db']['engine'] not in ['sqlite', 'postgresql']:
     sys.exit('This DB backend is not supported')
 
@@ -1,8 +1,15 @@
-
 # *SymmetryFinder*: platform-independent symmetry finder, wrapping Spglib code
 # *SymmetryHandler*: symmetry inferences for 0D-, 1D-, 2D- and 3D-systems
+# *SymmetryCache*: Spglib results by the content of the structure
 # Author: Evgeny Blokhin
 
+import os
+import pickle
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+from numpy import ascontiguousarray
 from numpy.linalg import det
 
 from ase.atoms import Atoms
@@ -11,36 +18,212 @@ from ase.geometry import cell_to_cellpar
 import spglib as spg
 
 
+class SymmetryCache:
+    '''
+    Spglib results keyed by the hash of the cell, positions, numbers and tolerances,
+    as the same final geometry recurs in many calculations (restarts, property runs);
+    the recent results are kept in memory, and optionally on disk in an SQLite file,
+    shared by the worker processes
+    '''
+    def __init__(self, maxsize=10000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.items = OrderedDict()
+        self.hits, self.misses = 0, 0
+        self._db, self._pid = None, None
+
+    @staticmethod
+    def get_key(operation, atoms, symprec, angle_tolerance):
+        key = hashlib.sha1(operation.encode('ascii'))
+        key.update(repr((symprec, angle_tolerance)).encode('ascii'))
+        for array in (atoms.get_cell()[:], atoms.get_scaled_positions(), atoms.get_atomic_numbers()):
+            array = ascontiguousarray(array, dtype=float)
+            key.update(repr(array.shape).encode('ascii'))
+            key.update(array.tobytes())
+        return key.hexdigest()
+
+    def persist(self, path):
+        self.close()
+        self.path = path
+
+    def _connect(self):
+        # NB the connection is not inherited by the forked processes
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=30)
+            self._db.execute('CREATE TABLE IF NOT EXISTS symmetry (key TEXT PRIMARY KEY, value BLOB)')
+            self._pid = os.getpid()
+        return self._db
+
+    def get(self, key):
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            value = None
+            if self.path:
+                row = self._connect().execute('SELECT value FROM symmetry WHERE key = ?', (key,)).fetchone()
+                if row:
+                    value = pickle.loads(row[0])
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.items[key] = value
+        return value
+
+    def set(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+        if self.path:
+            db = self._connect()
+            db.execute('INSERT OR REPLACE INTO symmetry (key, value) VALUES (?, ?)', (key, sqlite3.Binary(pickle.dumps(value, protocol=2))))
+            db.commit()
+
+    def call(self, operation, atoms, symprec, angle_tolerance):
+        '''
+        @returns result of spglib operation, taken from cache if possible
+        @raises anything spglib raises (such results are not cached)
+        '''
+        key = self.get_key(operation, atoms, symprec, angle_tolerance)
+        value = self.get(key)
+        if value is None:
+            value = getattr(spg, operation)(atoms, symprec=symprec, angle_tolerance=angle_tolerance)
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def clear(self):
+        self.items.clear()
+        self.hits, self.misses = 0, 0
+
+    def close(self):
+        if self._db is not None and self._pid == os.getpid():
+            self._db.close()
+        self._db, self._pid = None, None
+
+def _by_number(ranges, size):
+    '''
+    @returns list indexed by the group number
+    '''
+    table = [None] * size
+    for first, last, value in ranges:
+        for number in range(first, last + 1):
+            table[number] = value
+    return table
+
+# Data below are taken from Table 2.3 of the book
+# Robert A. Evarestov, Quantum Chemistry of Solids,
+# LCAO Treatment of Crystals and Nanostructures, 2nd Edition,
+# Springer, 2012, http://dx.doi.org/10.1007/978-3-642-30356-2
+# NB 7 crystal systems != 7 lattice systems
+
+# space group to crystal system conversion
+CRYSTAL_SYSTEMS = _by_number([
+    (195, 230, 'cubic'),
+    (168, 194, 'hexagonal'),
+    (143, 167, 'trigonal'),
+    (75, 142, 'tetragonal'),
+    (16, 74, 'orthorhombic'),
+    (3, 15, 'monoclinic'),
+    (1, 2, 'triclinic')
+], 231)
+
+# space group to point group conversion
+POINT_GROUPS = _by_number([
+    (221, 230, 'O<sub>h</sub>'),
+    (215, 220, 'T<sub>d</sub>'),
+    (207, 214, 'O'),
+    (200, 206, 'T<sub>h</sub>'),
+    (195, 199, 'T'),
+    (191, 194, 'D<sub>6h</sub>'),
+    (187, 190, 'D<sub>3h</sub>'),
+    (183, 186, 'C<sub>6v</sub>'),
+    (177, 182, 'D<sub>6</sub>'),
+    (175, 176, 'C<sub>6h</sub>'),
+    (174, 174, 'C<sub>3h</sub>'),
+    (168, 173, 'C<sub>6</sub>'),
+    (162, 167, 'D<sub>3d</sub>'),
+    (156, 161, 'C<sub>3v</sub>'),
+    (149, 155, 'D<sub>3</sub>'),
+    (147, 148, 'C<sub>3i</sub>'),
+    (143, 146, 'C<sub>3</sub>'),
+    (123, 142, 'D<sub>4h</sub>'),
+    (111, 122, 'D<sub>2d</sub>'),
+    (99, 110, 'C<sub>4v</sub>'),
+    (89, 98, 'D<sub>4</sub>'),
+    (83, 88, 'C<sub>4h</sub>'),
+    (81, 82, 'S<sub>4</sub>'),
+    (75, 80, 'C<sub>4</sub>'),
+    (47, 74, 'D<sub>2h</sub>'),
+    (25, 46, 'C<sub>2v</sub>'),
+    (16, 24, 'D<sub>2</sub>'),
+    (10, 15, 'C<sub>2h</sub>'),
+    (6, 9, 'C<sub>s</sub>'),
+    (3, 5, 'C<sub>2</sub>'),
+    (2, 2, 'C<sub>i</sub>'),
+    (1, 1, 'C<sub>1</sub>')
+], 231)
+
+# space group to layer group conversion
+DIPERIODIC_MAPPING = {3:8, 4:9, 5:10, 6:11, 7:12, 8:13, 10:14, 11:15, 12:16, 13:17, 14:18, 16:19, 17:20, 18:21, 21:22, 25:23, 25:24, 26:25, 26:26, 27:27, 28:28, 28:29, 29:30, 30:31, 31:32, 32:33, 35:34, 38:35, 39:36, 47:37, 49:38, 50:39, 51:40, 51:41, 53:42, 54:43, 55:44, 57:45, 59:46, 65:47, 67:48, 75:49, 81:50, 83:51, 85:52, 89:53, 90:54, 99:55, 100:56, 111:57, 113:58, 115:59, 117:60, 123:61, 125:62, 127:63, 129:64, 143:65, 147:66, 149:67, 150:68, 156:69, 157:70, 162:71, 164:72, 168:73, 174:74, 175:75, 177:76, 183:77, 187:78, 189:79, 191:80}
+DIPERIODIC_OBLIQUE_MAPPING = dict(DIPERIODIC_MAPPING)
+DIPERIODIC_OBLIQUE_MAPPING.update({1:1, 2:2, 3:3, 6:4, 7:5, 10:6, 13:7})
+
+# layer group to 2d system conversion
+LAYER_SYSTEMS = _by_number([
+    (65, 80, '2d-hexagonal'),
+    (49, 64, '2d-square'),
+    (8, 48, '2d-rectangular'),
+    (1, 7, '2d-oblique')
+], 81)
+
+
 class SymmetryFinder:
     accuracy = 1e-04
+    cache = SymmetryCache()
 
-    def __init__(self, accuracy=None):
+    def __init__(self, accuracy=None, dataset=None):
+        '''
+        **dataset** may be given if already found, e.g. tilde_obj.symmetry set by classify
+        '''
         self.error = None
+        self.dataset = dataset
         self.accuracy=accuracy if accuracy else SymmetryFinder.accuracy
         self.angle_tolerance = -1
 
+    def get_dataset(self, tilde_obj):
+        '''
+        Space group number, Hall and international symbols, point group,
+        standardized cell, Wyckoff positions etc. of the last structure,
+        found by a single spglib call (or taken from cache)
+        @returns spglib dataset dict or None
+        '''
+        if self.dataset is None and not self.error:
+            try:
+                self.dataset = self.cache.call('get_symmetry_dataset', tilde_obj['structures'][-1], self.accuracy, self.angle_tolerance)
+            except Exception as ex:
+                self.error = 'Symmetry finder error: %s' % ex
+            else:
+                if self.dataset is None:
+                    self.error = 'Symmetry finder error (probably, coinciding atoms)'
+        return self.dataset
+
     def get_spacegroup(self, tilde_obj):
-        try:
-            symmetry = spg.get_spacegroup(tilde_obj['structures'][-1], symprec=self.accuracy, angle_tolerance=self.angle_tolerance)
-        except Exception as ex:
-            self.error = 'Symmetry finder error: %s' % ex
+        dataset = self.get_dataset(tilde_obj)
+        if dataset is None:
+            self.ng = 0
         else:
-            try:
-                self.sg, self.ng = symmetry.split()
-                self.ng = int(self.ng.strip("()"))
-            except (ValueError, IndexError, AttributeError):
-                self.ng = 0
-                self.error = 'Symmetry finder error (probably, coinciding atoms)'
+            self.sg, self.ng = dataset['international'], int(dataset['number'])
 
     def refine_cell(self, tilde_obj):
         '''
         NB only used for perovskite_tilting app
         '''
-        try: lattice, positions, numbers = spg.refine_cell(tilde_obj['structures'][-1], symprec=self.accuracy, angle_tolerance=self.angle_tolerance)
-        except Exception as ex:
-            self.error = 'Symmetry finder error: %s' % ex
-        else:
-            self.refinedcell = Atoms(numbers=numbers, cell=lattice, scaled_positions=positions, pbc=tilde_obj['structures'][-1].get_pbc())
+        dataset = self.get_dataset(tilde_obj)
+        if dataset is not None:
+            self.refinedcell = Atoms(numbers=dataset['std_types'], cell=dataset['std_lattice'], scaled_positions=dataset['std_positions'], pbc=tilde_obj['structures'][-1].get_pbc())
             self.refinedcell.periodicity = sum(self.refinedcell.get_pbc())
             self.refinedcell.dims = abs(det(tilde_obj['structures'][-1].cell))
 
@@ -67,68 +250,17 @@ class SymmetryHandler(SymmetryFinder):
         SymmetryFinder.__init__(self, accuracy)
         SymmetryFinder.get_spacegroup(self, tilde_obj)
 
-        # Data below are taken from Table 2.3 of the book
-        # Robert A. Evarestov, Quantum Chemistry of Solids,
-        # LCAO Treatment of Crystals and Nanostructures, 2nd Edition,
-        # Springer, 2012, http://dx.doi.org/10.1007/978-3-642-30356-2
-        # NB 7 crystal systems != 7 lattice systems
-
-        # space group to crystal system conversion
-        if   195 <= self.ng <= 230: self.system = 'cubic'
-        elif 168 <= self.ng <= 194: self.system = 'hexagonal'
-        elif 143 <= self.ng <= 167: self.system = 'trigonal'
-        elif 75  <= self.ng <= 142: self.system = 'tetragonal'
-        elif 16  <= self.ng <= 74:  self.system = 'orthorhombic'
-        elif 3   <= self.ng <= 15:  self.system = 'monoclinic'
-        elif 1   <= self.ng <= 2:   self.system = 'triclinic'
-
-        # space group to point group conversion
-        if   221 <= self.ng <= 230: self.pg = 'O<sub>h</sub>'
-        elif 215 <= self.ng <= 220: self.pg = 'T<sub>d</sub>'
-        elif 207 <= self.ng <= 214: self.pg = 'O'
-        elif 200 <= self.ng <= 206: self.pg = 'T<sub>h</sub>'
-        elif 195 <= self.ng <= 199: self.pg = 'T'
-        elif 191 <= self.ng <= 194: self.pg = 'D<sub>6h</sub>'
-        elif 187 <= self.ng <= 190: self.pg = 'D<sub>3h</sub>'
-        elif 183 <= self.ng <= 186: self.pg = 'C<sub>6v</sub>'
-        elif 177 <= self.ng <= 182: self.pg = 'D<sub>6</sub>'
-        elif 175 <= self.ng <= 176: self.pg = 'C<sub>6h</sub>'
-        elif        self.ng == 174: self.pg = 'C<sub>3h</sub>'
-        elif 168 <= self.ng <= 173: self.pg = 'C<sub>6</sub>'
-        elif 162 <= self.ng <= 167: self.pg = 'D<sub>3d</sub>'
-        elif 156 <= self.ng <= 161: self.pg = 'C<sub>3v</sub>'
-        elif 149 <= self.ng <= 155: self.pg = 'D<sub>3</sub>'
-        elif 147 <= self.ng <= 148: self.pg = 'C<sub>3i</sub>'
-        elif 143 <= self.ng <= 146: self.pg = 'C<sub>3</sub>'
-        elif 123 <= self.ng <= 142: self.pg = 'D<sub>4h</sub>'
-        elif 111 <= self.ng <= 122: self.pg = 'D<sub>2d</sub>'
-        elif 99 <= self.ng <= 110:  self.pg = 'C<sub>4v</sub>'
-        elif 89 <= self.ng <= 98:   self.pg = 'D<sub>4</sub>'
-        elif 83 <= self.ng <= 88:   self.pg = 'C<sub>4h</sub>'
-        elif 81 <= self.ng <= 82:   self.pg = 'S<sub>4</sub>'
-        elif 75 <= self.ng <= 80:   self.pg = 'C<sub>4</sub>'
-        elif 47 <= self.ng <= 74:   self.pg = 'D<sub>2h</sub>'
-        elif 25 <= self.ng <= 46:   self.pg = 'C<sub>2v</sub>'
-        elif 16 <= self.ng <= 24:   self.pg = 'D<sub>2</sub>'
-        elif 10 <= self.ng <= 15:   self.pg = 'C<sub>2h</sub>'
-        elif 6 <= self.ng <= 9:     self.pg = 'C<sub>s</sub>'
-        elif 3 <= self.ng <= 5:     self.pg = 'C<sub>2</sub>'
-        elif self.ng == 2:          self.pg = 'C<sub>i</sub>'
-        elif self.ng == 1:          self.pg = 'C<sub>1</sub>'
-
-        # space group to layer group conversion
+        if 0 < self.ng < len(CRYSTAL_SYSTEMS):
+            self.system = CRYSTAL_SYSTEMS[self.ng]
+            self.pg = POINT_GROUPS[self.ng]
+
         if getattr(tilde_obj['structures'][-1], 'periodicity', None) == 2:
             if self.ng in [25, 26, 28, 51]:
                 tilde_obj.warning('Warning! Diperiodical group setting is undefined!')
-            DIPERIODIC_MAPPING = {3:8, 4:9, 5:10, 6:11, 7:12, 8:13, 10:14, 11:15, 12:16, 13:17, 14:18, 16:19, 17:20, 18:21, 21:22, 25:23, 25:24, 26:25, 26:26, 27:27, 28:28, 28:29, 29:30, 30:31, 31:32, 32:33, 35:34, 38:35, 39:36, 47:37, 49:38, 50:39, 51:40, 51:41, 53:42, 54:43, 55:44, 57:45, 59:46, 65:47, 67:48, 75:49, 81:50, 83:51, 85:52, 89:53, 90:54, 99:55, 100:56, 111:57, 113:58, 115:59, 117:60, 123:61, 125:62, 127:63, 129:64, 143:65, 147:66, 149:67, 150:68, 156:69, 157:70, 162:71, 164:72, 168:73, 174:74, 175:75, 177:76, 183:77, 187:78, 189:79, 191:80}
 
             cellpar = cell_to_cellpar( tilde_obj['structures'][-1].cell ).tolist()
-            if cellpar[3] != 90 or cellpar[4] != 90 or cellpar[5] != 90:
-                DIPERIODIC_MAPPING.update({1:1, 2:2, 3:3, 6:4, 7:5, 10:6, 13:7})
-            try: self.dg = DIPERIODIC_MAPPING[self.ng]
+            mapping = DIPERIODIC_OBLIQUE_MAPPING if cellpar[3] != 90 or cellpar[4] != 90 or cellpar[5] != 90 else DIPERIODIC_MAPPING
+            try: self.dg = mapping[self.ng]
             except KeyError: tilde_obj.warning('No diperiodical group found because rotational axes inconsistent with 2d translations!')
             else:
-                if   65 <= self.dg <= 80: self.system = '2d-hexagonal'
-                elif 49 <= self.dg <= 64: self.system = '2d-square'
-                elif 8  <= self.dg <= 48: self.system = '2d-rectangular'
-                elif 1  <= self.dg <= 7:  self.system = '2d-oblique'
+                self.system = LAYER_SYSTEMS[self.dg]
@@ -0,0 +1,144 @@
+
+# Per-stage timings of processing a file: read, detect, parse, classify (by classifier and symmetry),
+# postprocess (by app) and save (including the time in DB cursor, save.sql), kept in tilde_obj.timings;
+# the nested stages are named with a dot, the top-level stages sum up to the total;
+# reported as JSON lines or Prometheus text, the slowest files may be re-run under a profiler
+
+import os
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import ujson as json
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class SQLTimer:
+    '''
+    Time spent in the DB cursor, accumulated per thread
+    '''
+    def __init__(self):
+        self.local = threading.local()
+
+    @property
+    def total(self):
+        return getattr(self.local, 'total', 0.0)
+
+    def before(self, conn, cursor, statement, parameters, context, executemany):
+        self.local.starttime = time.time()
+
+    def after(self, conn, cursor, statement, parameters, context, executemany):
+        self.local.total = self.total + time.time() - self.local.starttime
+
+sql_timer = SQLTimer()
+event.listen(Engine, 'before_cursor_execute', sql_timer.before)
+event.listen(Engine, 'after_cursor_execute', sql_timer.after)
+
+
+@contextmanager
+def timed(calc, stage):
+    starttime = time.time()
+    try:
+        yield
+    finally:
+        calc.timings[stage] = calc.timings.get(stage, 0.0) + time.time() - starttime
+
+def get_total(timings):
+    return sum(value for stage, value in timings.items() if '.' not in stage)
+
+
+class TimingsReport:
+    '''
+    Collects the timings of the processed files,
+    written to path as JSON lines on the fly,
+    or as Prometheus text at the end if path ends with .prom
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.prometheus = bool(path) and path.endswith('.prom')
+        self.stream = open(path, 'w') if path and not self.prometheus else None
+        self.files = {}
+        self.stages = {}
+
+    def add(self, task, timings):
+        if not timings:
+            return
+        total = get_total(timings)
+        self.files[task] = self.files.get(task, 0.0) + total
+        for stage, value in timings.items():
+            stat = self.stages.setdefault(stage, [0.0, 0])
+            stat[0] += value
+            stat[1] += 1
+        if self.stream:
+            self.stream.write(json.dumps({'file': task, 'total': round(total, 6), 'timings': dict((stage, round(value, 6)) for stage, value in timings.items())}) + '\n')
+
+    def slowest(self, n):
+        '''
+        @returns n files taken the most time
+        '''
+        return [task for task, total in sorted(self.files.items(), key=lambda x: x[1], reverse=True)[:n]]
+
+    def to_prometheus(self):
+        output = [
+            '# HELP tilde_stage_seconds Time spent on the processing stage',
+            '# TYPE tilde_stage_seconds summary'
+        ]
+        for stage in sorted(self.stages):
+            output.append('tilde_stage_seconds_sum{stage="%s"} %.6f' % (stage, self.stages[stage][0]))
+            output.append('tilde_stage_seconds_count{stage="%s"} %s' % (stage, self.stages[stage][1]))
+        output += [
+            '# HELP tilde_files_total Files processed',
+            '# TYPE tilde_files_total counter',
+            'tilde_files_total %s' % len(self.files)
+        ]
+        return '\n'.join(output) + '\n'
+
+    def close(self):
+        if self.stream:
+            self.stream.close()
+        elif self.prometheus:
+            with open(self.path, 'w') as f:
+                f.write(self.to_prometheus())
+
+
+def get_profile_path(task, output_dir='.'):
+    '''
+    NB the files of the same name (e.g. OUTCAR) are told apart by the hash of their full path
+    @returns path to the profile, without the extension of profiler
+    '''
+    return os.path.join(output_dir, '%s.%s.profile' % (os.path.basename(task), hashlib.sha1(os.path.abspath(task).encode('utf-8')).hexdigest()[:10]))
+
+def profile_task(work, task, symprec=None, output_dir='.', profiler='cprofile'):
+    '''
+    Parses, classifies and postprocesses the file once again under cProfile or pyinstrument (if installed),
+    NB saving is not profiled, as it would change the DB
+    @returns path to the profile
+    '''
+    def run():
+        for calc, error in scan_task(work, task, symprec):
+            if not error:
+                work.postprocess(calc)
+
+    from tilde.core.pool import scan_task
+
+    name = get_profile_path(task, output_dir)
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        prof = Profiler()
+        prof.start()
+        run()
+        prof.stop()
+        name += '.txt'
+        with open(name, 'w') as f:
+            f.write(prof.output_text())
+    else:
+        import cProfile
+        prof = cProfile.Profile()
+        prof.enable()
+        run()
+        prof.disable()
+        prof.dump_stats(name)
+    return name
@@ -4,17 +4,20 @@ wrapping a standalone parser called pycrystal
 Authors: Evgeny Blokhin and Andrey Sobolev
 """
 import os.path
+import re
 
 from pycrystal import CRYSTOUT as _CRYSTOUT, CRYSTOUT_Error
 from tilde.parsers import Output
 
 
 class CRYSTOUT(Output):
-    def __init__(self, filename):
+    fingerprint_pattern = re.escape(_CRYSTOUT.code_marker)
+
+    def __init__(self, filename, stream=None):
         Output.__init__(self, filename)
 
         try:
-            result = _CRYSTOUT(filename)
+            result = _CRYSTOUT(Output.open_text(filename, stream))
         except CRYSTOUT_Error as ex:
             raise RuntimeError(ex)
 
@@ -52,6 +55,10 @@ class CRYSTOUT(Output):
             if err_msg:
                 self.info['warns'].append(err_msg)
 
+    @classmethod
+    def iparse(cls, filename, stream=None):
+        return [cls(filename, stream)]
+
     @staticmethod
     def fingerprints(test_string):
         return _CRYSTOUT.detect(test_string)
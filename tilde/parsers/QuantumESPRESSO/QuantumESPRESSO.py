@@ -18,8 +18,22 @@ from ase.data import chemical_symbols
 from ase.units import Bohr, Rydberg
 
 
+class _State:
+    '''
+    Parsing state: only the last data blocks are kept
+    '''
+    def __init__(self):
+        self.alat = 0
+        self.cell_data, self.pos_data, self.symbol_data = [], [], []
+        self.atomic_data = None
+        self.e_last = None
+        self.kpts, self.eigs_columns, self.tot_k = [], [], 0
+        self.eigs_failed, self.eigs_spin_warning = False, False
+
 class QuantumESPRESSO(Output):
-    def __init__(self, filename):
+    fingerprint_pattern = '(?=.*(?:pwscf|PWSCF))(?=.*     Current dimensions of program )'
+
+    def __init__(self, filename, stream=None):
         Output.__init__(self, filename)
 
         cur_folder = os.path.dirname(filename)
@@ -73,160 +87,32 @@ class QuantumESPRESSO(Output):
         "gaup"         : {'name': "Gau-PBE",                 'type': [0x2, 0x4],       'setup': ["sla+pw+gaup+pbc", "sla+pw+gaup+pbe"] },
         }
 
-        self.data = open(filename).readlines()
-        atomic_data, cell_data, pos_data, symbol_data, alat = None, [], [], [], 0
-        e_last = None
-        kpts, eigs_columns, tot_k = [], [], 0
-
-        for n in range(len(self.data)):
-            cur_line = self.data[n]
-
-            if "This run was terminated on" in cur_line:
-                self.info['finished'] = 0x2
-
-            elif "     Program PWSCF" in cur_line and " starts " in cur_line:
-                ver_str = cur_line.strip().replace('Program PWSCF', '')
-                ver_str = ver_str[ : ver_str.find(' starts ') ].strip()
-                if ver_str.startswith("v."): ver_str = ver_str[2:]
-                self.info['prog'] = ver_str
-
-            elif cur_line.startswith("     celldm"):
-                if not alat:
-                    alat = float(cur_line.split()[1]) * Bohr
-                    if not alat: alat = 1
-
-            elif cur_line.startswith("     crystal axes:"):
-                cell_data = [x.split()[3:6] for x in self.data[n + 1:n + 4]]
-                cell_data = array([[float(col) for col in row] for row in cell_data])
-
-            elif cur_line.startswith("     site n."):
-                if len(pos_data): continue
-
-                while True:
-                    n += 1
-                    next_line = self.data[n].split()
-                    if not next_line: break
-                    pos_data.append([float(x) for x in next_line[-4:-1]])
-                    symbol = next_line[1].strip('0123456789').split('_')[0]
-                    if not symbol in chemical_symbols and len(symbol) > 1: symbol = symbol[:-1]
-                    symbol_data.append(symbol)
-                pos_data = array(pos_data)*alat
-                atomic_data = Atoms(symbol_data, pos_data, cell=cell_data*alat, pbc=(1,1,1))
-
-            elif "CELL_PARAMETERS" in cur_line:
-                for i in range(3):
-                    n += 1
-                    next_line = self.data[n].split()
-                    if not next_line: break
-                    cell_data[i][:] = list(map(float, next_line))
-                else:
-                    mult = 1
-                    if "bohr" in cur_line: mult = Bohr
-                    elif "alat" in cur_line: mult = alat
-                    atomic_data.set_cell(cell_data*mult, scale_atoms=True)
-
-            elif "ATOMIC_POSITIONS" in cur_line:
-                coord_flag = cur_line.split('(')[-1].strip()
-                for i in range(len(pos_data)):
-                    n += 1
-                    next_line = self.data[n].split()
-                    pos_data[i][:] = list(map(float, next_line[1:4]))
-                if not atomic_data: continue
-
-                if coord_flag=='alat)':
-                    atomic_data.set_positions(pos_data*alat)
-                elif coord_flag=='bohr)':
-                    atomic_data.set_positions(pos_data*Bohr)
-                elif coord_flag=='angstrom)':
-                    atomic_data.set_positions(pos_data)
-                else:
-                    atomic_data.set_scaled_positions(pos_data)
-
-            elif cur_line.startswith("!    total energy"):
-                self.info['energy'] = float(cur_line.split()[-2]) * Rydberg
-
-            elif "     Exchange-correlation" in cur_line:
-                if self.info['H']: continue
+        # NB the file is streamed line by line, only the last blocks of data are kept;
+        # the blocks following the marker lines are read by the generators,
+        # which receive the next lines, while the main loop still examines every line
+        st = _State()
+        readers = []
+        with Output.open_text(filename, stream) as f:
+            dispatch = self._dispatch
+            for cur_line in f:
+                if readers:
+                    for reader in readers[:]:
+                        try: reader.send(cur_line)
+                        except StopIteration: readers.remove(reader)
+
+                reader = dispatch(cur_line, st, xc_internal_map)
+                if reader:
+                    try:
+                        next(reader)
+                        readers.append(reader)
+                    except StopIteration: pass
 
-                xc_str = cur_line.split('=')[-1].strip()
-                xc_parts = xc_str[ : xc_str.find("(") ].split()
-                if len(xc_parts) == 1: xc_parts = xc_parts[0].split('+')
-                if len(xc_parts) < 4: xc_parts = [ '+'.join(xc_parts) ]
-                xc_parts = [x.lower().strip("-'\"") for x in xc_parts]
+        for reader in readers:
+            try: reader.send(None)
+            except StopIteration: pass
 
-                if len(xc_parts) == 1:
-                    try:
-                        self.info['H'] = xc_internal_map[xc_parts[0]]['name']
-                        self.info['H_types'].extend( xc_internal_map[xc_parts[0]]['type'] )
-                    except KeyError:
-                        self.info['H'] = xc_parts[0]
-                else:
-                    xc_parts = '+'.join(xc_parts)
-                    match = [ i for i in list(xc_internal_map.values()) if xc_parts in i['setup'] ]
-                    if match:
-                        self.info['H'] = match[0]['name']
-                        self.info['H_types'].extend( match[0]['type'] )
-                    else:
-                        self.info['H'] = xc_parts
-
-            elif "PWSCF        :" in cur_line:
-                if "WALL" in cur_line or "wall" in cur_line:
-                    d = cur_line.split("CPU")[-1].replace("time", "").replace(",", "")
-                    if d.find("s") > 0: d = d[ : d.find("s") + 1 ]
-                    elif d.find("m") > 0: d = d[ : d.find("m") + 1 ]
-                    elif d.find("h") > 0: d = d[ : d.find("h") + 1 ]
-                    d = d.strip().replace(" ", "")
-                    fmt = ""
-                    if 's' in d: fmt = "%S.%fs"
-                    if 'm' in d: fmt = "%Mm" + fmt
-                    if 'h' in d: fmt = "%Hh" + fmt
-                    if 'd' in d: fmt = "%dd" + fmt # FIXME for months!
-                    d = time.strptime(d, fmt)
-                    # to comply with python 2.6
-                    td = datetime.timedelta(days=d.tm_mday, hours=d.tm_hour, minutes=d.tm_min, seconds=d.tm_sec)
-                    self.info['duration'] = "%2.2f" % ( (td.microseconds + (td.seconds + td.days * 24 * 3600) * 10**6) / 3.6e9 )
-                    self.info['finished'] = 0x2
-
-            elif "End of self-consistent calculation" in cur_line or "End of band structure calculation" in cur_line:
-                e_last = None
-                kpts, eigs_columns, tot_k = [], [], 0
-                eigs_collect, eigs_failed = False, False
-                eigs_spin_warning = False
-                if not atomic_data: eigs_failed = True
-
-                while not eigs_failed:
-                    n += 1
-                    next_line = self.data[n]
-                    if eigs_collect:
-                        next_line = next_line.split()
-                        if next_line:
-                            try: eigs_columns[-1] += list(map(float, next_line))
-                            except ValueError: eigs_failed = True
-                        else: eigs_collect = False
-                        continue
-
-                    if "Ry" in next_line or "CPU" in next_line:
-                        eigs_failed = True
-                    elif "    k =" in next_line:
-                        tot_k += 1
-                        coords = next_line.strip().replace("k =", "")[:21]
-                        try: kpts.append(list(map(float, [coords[0:7], coords[7:14], coords[14:21]])))
-                        except ValueError: eigs_failed = True
-                        eigs_collect = True
-                        eigs_columns.append([])
-                        n += 1
-                    elif "highest occupied level" in next_line:
-                        e_last = float(next_line.split()[-1])
-                        break
-                    elif "highest occupied, lowest unoccupied" in next_line:
-                        e_last = float(next_line.split()[-2])
-                        break
-                    elif "Fermi energy" in next_line:
-                        e_last = float(next_line.split()[-2])
-                        break
-                    elif " SPIN UP " in next_line or " SPIN DOWN " in next_line:
-                        self.info['spin'] = True
-                        eigs_spin_warning = True
+        atomic_data, e_last, kpts, eigs_columns, tot_k = st.atomic_data, st.e_last, st.kpts, st.eigs_columns, st.tot_k
+        eigs_failed, eigs_spin_warning = st.eigs_failed, st.eigs_spin_warning
 
         # Only the last set is taken
         if kpts and eigs_columns:
@@ -272,6 +158,191 @@ class QuantumESPRESSO(Output):
                 self.related_files.append(os.path.join(cur_folder, candidates[0]))
                 self.info['input'] = open(os.path.join(cur_folder, candidates[0])).read()
 
+    def _dispatch(self, cur_line, st, xc_internal_map):
+        '''
+        Examines a line of output
+        @returns a reader of the next lines, if needed
+        '''
+        if "This run was terminated on" in cur_line:
+            self.info['finished'] = 0x2
+
+        elif "     Program PWSCF" in cur_line and " starts " in cur_line:
+            ver_str = cur_line.strip().replace('Program PWSCF', '')
+            ver_str = ver_str[ : ver_str.find(' starts ') ].strip()
+            if ver_str.startswith("v."): ver_str = ver_str[2:]
+            self.info['prog'] = ver_str
+
+        elif cur_line.startswith("     celldm"):
+            if not st.alat:
+                st.alat = float(cur_line.split()[1]) * Bohr
+                if not st.alat: st.alat = 1
+
+        elif cur_line.startswith("     crystal axes:"):
+            return self._read_axes(st)
+
+        elif cur_line.startswith("     site n."):
+            if len(st.pos_data): return None
+            return self._read_sites(st)
+
+        elif "CELL_PARAMETERS" in cur_line:
+            return self._read_cell(st, cur_line)
+
+        elif "ATOMIC_POSITIONS" in cur_line:
+            return self._read_positions(st, cur_line)
+
+        elif cur_line.startswith("!    total energy"):
+            self.info['energy'] = float(cur_line.split()[-2]) * Rydberg
+
+        elif "     Exchange-correlation" in cur_line:
+            if self.info['H']: return None
+
+            xc_str = cur_line.split('=')[-1].strip()
+            xc_parts = xc_str[ : xc_str.find("(") ].split()
+            if len(xc_parts) == 1: xc_parts = xc_parts[0].split('+')
+            if len(xc_parts) < 4: xc_parts = [ '+'.join(xc_parts) ]
+            xc_parts = [x.lower().strip("-'\"") for x in xc_parts]
+
+            if len(xc_parts) == 1:
+                try:
+                    self.info['H'] = xc_internal_map[xc_parts[0]]['name']
+                    self.info['H_types'].extend( xc_internal_map[xc_parts[0]]['type'] )
+                except KeyError:
+                    self.info['H'] = xc_parts[0]
+            else:
+                xc_parts = '+'.join(xc_parts)
+                match = [ i for i in list(xc_internal_map.values()) if xc_parts in i['setup'] ]
+                if match:
+                    self.info['H'] = match[0]['name']
+                    self.info['H_types'].extend( match[0]['type'] )
+                else:
+                    self.info['H'] = xc_parts
+
+        elif "PWSCF        :" in cur_line:
+            if "WALL" in cur_line or "wall" in cur_line:
+                d = cur_line.split("CPU")[-1].replace("time", "").replace(",", "")
+                if d.find("s") > 0: d = d[ : d.find("s") + 1 ]
+                elif d.find("m") > 0: d = d[ : d.find("m") + 1 ]
+                elif d.find("h") > 0: d = d[ : d.find("h") + 1 ]
+                d = d.strip().replace(" ", "")
+                fmt = ""
+                if 's' in d: fmt = "%S.%fs"
+                if 'm' in d: fmt = "%Mm" + fmt
+                if 'h' in d: fmt = "%Hh" + fmt
+                if 'd' in d: fmt = "%dd" + fmt # FIXME for months!
+                d = time.strptime(d, fmt)
+                # to comply with python 2.6
+                td = datetime.timedelta(days=d.tm_mday, hours=d.tm_hour, minutes=d.tm_min, seconds=d.tm_sec)
+                self.info['duration'] = "%2.2f" % ( (td.microseconds + (td.seconds + td.days * 24 * 3600) * 10**6) / 3.6e9 )
+                self.info['finished'] = 0x2
+
+        elif "End of self-consistent calculation" in cur_line or "End of band structure calculation" in cur_line:
+            return self._read_eigenvalues(st)
+
+        return None
+
+    # The readers below receive the next lines, None means the end of file
+
+    def _read_axes(self, st):
+        rows = []
+        while len(rows) < 3:
+            next_line = yield
+            if next_line is None: break
+            rows.append(next_line.split()[3:6])
+        st.cell_data = array([[float(col) for col in row] for row in rows])
+
+    def _read_sites(self, st):
+        while True:
+            next_line = yield
+            if next_line is None: raise RuntimeError('Unexpected end of atomic positions')
+            next_line = next_line.split()
+            if not next_line: break
+            st.pos_data.append([float(x) for x in next_line[-4:-1]])
+            symbol = next_line[1].strip('0123456789').split('_')[0]
+            if not symbol in chemical_symbols and len(symbol) > 1: symbol = symbol[:-1]
+            st.symbol_data.append(symbol)
+        st.pos_data = array(st.pos_data)*st.alat
+        st.atomic_data = Atoms(st.symbol_data, st.pos_data, cell=st.cell_data*st.alat, pbc=(1,1,1))
+
+    def _read_cell(self, st, cur_line):
+        for i in range(3):
+            next_line = yield
+            if next_line is None: raise RuntimeError('Unexpected end of cell parameters')
+            next_line = next_line.split()
+            if not next_line: break
+            st.cell_data[i][:] = list(map(float, next_line))
+        else:
+            mult = 1
+            if "bohr" in cur_line: mult = Bohr
+            elif "alat" in cur_line: mult = st.alat
+            st.atomic_data.set_cell(st.cell_data*mult, scale_atoms=True)
+
+    def _read_positions(self, st, cur_line):
+        coord_flag = cur_line.split('(')[-1].strip()
+        for i in range(len(st.pos_data)):
+            next_line = yield
+            if next_line is None: raise RuntimeError('Unexpected end of atomic positions')
+            next_line = next_line.split()
+            st.pos_data[i][:] = list(map(float, next_line[1:4]))
+        if not st.atomic_data: return
+
+        if coord_flag=='alat)':
+            st.atomic_data.set_positions(st.pos_data*st.alat)
+        elif coord_flag=='bohr)':
+            st.atomic_data.set_positions(st.pos_data*Bohr)
+        elif coord_flag=='angstrom)':
+            st.atomic_data.set_positions(st.pos_data)
+        else:
+            st.atomic_data.set_scaled_positions(st.pos_data)
+
+    def _read_eigenvalues(self, st):
+        st.e_last = None
+        st.kpts, st.eigs_columns, st.tot_k = [], [], 0
+        eigs_collect, st.eigs_failed = False, False
+        st.eigs_spin_warning = False
+        if not st.atomic_data: st.eigs_failed = True
+        skip = False
+
+        while not st.eigs_failed:
+            next_line = yield
+            if next_line is None: raise RuntimeError('Unexpected end of eigenvalues')
+            if skip:
+                skip = False
+                continue
+            if eigs_collect:
+                next_line = next_line.split()
+                if next_line:
+                    try: st.eigs_columns[-1] += list(map(float, next_line))
+                    except ValueError: st.eigs_failed = True
+                else: eigs_collect = False
+                continue
+
+            if "Ry" in next_line or "CPU" in next_line:
+                st.eigs_failed = True
+            elif "    k =" in next_line:
+                st.tot_k += 1
+                coords = next_line.strip().replace("k =", "")[:21]
+                try: st.kpts.append(list(map(float, [coords[0:7], coords[7:14], coords[14:21]])))
+                except ValueError: st.eigs_failed = True
+                eigs_collect = True
+                st.eigs_columns.append([])
+                skip = True
+            elif "highest occupied level" in next_line:
+                st.e_last = float(next_line.split()[-1])
+                break
+            elif "highest occupied, lowest unoccupied" in next_line:
+                st.e_last = float(next_line.split()[-2])
+                break
+            elif "Fermi energy" in next_line:
+                st.e_last = float(next_line.split()[-2])
+                break
+            elif " SPIN UP " in next_line or " SPIN DOWN " in next_line:
+                self.info['spin'] = True
+                st.eigs_spin_warning = True
+
+    @classmethod
+    def iparse(cls, filename, stream=None):
+        return [cls(filename, stream)]
+
     @staticmethod
     def fingerprints(test_string):
         if ("pwscf" in test_string or "PWSCF" in test_string) and "     Current dimensions of program " in test_string:
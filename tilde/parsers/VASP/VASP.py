@@ -17,6 +17,7 @@ class XML_Output(Output):
     # TODO: kpoints, dos, eigenvalues, etc.
     obligatory_tags = ['incar', 'generator', 'atominfo', 'parameters', 'structure:finalpos']
     current_parser = VaspParser(whitelist=obligatory_tags + ['energy'])
+    fingerprint_pattern = '<i name="program" type="string">vasp'
 
     def __init__(self, filename):
         Output.__init__(self, filename)
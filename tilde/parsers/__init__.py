@@ -4,6 +4,7 @@
 # Author: Evgeny Blokhin
 
 import os, sys
+import io
 import re
 import time
 import math
@@ -11,10 +12,12 @@ import random
 
 import hashlib
 import base64
-from ase.data import chemical_symbols
+import numpy as np
 
 
 class Output:
+    fingerprint_pattern = None # regex searched in every line of the file head, see API.detect
+
     def __init__(self, filename='', calcset=False):
 
         self._filename = filename # for quick and cheap checksums (NB never generate checksum from the entire calc file, which may be huge)
@@ -25,6 +28,7 @@ class Output:
 
         self.download_size = 0
         self.related_files = []
+        self.timings = {} # seconds spent on the processing stages
 
         if self._calcset:
             self.info = {}
@@ -33,6 +37,7 @@ class Output:
         self._starttime = time.time()
 
         self.structures =  [] # list of ASE objects with additional properties
+        self.symmetry =    None # spglib dataset of the last structure, set by classify
         self.convergence = [] # zero-point energy convergence (I)
         self.tresholds =   [] # optimization convergence, list of 5 lists (II)
         self.ncycles =     [] # number of cycles at each optimisation step
@@ -116,9 +121,23 @@ class Output:
         }
 
     @classmethod
-    def iparse(cls, filename):
+    def iparse(cls, filename, stream=None):
+        '''
+        **stream** is the file already opened by API in binary mode (if any),
+        the parsers may either use it or ignore it
+        '''
         return [cls(filename)]
 
+    @staticmethod
+    def open_text(filename, stream=None):
+        '''
+        Reuses the stream (if any) as a text file
+        '''
+        if stream is None:
+            return open(filename)
+        stream.seek(0)
+        return io.TextIOWrapper(stream)
+
     def __getitem__(self, key):
         return getattr(self, key)
 
@@ -157,12 +176,16 @@ class Output:
             raise RuntimeError('Source calc file is required in order to properly save the data!')
 
         calc_checksum = hashlib.sha224()
-        struc_repr = ""
+        struc_repr = []
         for ase_obj in self.structures:
-            struc_repr += "%3.6f %3.6f %3.6f %3.6f %3.6f %3.6f %3.6f %3.6f %3.6f " % tuple(map(abs, [ase_obj.cell[0][0], ase_obj.cell[0][1], ase_obj.cell[0][2], ase_obj.cell[1][0], ase_obj.cell[1][1], ase_obj.cell[1][2], ase_obj.cell[2][0], ase_obj.cell[2][1], ase_obj.cell[2][2]])) # NB beware of length & minus zeros
-
-            for atom in ase_obj:
-                struc_repr += "%s %3.6f %3.6f %3.6f " % tuple(map(abs, [chemical_symbols.index(atom.symbol), atom.x, atom.y, atom.z])) # NB beware of length & minus zeros
+            # NB the formatting is done in bulk, but is fixed and should give the same digest as the per-atom one; beware of length & minus zeros
+            struc_repr.append(("%3.6f " * 9) % tuple(np.abs(np.asarray(ase_obj.cell, dtype=float)).ravel().tolist()))
+
+            atoms = np.empty((len(ase_obj), 4), dtype=object)
+            atoms[:, 0] = ase_obj.get_atomic_numbers().tolist()
+            atoms[:, 1:] = np.abs(ase_obj.get_positions()).tolist()
+            struc_repr.append(("%s %3.6f %3.6f %3.6f " * len(ase_obj)) % tuple(atoms.ravel().tolist()))
+        struc_repr = "".join(struc_repr)
 
         if self.info["energy"] is None:
             energy = str(None)
@@ -22,6 +22,8 @@ from tilde.core.settings import settings, connect_database, DATA_DIR, SETTINGS_P
 from tilde.core.common import write_cif, num2name
 from tilde.core.symmetry import SymmetryFinder
 from tilde.core.api import API
+from tilde.core.pool import scan
+from tilde.core.timing import TimingsReport, profile_task
 
 from ase.geometry import cell_to_cellpar
 
@@ -49,9 +51,17 @@ parser.add_argument("-s",   dest="structures", action="store", help="print the f
 parser.add_argument("-c",   dest="cif", action="store", help="save i-th CIF structure in \"data\" folder", type=int, metavar="i", nargs='?', const=-1, default=False)
 parser.add_argument("-x",   dest="service", action="store", help="print total number of items (use to create schema)", type=bool, metavar="", nargs='?', const=True, default=False)
 parser.add_argument("-l",   dest="targetlist", action="store", help="file with scan targets", type=str, metavar="file", nargs='?', const=None, default=None)
+parser.add_argument("-b",   dest="batch", action="store", help="with -a, save in batches of N calculations (default 250)", type=int, metavar="N", nargs='?', const=250, default=0)
+parser.add_argument("-u",   dest="update", action="store", help="with -a, skip the files unchanged since their previous import", type=bool, metavar="", nargs='?', const=True, default=False)
+parser.add_argument("-k",   dest="timings", action="store", help="write per-stage timings of every file: JSON lines, or Prometheus text if file ends with .prom", type=str, metavar="file", nargs='?', const=None, default=None)
+parser.add_argument("-n",   dest="profile", action="store", help="re-run N slowest files under profiler (except saving), save profiles in \"data\" folder", type=int, metavar="N", nargs='?', const=5, default=0)
+parser.add_argument("-g",   dest="pyinstrument", action="store", help="with -n, use pyinstrument instead of cProfile", type=bool, metavar="", nargs='?', const=True, default=False)
+parser.add_argument("-j",   dest="processes", action="store", help="parse and classify in N processes (default: all CPUs)", type=int, metavar="N", nargs='?', const=os.cpu_count(), default=1)
 args = parser.parse_args()
 
 session = None
+sources, indexing, skipped = {}, {}, 0
+report = TimingsReport(args.timings) if args.timings or args.profile else None
 
 if not args.path and not args.service and not args.targetlist:
     #print __doc__
@@ -68,6 +78,12 @@ if args.add or args.service:
     if user_choice:
         print("The database selected:", user_choice)
 
+# -u option
+if args.update:
+    if not args.add:
+        sys.exit("Option -u requires -a")
+    sources = work.get_sources(session)
+
 # path(s)
 if args.path or args.targetlist:
     finalized = 'YES' if settings['skip_unfinished'] else 'NO'
@@ -89,160 +105,246 @@ if args.path or args.targetlist:
 elif args.service:
     sys.exit("Items in DB: %s" % work.count(session))
 
-for target in target_source:
-
-    if not os.path.exists(target):
-        print('Target does not exist: ' + target)
-        continue
+def get_tasks(target_source):
+    global skipped
+    for target in target_source:
 
-    for task in work.savvyize(target, recursive=args.recursive, stemma=True):
+        if not os.path.exists(target):
+            print('Target does not exist: ' + target)
+            continue
 
-        detected = False
-        for calc, error in work.parse(task):
-            output_lines, add_msg = '', ''
-
-            if error:
-                if args.terse and 'was read' in error:
+        for task in work.savvyize(target, recursive=args.recursive, stemma=True):
+            if args.update:
+                if work.is_unchanged(task, sources):
+                    skipped += 1
                     continue
-                logging.error("%s %s" % (task, error))
+                indexing[task] = {'stat': os.stat(task), 'parser': None, 'checksums': [], 'failed': False, 'pending': 0, 'done': False}
+            yield task
+
+def update_index(task, calc=None, checksum=None, failed=False):
+    item = indexing.get(task)
+    if item is None:
+        return
+    if calc:
+        item['parser'] = calc.__class__.__name__
+    if checksum:
+        item['checksums'].append(checksum)
+    if failed:
+        item['failed'] = True # NB the failed files are always re-read
+
+def finalize_index(task):
+    item = indexing.get(task)
+    if item is None or item['pending'] or not item['done']:
+        return
+    del indexing[task]
+    if not item['failed']:
+        work.index_source(session, task, item['stat'], item['parser'], item['checksums'])
+
+def save_pending(pending):
+    saved = work.save_many([item[1] for item in pending], session, batch_size=args.batch)
+    for (task, calc, header_line, output_lines), (checksum, error) in zip(pending, saved):
+        if task in indexing:
+            indexing[task]['pending'] -= 1
+        if error:
+            if 'already exists' in error:
+                update_index(task, calc, calc.get_checksum())
+            else:
+                update_index(task, failed=True)
+            finalize_index(task)
+            logging.error("%s %s" % (task, error))
+            continue
+        update_index(task, calc, checksum)
+        finalize_index(task)
+        if report:
+            report.add(task, calc.timings)
+        print(header_line + ' added' + output_lines)
+        logging.info(task + " successfully processed")
+    del pending[:]
+
+if args.processes > 1:
+    print("Parsing in %s processes" % args.processes)
+
+pending = []
+
+for task, results in scan(work, get_tasks(target_source), args.symprec, args.processes):
+
+    detected = False
+    for calc, error in results:
+        output_lines, add_msg = '', ''
+
+        if error:
+            if args.terse and 'was read' in error:
                 continue
-
-            calc, error = work.classify(calc, args.symprec)
+            if 'was read' not in error:
+                update_index(task, failed=True)
+            logging.error("%s %s" % (task, error))
+            continue
+
+        logging.debug(task)
+        header_line = (task + " (E=" + str(calc.info['energy']) + " eV)") if calc.info['energy'] else task
+        if calc.info['warns']: add_msg = " (" + " ".join(calc.info['warns']) + ")"
+
+        # -i option
+        if args.info:
+            found_topics = []
+            skip_topics = {'location', 'elements', 'nelem', 'natom', 'spg', 'dtype', 'year', 'article_title', 'doi', 'pubdata'}
+            for n, entity in enumerate(work.hierarchy):
+                if entity['cid'] > 1999 or entity['source'] in skip_topics:
+                    continue # apps hierarchy
+
+                if entity['multiple']:
+                    try:
+                        found_topics.append(
+                            [entity['category']] + [num2name(x, entity, work.hierarchy_values) for x in calc.info[ entity['source'] ]]
+                        )
+                    except KeyError:
+                        pass
+                else:
+                    try:
+                        found_topics.append(
+                            [entity['category'], num2name(calc.info.get(entity['source']), entity, work.hierarchy_values)]
+                        )
+                    except KeyError:
+                        pass
+
+            j, out = 0, ''
+            for t in found_topics:
+                out += "\t" + t[0] + ': ' + ', '.join(map(str, t[1:]))
+                out += "\t" if not j % 2 else "\n"
+                j+=1
+            output_lines += out[:-1] + "\n"
+
+        # -v option
+        if args.convergence:
+            if calc.convergence:
+                output_lines += str(calc.convergence) + "\n"
+            if calc.tresholds:
+                for n in range(len(calc.tresholds)):
+                    try:
+                        ncycles = calc.ncycles[n]
+                    except IndexError:
+                        ncycles = "^"
+                    output_lines += "{:8f}".format(calc.tresholds[n][0] or nan) + "  " + \
+                                    "{:8f}".format(calc.tresholds[n][1] or nan) + "  " + \
+                                    "{:8f}".format(calc.tresholds[n][2] or nan) + "  " + \
+                                    "{:8f}".format(calc.tresholds[n][3] or nan) + "  " + \
+                                    "E={:12f}".format(calc.tresholds[n][4] or nan) + " eV" + "  " + \
+                                    "(%s)" % ncycles + "\n"
+
+        # -s option
+        if args.structures:
+            out = ''
+            if len(calc.structures) > 1:
+                out += str(cell_to_cellpar(calc.structures[0].cell)) + " V=%2.2f" % (abs(det(calc.structures[0].cell))) + ' -> '
+            out += str(cell_to_cellpar(calc.structures[-1].cell))
+            out += " V=%2.2f\n" % calc.info['dims']
+            for atom in calc.structures[-1]:
+                out += "\t%s %2.3f %2.3f %2.3f\t(q=%1.1f m=%1.1f)\n" % (atom.symbol, atom.x, atom.y, atom.z, atom.charge, atom.magmom)
+            output_lines += out
+
+        # -c option
+        if args.cif:
+            try:
+                calc.structures[args.cif]
+            except IndexError:
+                output_lines += "Warning! Structure " + args.cif + " not found!" + "\n"
+            else:
+                N = args.cif if args.cif > 0 else len(calc.structures) + 1 + args.cif
+                comment = calc.info['formula'] + " extracted from " + task + " (structure N " + str(N) + ")"
+                cif_file = os.path.realpath(os.path.abspath(DATA_DIR + os.sep + os.path.basename(task))) + '_' + str(args.cif) + '.cif'
+                if write_cif(cif_file, calc.structures[ args.cif ], comment):
+                    output_lines += cif_file + " ready" + "\n"
+                else:
+                    output_lines += "Warning! " + cif_file + " cannot be written!" + "\n"
+
+        # -m option
+        if args.module:
+            if args.module is True:
+                calc = work.postprocess(calc, dry_run=True)
+                output_lines += "Modules to be invoked: " + str([item for item in calc.apps]) + "\n"
+            else:
+                calc = work.postprocess(calc, args.module)
+                if args.module not in calc.apps:
+                    output_lines += "Module \"" + args.module + "\" is not suitable for this case (outside the scope defined in module manifest)!" + "\n"
+                else:
+                    out = str(calc.apps[args.module]['error']) if calc.apps[args.module]['error'] else str(calc.apps[args.module]['data'])
+                    output_lines += out + "\n"
+
+        # -f option
+        if args.freqs:
+            if not calc.phonons['modes']:
+                output_lines += 'no phonons'
+            else:
+                for bzpoint, frqset in calc.phonons['modes'].items():
+                    output_lines += "\tK-POINT: " + bzpoint + "\n"
+
+                    for n in range(len(frqset)):
+                        irreps = calc.phonons['irreps'].get(bzpoint)
+                        irreps = irreps[n] if irreps else "?"
+                        output_lines += "%d" % frqset[n] + " (" + irreps + ") " + (
+                            ("\t" +
+                                ("IR = " if calc.phonons['ir_active'][n] else "-") +
+                                    str(calc.phonons['ir_active'][n] or "-") + "\t\t\t" +
+                                ("Raman = " if calc.phonons['raman_active'][n] else "-") +
+                                    str(calc.phonons['raman_active'][n] or "-")
+                            ) if bzpoint == '0 0 0' and calc.phonons['ir_active'] and calc.phonons['raman_active'] else ""
+                        ) + "\n"
+
+        if len(output_lines):
+            output_lines = "\n" + output_lines
+
+        # -a and -b options
+        if args.add and args.batch:
+            pending.append((task, calc, header_line, add_msg + output_lines))
+            if task in indexing:
+                indexing[task]['pending'] += 1
+            if len(pending) >= args.batch:
+                save_pending(pending)
+            continue
+
+        # -a option
+        if args.add:
+            checksum, error = work.save(calc, session)
             if error:
+                if 'already exists' in error:
+                    update_index(task, calc, calc.get_checksum())
+                else:
+                    update_index(task, failed=True)
                 logging.error("%s %s" % (task, error))
                 continue
+            update_index(task, calc, checksum)
+            header_line += ' added'
+            detected = True
 
-            logging.debug(task)
-            header_line = (task + " (E=" + str(calc.info['energy']) + " eV)") if calc.info['energy'] else task
-            if calc.info['warns']: add_msg = " (" + " ".join(calc.info['warns']) + ")"
-
-            # -i option
-            if args.info:
-                found_topics = []
-                skip_topics = {'location', 'elements', 'nelem', 'natom', 'spg', 'dtype', 'year', 'article_title', 'doi', 'pubdata'}
-                for n, entity in enumerate(work.hierarchy):
-                    if entity['cid'] > 1999 or entity['source'] in skip_topics:
-                        continue # apps hierarchy
-
-                    if entity['multiple']:
-                        try:
-                            found_topics.append(
-                                [entity['category']] + [num2name(x, entity, work.hierarchy_values) for x in calc.info[ entity['source'] ]]
-                            )
-                        except KeyError:
-                            pass
-                    else:
-                        try:
-                            found_topics.append(
-                                [entity['category'], num2name(calc.info.get(entity['source']), entity, work.hierarchy_values)]
-                            )
-                        except KeyError:
-                            pass
-
-                j, out = 0, ''
-                for t in found_topics:
-                    out += "\t" + t[0] + ': ' + ', '.join(map(str, t[1:]))
-                    out += "\t" if not j % 2 else "\n"
-                    j+=1
-                output_lines += out[:-1] + "\n"
-
-            # -v option
-            if args.convergence:
-                if calc.convergence:
-                    output_lines += str(calc.convergence) + "\n"
-                if calc.tresholds:
-                    for n in range(len(calc.tresholds)):
-                        try:
-                            ncycles = calc.ncycles[n]
-                        except IndexError:
-                            ncycles = "^"
-                        output_lines += "{:8f}".format(calc.tresholds[n][0] or nan) + "  " + \
-                                        "{:8f}".format(calc.tresholds[n][1] or nan) + "  " + \
-                                        "{:8f}".format(calc.tresholds[n][2] or nan) + "  " + \
-                                        "{:8f}".format(calc.tresholds[n][3] or nan) + "  " + \
-                                        "E={:12f}".format(calc.tresholds[n][4] or nan) + " eV" + "  " + \
-                                        "(%s)" % ncycles + "\n"
-
-            # -s option
-            if args.structures:
-                out = ''
-                if len(calc.structures) > 1:
-                    out += str(cell_to_cellpar(calc.structures[0].cell)) + " V=%2.2f" % (abs(det(calc.structures[0].cell))) + ' -> '
-                out += str(cell_to_cellpar(calc.structures[-1].cell))
-                out += " V=%2.2f\n" % calc.info['dims']
-                for atom in calc.structures[-1]:
-                    out += "\t%s %2.3f %2.3f %2.3f\t(q=%1.1f m=%1.1f)\n" % (atom.symbol, atom.x, atom.y, atom.z, atom.charge, atom.magmom)
-                output_lines += out
-
-            # -c option
-            if args.cif:
-                try:
-                    calc.structures[args.cif]
-                except IndexError:
-                    output_lines += "Warning! Structure " + args.cif + " not found!" + "\n"
-                else:
-                    N = args.cif if args.cif > 0 else len(calc.structures) + 1 + args.cif
-                    comment = calc.info['formula'] + " extracted from " + task + " (structure N " + str(N) + ")"
-                    cif_file = os.path.realpath(os.path.abspath(DATA_DIR + os.sep + os.path.basename(task))) + '_' + str(args.cif) + '.cif'
-                    if write_cif(cif_file, calc.structures[ args.cif ], comment):
-                        output_lines += cif_file + " ready" + "\n"
-                    else:
-                        output_lines += "Warning! " + cif_file + " cannot be written!" + "\n"
-
-            # -m option
-            if args.module:
-                if args.module is True:
-                    calc = work.postprocess(calc, dry_run=True)
-                    output_lines += "Modules to be invoked: " + str([item for item in calc.apps]) + "\n"
-                else:
-                    calc = work.postprocess(calc, args.module)
-                    if args.module not in calc.apps:
-                        output_lines += "Module \"" + args.module + "\" is not suitable for this case (outside the scope defined in module manifest)!" + "\n"
-                    else:
-                        out = str(calc.apps[args.module]['error']) if calc.apps[args.module]['error'] else str(calc.apps[args.module]['data'])
-                        output_lines += out + "\n"
-
-            # -f option
-            if args.freqs:
-                if not calc.phonons['modes']:
-                    output_lines += 'no phonons'
-                else:
-                    for bzpoint, frqset in calc.phonons['modes'].items():
-                        output_lines += "\tK-POINT: " + bzpoint + "\n"
-
-                        for n in range(len(frqset)):
-                            irreps = calc.phonons['irreps'].get(bzpoint)
-                            irreps = irreps[n] if irreps else "?"
-                            output_lines += "%d" % frqset[n] + " (" + irreps + ") " + (
-                                ("\t" +
-                                    ("IR = " if calc.phonons['ir_active'][n] else "-") +
-                                        str(calc.phonons['ir_active'][n] or "-") + "\t\t\t" +
-                                    ("Raman = " if calc.phonons['raman_active'][n] else "-") +
-                                        str(calc.phonons['raman_active'][n] or "-")
-                                ) if bzpoint == '0 0 0' and calc.phonons['ir_active'] and calc.phonons['raman_active'] else ""
-                            ) + "\n"
-
-            # -a option
-            if args.add:
-                checksum, error = work.save(calc, session)
-                if error:
-                    logging.error("%s %s" % (task, error))
-                    continue
-                header_line += ' added'
-                detected = True
+        if report:
+            report.add(task, calc.timings)
+        print(header_line + add_msg + output_lines)
 
-            if len(output_lines):
-                output_lines = "\n" + output_lines
+    if detected:
+        logging.info(task + " successfully processed")
 
-            print(header_line + add_msg + output_lines)
+    if task in indexing:
+        indexing[task]['done'] = True
+        finalize_index(task)
+    # NB: from here the calc instance is not accessible anymore
 
-        if detected:
-            logging.info(task + " successfully processed")
-        # NB: from here the calc instance is not accessible anymore
+if pending:
+    save_pending(pending)
 
 if session:
     session.close()
 if args.targetlist:
     target_source.close()
 
+if args.update:
+    print("Skipped as unchanged: %s" % skipped)
+
+# -k and -n options
+if report:
+    report.close()
+    if args.timings:
+        print("Timings written to %s" % args.timings)
+    for task in report.slowest(args.profile):
+        print("Profile of %s: %s" % (task, profile_task(work, task, args.symprec, DATA_DIR, 'pyinstrument' if args.pyinstrument else 'cprofile')))
+
 print("Done in %1.2f sc" % (time.time() - starttime))
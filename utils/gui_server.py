@@ -3,14 +3,13 @@
 # Remote entry point for Tilde based on websockets
 # Author: Evgeny Blokhin
 
-import os, sys
+import sys
 import math
 import time
 import logging
 
-from sqlalchemy import text, and_, func
+from sqlalchemy import and_
 from sqlalchemy.orm.exc import NoResultFound
-from ase.atoms import Atoms
 
 from tornado import web, ioloop
 from sockjs.tornado import SockJSRouter
@@ -23,7 +22,10 @@ from tilde.core.settings import settings, GUI_URL_TPL
 from tilde.core.api import API
 from tilde.core.common import html_formula, extract_chemical_symbols, str2html, num2name, generate_cif
 import tilde.core.model as model
-from tilde.berlinium import add_redirection, eplotter, wrap_cell, Async_Connection as Connection
+from tilde.berlinium import add_redirection, eplotter, wrap_cell, ResultCache, TagIndex, GridRows, Async_Connection
+from tilde.berlinium.paging import encode_cursor, decode_cursor, seek_order, seek_clause, split_parts
+if settings['server_mode'] == 'asyncio':
+    from tilde.berlinium.asyncio_impl import Connection as Asyncio_Connection, install as install_asyncio
 
 
 logging.basicConfig(level=logging.WARNING)
@@ -32,6 +34,27 @@ CURRENT_TITLE = settings['title'] if settings['title'] else 'API version ' + API
 DB_TITLE = settings['db']['default_sqlite_db'] if settings['db']['engine'] == 'sqlite' else settings['db']['dbname'] + '@' + settings['db']['engine']
 settings['no_parse'] = True
 work = API(settings)
+Connection = Asyncio_Connection if settings['server_mode'] == 'asyncio' else Async_Connection
+browse_cache = ResultCache()
+work.write_callbacks.append(browse_cache.clear)
+tag_index = TagIndex()
+work.write_callbacks.append(tag_index.clear)
+grid_rows = GridRows(work.hierarchy, work.hierarchy_values)
+work.write_callbacks.append(grid_rows.clear)
+
+def stream_table(data, thead, checksums, cols, size, db_session):
+    '''
+    Yields the table by parts of *size* rows,
+    the client is expected to concatenate the html of all the parts
+    '''
+    parts = split_parts(checksums, size)
+    for n, part in enumerate(parts):
+        rendered = grid_rows.render(db_session, part, cols)
+        html_output = [thead] if n == 0 else []
+        html_output.extend(rendered[checksum] for checksum in part if checksum in rendered)
+        if n == len(parts) - 1:
+            html_output.append('</tbody>')
+        yield (dict(data, html=''.join(html_output)), None)
 
 class BerliniumGUIProvider:
     @staticmethod
@@ -78,17 +101,25 @@ class BerliniumGUIProvider:
         error = None
 
         try:
-            start, sortby = int(req.get('start', 0)), int(req.get('sortby', 0))
+            start, sortby, chunk = int(req.get('start', 0)), int(req.get('sortby', 0)), int(req.get('chunk', 0))
         except ValueError:
             return (data, 'Sorry, unknown parameters in request')
 
-        start *= Connection.Clients[client_id].usettings['colnum']
-        stop = start + Connection.Clients[client_id].usettings['colnum']
+        cursor = None
+        if req.get('cursor'):
+            try:
+                cursor = decode_cursor(req['cursor'])
+            except ValueError:
+                return (data, 'Invalid request!')
+
+        colnum, cols = Connection.Clients[client_id].usettings['colnum'], Connection.Clients[client_id].usettings['cols']
+        start *= colnum
+        stop = start + colnum
 
         if sortby   == 0:
-            sortby = model.Metadata.chemical_formula
+            sortby, sort_key = model.Metadata.chemical_formula, 'chemical_formula'
         elif sortby == 1:
-            sortby = model.Metadata.location
+            sortby, sort_key = model.Metadata.location, 'location'
         else:
             return (data, 'Unknown sorting requested!')
 
@@ -131,68 +162,88 @@ class BerliniumGUIProvider:
                 try: int(x)
                 except: return (data, 'Invalid request!')
 
-            proposition = []
-            for item, _ in db_session.query(model.Calculation.checksum, sortby) \
-                .join(model.Calculation.meta_data) \
-                .join(model.Calculation.uitopics) \
-                .filter(model.Topic.tid.in_(req['tids'])) \
-                .group_by(model.Calculation.checksum, sortby) \
-                .having(func.count(model.Topic.tid) == len(req['tids'])) \
-                .filter(and_(*clauses)) \
-                .order_by(sortby) \
-                .slice(start, stop).all():
-                proposition.append(item)
-
-            if not proposition: return ({'msg': 'Nothing found'}, error)
-
-            data['count'] = db_session.query(model.Calculation.checksum).join(model.Calculation.uitopics).filter(model.Topic.tid.in_(req['tids'])).group_by(model.Calculation.checksum).having(func.count(model.Topic.tid) == len(req['tids'])).filter(and_(*clauses)).count()
-
-        elif clauses:
-            proposition = []
-            for item in db_session.query(model.Calculation.checksum).filter(and_(*clauses)).slice(start, stop).all():
-                proposition += list(item)
-            if not proposition: return ({'msg': 'Nothing found &mdash; change slider limits'}, error)
+        if req.get('tids') or clauses:
+            # NB the DB signature is in the key, as the calcs may be added or purged by another process, e.g. entry.py
+            signature = TagIndex.get_signature(db_session)
+            key = json.dumps([sorted(int(x) for x in req.get('tids') or []), req.get('conditions') or [], int(req.get('sortby', 0)), str(signature)], sort_keys=True)
+            if req.get('tids'):
+                # the whole ordered result is cached, so that any page is then served from it
+                found = browse_cache.get(key)
+                if found is None:
+                    # tags are intersected in the inverted index, the rest is checked in DB
+                    postings = tag_index.get(db_session, signature)
+                    rows = postings.intersect(req['tids'])
+                    if clauses and rows.size:
+                        allowed = set(item for item, in db_session.query(model.Calculation.checksum).filter(and_(*clauses)).all())
+                        rows = rows[[checksum in allowed for checksum in postings.checksums[rows]]]
+                    found = postings.get_checksums(rows, sort_key)
+                    browse_cache.set(key, found)
+
+                if cursor:
+                    _, checksum, start = cursor
+                    if found[start - 1:start] != [checksum]:
+                        try: start = found.index(checksum) + 1
+                        except ValueError: pass # the row is gone, its position is kept
+
+                proposition = found[start:start + colnum]
+                data['count'] = len(found)
+
+            else:
+                # the pages are sought by (sort key, checksum), so that a deep page costs as the first one
+                query = db_session.query(model.Calculation.checksum, sortby) \
+                    .join(model.Calculation.meta_data) \
+                    .filter(and_(*clauses))
+
+                data['count'] = browse_cache.get(key)
+                if data['count'] is None:
+                    data['count'] = query.count()
+                    browse_cache.set(key, data['count'])
+
+                query = query.order_by(*seek_order(sortby, model.Calculation.checksum))
+                if cursor:
+                    value, checksum, start = cursor
+                    query = query.filter(seek_clause(sortby, model.Calculation.checksum, value, checksum))
+                else:
+                    query = query.offset(start)
+                proposition = [item for item, _ in query.limit(colnum).all()]
 
-            data['count'] = db_session.query(model.Calculation.checksum).filter(and_(*clauses)).count()
+            if not proposition:
+                return ({'msg': 'Nothing found' if req.get('tids') else 'Nothing found &mdash; change slider limits'}, error)
 
         if not proposition: return (data, 'Invalid request!')
 
-        html_output, res_count = '', 0
-        html_output = '<thead><tr><th class="not-sortable"><input type="checkbox" id="d_cb_all"></th>'
+        thead = ['<thead><tr><th class="not-sortable"><input type="checkbox" id="d_cb_all"></th>']
         for entity in work.hierarchy:
-            if entity['has_column'] and entity['cid'] in Connection.Clients[client_id].usettings['cols']:
+            if entity['has_column'] and entity['cid'] in cols:
                 catname = str2html(entity['html']) if entity['html'] else entity['category'][0].upper() + entity['category'][1:]
 
                 plottable = '<input class="sc" type="checkbox" />' if entity['plottable'] else ''
 
-                html_output += '<th rel="' + str(entity['cid']) + '"><span>' + catname + '</span>' + plottable + '</th>'
-        #if Connection.Clients[client_id].usettings['objects_expand']: html_output += '<th class="not-sortable">More...</th>'
-        html_output += '</tr></thead><tbody>'
-
-        for row, checksum in db_session.query(model.Grid.info, model.Metadata.checksum) \
-            .filter(model.Grid.checksum == model.Metadata.checksum) \
-            .filter(model.Grid.checksum.in_(proposition)) \
-            .order_by(sortby).all():
-
-            res_count += 1
-            data_obj = json.loads(row)
-
-            html_output += '<tr id="i_' + checksum + '" data-filename="' + data_obj.get('location', '').split(os.sep)[-1] + '">'
-            html_output += '<td><input type="checkbox" id="d_cb_'+ checksum + '" class="SHFT_cb"></td>'
+                thead.append('<th rel="' + str(entity['cid']) + '"><span>' + catname + '</span>' + plottable + '</th>')
+        #if Connection.Clients[client_id].usettings['objects_expand']: thead.append('<th class="not-sortable">More...</th>')
+        thead.append('</tr></thead><tbody>')
+        thead = ''.join(thead)
 
-            for entity in work.hierarchy:
-                if not entity['has_column'] or entity['cid'] not in Connection.Clients[client_id].usettings['cols']:
-                    continue
+        rows = db_session.query(model.Metadata.checksum, sortby) \
+            .filter(model.Metadata.checksum.in_(proposition)) \
+            .order_by(*seek_order(sortby, model.Metadata.checksum)).all()
+        if req.get('tids') or clauses:
+            # NB the page keeps the order the cursor is based on, as the DB collation may differ
+            positions = dict((checksum, n) for n, checksum in enumerate(proposition))
+            rows.sort(key=lambda row: positions[row[0]])
+        checksums = [checksum for checksum, _ in rows]
 
-                html_output += wrap_cell(entity, data_obj, work.hierarchy_values, table_view=True)
+        if not req.get('hashes') and start + len(proposition) < data['count']:
+            last_values = dict(rows)
+            data['cursor'] = encode_cursor(last_values.get(proposition[-1]), proposition[-1], start + len(proposition))
 
-            #if Connection.Clients[client_id].usettings['objects_expand']: html_output += "<td class=objects_expand><strong>click by row</strong></td>"
-            html_output += '</tr>'
-        html_output += '</tbody>'
+        if chunk > 0 and checksums:
+            return stream_table(data, thead, checksums, cols, chunk, db_session)
 
-        if not res_count: return ({'msg': 'No objects found'}, error)
+        rendered = grid_rows.render(db_session, checksums, cols)
+        if not rendered: return ({'msg': 'No objects found'}, error)
 
-        data['html'] = html_output
+        data['html'] = ''.join([thead] + [rendered[checksum] for checksum in checksums if checksum in rendered] + ['</tbody>'])
         return (data, error)
 
     @staticmethod
@@ -203,10 +254,13 @@ class BerliniumGUIProvider:
 
         if not tids:
             searchables = []
-            for tid, cid, topic in db_session.query(model.Topic.tid, model.Topic.cid, model.Topic.topic).order_by(model.Topic.topic).all(): # FIXME assure there are checksums on such tid!
+            topics, sliders = work.get_facets(db_session)
+            entities = dict((entity['cid'], entity) for entity in work.hierarchy)
+
+            for tid, cid, topic in topics:
                 try:
-                    entity = [x for x in work.hierarchy if x['cid'] == cid][0]
-                except IndexError:
+                    entity = entities[cid]
+                except KeyError:
                     return (None, 'Schema and data do not match: different versions of code and database?')
 
                 if not entity.get('creates_topic'): continue # FIXME rewrite in SQL
@@ -238,33 +292,26 @@ class BerliniumGUIProvider:
                 })
 
             for entity in work.hierarchy:
-                if entity['has_slider']:
-                    cls, attr = entity['has_slider'].split('.')
-                    orm_inst = getattr(getattr(model, cls), attr)
-                    minimum, maximum = db_session.query(func.min(orm_inst), func.max(orm_inst)).one() # TODO: optimize
-                    if minimum is not None and maximum is not None:
-                        categs.append({
-                            'type': 'slider',
-                            'cid': entity['cid'],
-                            'category': str2html(entity['html'], False) if entity['html'] else entity['category'],
-                            'sort': entity.get('sort', 1000),
-                            'min': math.floor(minimum*100)//100,
-                            'max': math.ceil(maximum*100)//100
-                        })
+                if entity.get('has_slider') and entity['cid'] in sliders:
+                    minimum, maximum = sliders[entity['cid']]
+                    categs.append({
+                        'type': 'slider',
+                        'cid': entity['cid'],
+                        'category': str2html(entity['html'], False) if entity['html'] else entity['category'],
+                        'sort': entity.get('sort', 1000),
+                        'min': math.floor(minimum*100)//100,
+                        'max': math.ceil(maximum*100)//100
+                    })
 
             categs.sort(key=lambda x: x['sort'])
             categs = {'blocks': categs, 'cats': work.hierarchy_groups, 'searchables': searchables}
 
         else:
-            params = {}
-            baseq = 'SELECT DISTINCT t1.tid FROM tags t1 INNER JOIN tags t2 ON t1.checksum = t2.checksum AND t2.tid = :param1'
-            for n, list_item in enumerate(tids, start=1):
-                params["param" + str(n)] = list_item
-                if n > 1:
-                    baseq += ' INNER JOIN tags t%s ON t%s.checksum = t%s.checksum AND t%s.tid = :param%s' % ( (n+1), n, (n+1), (n+1), n ) # FIXME self-joins in ORM
-            current_engine = db_session.get_bind()
-            for item in current_engine.execute(text(baseq), **params).fetchall():
-                categs += list(item)
+            try:
+                tids = [int(x) for x in tids]
+            except (TypeError, ValueError):
+                return (None, 'Invalid request!')
+            categs = tag_index.get(db_session).cooccurring(tids)
 
         return (categs, None)
 
@@ -272,28 +319,17 @@ class BerliniumGUIProvider:
     def summary(req, client_id, db_session):
         if len(req['datahash']) > 100: return (None, 'Invalid request!')
 
-        step = -1
-        clauses = [model.Lattice.struct_id == model.Structure.struct_id, model.Structure.checksum == req['datahash']]
-
-        if step != -1:
-            clauses.append(model.Structure.step == step)
-        else:
-            clauses.append(model.Structure.final == True)
+        step = None # TODO
 
-        try:
-            struct_id, a11, a12, a13, a21, a22, a23, a31, a32, a33 = db_session.query(model.Lattice.struct_id, model.Lattice.a11, model.Lattice.a12, model.Lattice.a13, model.Lattice.a21, model.Lattice.a22, model.Lattice.a23, model.Lattice.a31, model.Lattice.a32, model.Lattice.a33).filter(and_(*clauses)).one()
-        except NoResultFound:
+        ase_obj = work.get_atoms(db_session, req['datahash'], step)
+        if ase_obj is None:
             return (None, 'Nothing found!')
 
-        symbols, positions, is_final = [], [], False # TODO
-        cell = [[a11, a12, a13], [a21, a22, a23], [a31, a32, a33]]
-        for number, charge, magmom, x, y, z in db_session.query(model.Atom.number, model.Atom.charge, model.Atom.magmom, model.Atom.x, model.Atom.y, model.Atom.z).filter(model.Atom.struct_id == struct_id).all():
-            symbols.append(number)
-            positions.append([x, y, z])
-        cif = generate_cif(Atoms(symbols=symbols, cell=cell, positions=positions, pbc=True)) # TODO
+        cif = generate_cif(ase_obj) # TODO
 
-        info = db_session.query(model.Grid.info).filter(model.Grid.checksum == req['datahash']).one()
-        info = json.loads(info[0])
+        info = grid_rows.get_info(db_session, req['datahash'])
+        if info is None:
+            return (None, 'Nothing found!')
 
         summary = []
 
@@ -357,7 +393,11 @@ class BerliniumGUIProvider:
 
 
 if __name__ == "__main__":
+    if Connection.Type == 'asyncio':
+        install_asyncio()
+
     Connection.GUIProvider = BerliniumGUIProvider
+    Connection.Coalesced = set(['tags', 'browse', 'summary', 'optstory', 'estory'])
     DuplexRouter = SockJSRouter(Connection)
 
     application = web.Application(
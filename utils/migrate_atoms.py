@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#
+# Converts the stored structures between the atoms storages:
+# one DB row per atom (atoms table) <-> one compressed row per structure (packed_atoms table)
+# NB set atoms_storage in settings accordingly for the further additions
+
+import time
+import argparse
+
+import chk_tilde_install
+
+from tilde.core.settings import settings, connect_database
+from tilde.core.common import pack_atoms
+from tilde.core.api import API
+import tilde.core.model as model
+
+
+parser = argparse.ArgumentParser(prog="[this_script]", usage="%(prog)s [optional arguments]")
+parser.add_argument("-d", dest="db", action="store", help="sqlite DB name (default %s)" % settings['db']['default_sqlite_db'], type=str, metavar="name", default=None)
+parser.add_argument("-u", dest="unpack", action="store_true", help="convert back to one row per atom", default=False)
+parser.add_argument("-b", dest="batch", action="store", help="structures per transaction (default 500)", type=int, metavar="N", default=500)
+args = parser.parse_args()
+
+starttime = time.time()
+settings['no_parse'] = True
+work = API(settings)
+session = connect_database(settings, named=args.db if settings['db']['engine'] == 'sqlite' else None)
+
+source = model.Packed_atoms if args.unpack else model.Atom
+
+converted = 0
+while True:
+    struct_ids = [i[0] for i in session.query(source.struct_id).distinct().limit(args.batch).all()]
+    if not struct_ids:
+        break
+
+    for struct_id, checksum, step in session.query(model.Structure.struct_id, model.Structure.checksum, model.Structure.step).filter(model.Structure.struct_id.in_(struct_ids)).all():
+        ase_obj = work.get_atoms(session, checksum, step)
+
+        if args.unpack:
+            charges = ase_obj.get_array('charges') if 'charges' in ase_obj.arrays else [None for j in range(len(ase_obj))]
+            magmoms = ase_obj.get_array('magmoms') if 'magmoms' in ase_obj.arrays else [None for j in range(len(ase_obj))]
+            session.execute(model.Atom.__table__.insert(), [
+                dict(struct_id=struct_id, number=int(i.number), x=i.x, y=i.y, z=i.z,
+                charge=None if charges[j] is None or charges[j] != charges[j] else float(charges[j]),
+                magmom=None if magmoms[j] is None or magmoms[j] != magmoms[j] else float(magmoms[j])) for j, i in enumerate(ase_obj)
+            ])
+        else:
+            session.execute(model.Packed_atoms.__table__.insert(), [dict(struct_id=struct_id, natom=len(ase_obj), content=pack_atoms(ase_obj))])
+
+        session.execute(model.delete(source).where(source.struct_id == struct_id))
+        converted += 1
+
+    session.commit()
+    print("Structures converted: %s" % converted)
+
+session.close()
+print("Done in %1.2f sc, total structures converted: %s" % (time.time() - starttime, converted))
+if settings['db']['engine'] == 'sqlite' and converted:
+    print("NB run VACUUM on the sqlite DB to reclaim the space")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# Fills the typed grid columns (grid_columns table) from the stored Grid.info of the existing calcs,
+# or drops them all with -r
+# NB set grid_columns in settings accordingly for the further additions
+
+import sys
+import time
+import argparse
+
+import ujson as json
+
+import chk_tilde_install
+
+from tilde.core.settings import settings, connect_database
+from tilde.core.api import API
+import tilde.core.model as model
+
+
+parser = argparse.ArgumentParser(prog="[this_script]", usage="%(prog)s [optional arguments]")
+parser.add_argument("-d", dest="db", action="store", help="sqlite DB name (default %s)" % settings['db']['default_sqlite_db'], type=str, metavar="name", default=None)
+parser.add_argument("-r", dest="remove", action="store_true", help="remove the typed grid columns", default=False)
+parser.add_argument("-b", dest="batch", action="store", help="calcs per transaction (default 1000)", type=int, metavar="N", default=1000)
+args = parser.parse_args()
+
+starttime = time.time()
+settings['no_parse'] = True
+work = API(settings)
+session = connect_database(settings, named=args.db if settings['db']['engine'] == 'sqlite' else None)
+
+if args.remove:
+    session.execute(model.delete(model.Grid_columns))
+    session.commit()
+    session.close()
+    print("Done in %1.2f sc" % (time.time() - starttime))
+    sys.exit(0)
+
+converted, skipped, last = 0, 0, ''
+while True:
+    batch = session.query(model.Grid.checksum, model.Grid.info) \
+    .outerjoin(model.Grid_columns, model.Grid_columns.checksum == model.Grid.checksum) \
+    .filter(model.Grid_columns.checksum == None, model.Grid.checksum > last) \
+    .order_by(model.Grid.checksum).limit(args.batch).all()
+    if not batch:
+        break
+
+    rows = []
+    for checksum, info in batch:
+        columns = work._get_grid_columns(json.loads(info))
+        if columns:
+            rows.append(dict(checksum=checksum, **columns))
+        else:
+            skipped += 1
+    if rows:
+        session.execute(model.Grid_columns.__table__.insert(), rows)
+
+    last = batch[-1][0]
+    converted += len(rows)
+    session.commit()
+    print("Calcs converted: %s" % converted)
+
+session.close()
+print("Done in %1.2f sc, total calcs converted: %s, skipped as not fitting the column types: %s" % (time.time() - starttime, converted, skipped))